@@ -0,0 +1,190 @@
+# typewriter_batch.py
+# Typesets text files into typewritten pages without the window: each file is laid out the way OPEN
+# lays out a text file (tab stops, the same ink and jitter), its lines wrapped at the right margin and
+# cut into pages the height of the paper, and every page is exported like EXPORT does. Files are spread
+# over a pool of worker processes, one per core, under the SDL dummy drivers.
+#
+#   python typewriter_batch.py manuscripts/ --out pages/                 # every .txt below manuscripts/
+#   python typewriter_batch.py "drafts/**/*.txt" --out pages/ --format pdf --jobs 8
+#   python typewriter_batch.py notes.txt --out pages/ --dpi 150 --lines 30
+
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import glob
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import typewriter_mvp as tm
+import pygame
+
+PAGE_LINES = tm.visible_rows - 1  # lines per page: a page exports exactly as tall as the paper on screen
+FORMATS = ("png", "svg", "pdf")
+
+_engine = None  # the worker process's typewriter, set up once by _init_worker
+
+
+def find_text_files(inputs):
+    """The .txt files named by inputs (files, directories searched recursively, or glob patterns),
+    sorted, each once."""
+    found = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, names in os.walk(item):
+                found.update(os.path.join(root, n) for n in names if n.lower().endswith(".txt"))
+        elif os.path.isfile(item):
+            found.add(item)
+        else:
+            found.update(p for p in glob.glob(item, recursive=True) if os.path.isfile(p))
+    return sorted(os.path.abspath(p) for p in found)
+
+
+def wrap_lines(lines, width):
+    """lines broken to at most width columns, at the last space that fits (the space itself is not
+    typed); a word longer than a line is split. Tabs are expanded to tab stops first."""
+    out = []
+    for line in lines:
+        if '\t' in line:
+            line = tm.expand_tabs(line, 0, sys.maxsize)
+        while len(line) > width:
+            cut = line.rfind(' ', 0, width + 1)
+            if cut <= 0:
+                out.append(line[:width])
+                line = line[width:]
+            else:
+                out.append(line[:cut])
+                line = line[cut + 1:]
+        out.append(line)
+    return out
+
+
+def iter_pages(source, width, page_lines):
+    """Lists of page_lines wrapped lines (the last one shorter) from a text stream. Blank lines at the
+    end of the text do not start a page of their own."""
+    page = []
+    for lines in tm.iter_text_lines(source):
+        for line in wrap_lines(lines, width):
+            page.append(line)
+            if len(page) == page_lines:
+                yield page
+                page = []
+    while page and not page[-1].strip():
+        page.pop()
+    if page:
+        yield page
+
+
+def _init_worker():
+    global _engine
+    pygame.init()
+    _engine = tm.TypewriterEngine(headless=True, audio=False)
+
+
+def typeset_page(engine, lines):
+    """A GlyphTable of lines typed from the top of a fresh page, as OPEN would type them."""
+    doc = engine.doc
+    doc.clear_glyphs()
+    doc.clear_stamps()
+    engine.bell_rung_rows = set()
+    engine.cursor_row, engine.cursor_col = 0, 0
+    engine.paper_scroll = 0
+    engine.typeset("\n".join(lines))
+    return doc.page_table()
+
+
+def render_file(path, name, out_path, page_lines, dpi, seed):
+    """Typeset one text file and export its pages; runs in a worker. Returns (pages, files written)."""
+    engine = _engine
+    # the ink of a file depends only on the seed and its name (path below the inputs), not on which
+    # worker got it
+    engine.rng = random.Random(f"{seed}:{name}")
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        pages = [typeset_page(engine, lines) for lines in iter_pages(f, engine.max_col + 1, page_lines)]
+    if not pages:
+        pages = [tm.GlyphTable()]  # an empty file is a blank page
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    kind = tm.export_format(out_path)
+    if kind == "pdf":
+        tm.export_pdf(pages, out_path, engine.char_width)
+        return len(pages), [out_path]
+    paths = tm.export_paths(out_path, len(pages))
+    fonts = tm.export_svg_fonts(out_path, pages) if kind == "svg" and len(pages) > 1 else None
+    for table, page_path in zip(pages, paths):
+        if kind == "svg":
+            tm.export_page_svg(table, page_path, engine.char_width, fonts=fonts)
+        else:
+            tm.export_page_png(table, page_path, engine.char_width, dpi)
+    if fonts:
+        paths += [os.path.join(os.path.dirname(out_path), name) for name in sorted(set(fonts.values()))]
+    return len(pages), paths
+
+
+def output_path(path, base, out_dir, kind):
+    """Where the pages of path go: its place below base, mirrored under out_dir, with kind's extension."""
+    stem = os.path.splitext(os.path.relpath(path, base))[0]
+    return os.path.join(out_dir, stem + "." + kind)
+
+
+def run_batch(files, out_dir, kind="png", jobs=None, page_lines=PAGE_LINES, dpi=tm.EXPORT_DPI, seed=1,
+              report=print):
+    """Render every file in a pool of jobs processes; report(line) gets a line per finished file.
+
+    Returns {"files", "pages", "failed", "seconds"}.
+    """
+    base = os.path.commonpath([os.path.dirname(p) for p in files]) if files else out_dir
+    jobs = jobs or os.cpu_count() or 1
+    done = pages = 0
+    failed = []
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as pool:
+        futures = {pool.submit(render_file, path, os.path.relpath(path, base), output_path(path, base, out_dir, kind),
+                               page_lines, dpi, seed): path for path in files}
+        for future in as_completed(futures):
+            path = futures[future]
+            done += 1
+            rel = os.path.relpath(path, base)
+            try:
+                n, _ = future.result()
+            except Exception as e:
+                failed.append(path)
+                report(f"[{done}/{len(files)}] {rel}: failed: {e}")
+                continue
+            pages += n
+            elapsed = time.perf_counter() - t0
+            report(f"[{done}/{len(files)}] {rel}: {n} page{'s' if n != 1 else ''}   "
+                   f"({pages} pages, {pages / elapsed:.1f} pages/s)")
+    return {"files": len(files), "pages": pages, "failed": failed, "seconds": time.perf_counter() - t0}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Typeset text files into typewritten page images.")
+    parser.add_argument("inputs", nargs="+", help=".txt files, directories (searched recursively) or glob patterns")
+    parser.add_argument("--out", required=True, help="output directory (the input folders are mirrored below it)")
+    parser.add_argument("--format", choices=FORMATS, default="png",
+                        help="png (one image per page), svg (one drawing per page) or pdf (one file per text)")
+    parser.add_argument("--dpi", type=int, default=tm.EXPORT_DPI, help=f"PNG resolution (default {tm.EXPORT_DPI})")
+    parser.add_argument("--lines", type=int, default=PAGE_LINES, help=f"lines per page (default {PAGE_LINES})")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--seed", type=int, default=1, help="ink seed; the same seed gives the same pages (default 1)")
+    args = parser.parse_args(argv)
+    if args.lines < 1 or args.dpi < 1 or (args.jobs is not None and args.jobs < 1):
+        parser.error("--lines, --dpi and --jobs must be positive")
+
+    files = find_text_files(args.inputs)
+    if not files:
+        print("No .txt files found")
+        return 1
+    print(f"Typesetting {len(files)} file{'s' if len(files) != 1 else ''} to {args.out} "
+          f"({args.format}, {args.jobs or os.cpu_count()} workers)")
+    result = run_batch(files, args.out, args.format, args.jobs, args.lines, args.dpi, args.seed)
+    print(f"Rendered {result['pages']} pages from {result['files'] - len(result['failed'])} files "
+          f"in {result['seconds']:.1f} s" + (f"; {len(result['failed'])} failed" if result['failed'] else ""))
+    return 1 if result["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+# typewriter_bench.py
+# Headless benchmarks for the typewriter's hot paths: frame drawing, keystroke latency, text I/O and
+# PNG / SVG / PDF export. Runs under the SDL dummy video/audio drivers and writes machine-readable JSON so builds
+# can be compared.
+#
+#   python typewriter_bench.py                       # full run, JSON to stdout
+#   python typewriter_bench.py --quick --out a.json  # smaller sizes / fewer repeats
+#   python typewriter_bench.py --compare a.json      # exit 1 if any median got slower than --tolerance
+
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import typewriter_mvp as tm
+import pygame
+
+DEFAULT_SIZES = "1K,10K,100K,1M,10M"
+QUICK_SIZES = "1K,100K"
+GLYPH_COUNTS = [0, 1000, 5000, 20000]
+QUICK_GLYPH_COUNTS = [0, 1000]
+DENSITIES = [1, 3]  # strikes per struck cell
+WORDS = ("the quick brown fox jumps over a lazy dog while keys clatter and "
+         "ink settles on the paper line after line").split()
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    scale = {"K": 1024, "M": 1024 ** 2}.get(text[-1:], 1)
+    return int(float(text.rstrip("KM")) * scale)
+
+
+def timed(fn, repeat):
+    """Run fn `repeat` times; return summary stats in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return summarize(samples)
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "n": len(samples),
+        "min_ms": round(samples[0], 4),
+        "median_ms": round(statistics.median(samples), 4),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+        "max_ms": round(samples[-1], 4),
+    }
+
+
+def make_text(size, cols, rng):
+    """Roughly `size` bytes of word-wrapped prose that fits the typewriter's line width."""
+    lines = []
+    total = 0
+    line = ""
+    while total < size:
+        word = rng.choice(WORDS)
+        if len(line) + len(word) + 1 >= cols:
+            lines.append(line)
+            total += len(line) + 1
+            line = ""
+        line = f"{line} {word}" if line else word
+    return "\n".join(lines)
+
+
+def new_engine(seed=1):
+    audio = bool(pygame.mixer.get_init())
+    return tm.TypewriterEngine(headless=True, audio=audio, seed=seed)
+
+
+def fill_document(engine, glyphs, density, rng):
+    """Put `glyphs` glyphs on the page, `density` stacked per cell, starting at the top of the paper."""
+    cells = glyphs // density if density else 0
+    cols = engine.cols_per_line - 2
+    for i in range(cells):
+        row, col = divmod(i, cols)
+        ch = chr(rng.randint(33, 126))
+        for _ in range(density):
+            engine.doc.add_glyph(tm.Glyph(ch, row, col, rng.uniform(-0.5, 0.5), rng.uniform(-0.5, 0.5),
+                                          rng.uniform(0.6, 1.0)))
+    engine.paper.reset()
+
+
+# ---------- benchmarks ----------
+def bench_draw(counts, repeat):
+    """Frame time of draw() by glyph count and overstrike density, for several kinds of frame."""
+    results = []
+    for density in DENSITIES:
+        for count in counts:
+            rng = random.Random(count * 31 + density)
+            engine = new_engine()
+            fill_document(engine, count, density, rng)
+            engine.draw()
+
+            def cold():
+                # nothing cached on screen, in the composed paper or in the row strips
+                engine.full_redraw = True
+                engine.paper.reset()
+                engine.draw()
+                engine.dirty_rects.clear()
+
+            def slide():
+                # carriage moving: paper band redrawn, composed paper reused
+                engine.view_offset_px += 1 if engine.view_offset_px < 0 else -1
+                engine.draw()
+                engine.dirty_rects.clear()
+
+            def feed():
+                # vertical feed in flight: visible rows re-composed every frame
+                engine.paper_scroll_offset_px = -((engine.paper_scroll_offset_px - 1) % tm.LINE_HEIGHT)
+                engine.draw()
+                engine.dirty_rects.clear()
+
+            def idle():
+                engine.draw()
+                engine.dirty_rects.clear()
+
+            for name, fn in (("cold", cold), ("slide", slide), ("feed", feed), ("idle", idle)):
+                results.append({"glyphs": count, "density": density, "frame": name, **timed(fn, repeat)})
+    return results
+
+
+def bench_keystrokes(count):
+    """Latency of the KEYDOWN/KEYUP path: until the struck glyph is drawn, and until the carriage settles."""
+    rng = random.Random(7)
+    engine = new_engine()
+    engine.draw()
+    down_ms, up_ms = [], []
+    for i in range(count):
+        if i % 50 == 49:
+            key, uni = pygame.K_RETURN, '\r'
+        else:
+            uni = rng.choice("abcdefghijklmnopqrstuvwxyz ,.")
+            key = ord(uni)
+        t0 = time.perf_counter()
+        engine.handle_event(pygame.event.Event(pygame.KEYDOWN, key=key, unicode=uni, mod=0))
+        engine.draw()
+        t1 = time.perf_counter()
+        engine.handle_event(pygame.event.Event(pygame.KEYUP, key=key, unicode=uni, mod=0))
+        engine.settle()
+        engine.draw()
+        t2 = time.perf_counter()
+        engine.dirty_rects.clear()
+        down_ms.append((t1 - t0) * 1000.0)
+        up_ms.append((t2 - t1) * 1000.0)
+    return {"keydown_to_glyph": summarize(down_ms), "keyup_to_settled": summarize(up_ms)}
+
+
+def bench_text_io(sizes):
+    """Throughput of load_text_into_glyphs and build_text_from_stamps by document size, and the time to
+    save the result as a native document and reopen it (open + first frame, rows decoded lazily)."""
+    results = []
+    new_engine().load_text_into_glyphs("warm up\n")  # one-off setup (numpy import, tables) is not throughput
+    for size in sizes:
+        engine = new_engine()
+        text = make_text(size, engine.cols_per_line, random.Random(size))
+        nbytes = len(text.encode("utf-8"))
+
+        t0 = time.perf_counter()
+        engine.load_text_into_glyphs(text)  # typesets the text, stamps included
+        load_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        out = engine.build_text_from_stamps()
+        build_s = time.perf_counter() - t0
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "doc" + tm.NATIVE_EXT)
+            t0 = time.perf_counter()
+            engine.save_native(path)
+            save_s = time.perf_counter() - t0
+            reopened = new_engine()
+            t0 = time.perf_counter()
+            reopened.load_native(path)
+            reopened.draw()
+            open_s = time.perf_counter() - t0
+            del reopened  # drop the mapping before the directory goes
+
+        results.append({
+            "bytes": nbytes,
+            "load_ms": round(load_s * 1000.0, 3),
+            "load_mb_s": round(nbytes / 1e6 / max(load_s, 1e-9), 3),
+            "build_ms": round(build_s * 1000.0, 3),
+            "build_mb_s": round(len(out) / 1e6 / max(build_s, 1e-9), 3),
+            "native_save_ms": round(save_s * 1000.0, 3),
+            "native_open_ms": round(open_s * 1000.0, 3),
+        })
+    return results
+
+
+def bench_export(repeat):
+    """Export without the file dialog: the visible page at screen resolution, a full page at EXPORT_DPI
+    through the banded encoder that action_export runs on its worker thread, and the same page as SVG / PDF."""
+    engine = new_engine()
+    fill_document(engine, tm.visible_rows * (engine.cols_per_line - 2), 1, random.Random(3))
+    surf = engine.render_visible_page()
+    page = tm.GlyphTable.from_glyphs(engine.doc.iter_glyphs())
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "page.png")
+        return {
+            "render": timed(engine.render_visible_page, repeat),
+            "encode_png": timed(lambda: pygame.image.save(surf, path), max(1, repeat // 4)),
+            "page_at_dpi": timed(lambda: tm.export_page_png(page, path, engine.char_width), max(1, repeat // 20)),
+            "page_svg": timed(lambda: tm.export_page_svg(page, os.path.join(tmp, "page.svg"), engine.char_width), repeat),
+            "page_pdf": timed(lambda: tm.export_pdf([page], os.path.join(tmp, "page.pdf"), engine.char_width), repeat),
+        }
+
+
+# ---------- reporting ----------
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=tm.BASE_DIR,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "sdl": ".".join(map(str, pygame.get_sdl_version())),
+        "platform": platform.platform(),
+        "video_driver": os.environ.get("SDL_VIDEODRIVER"),
+        "audio": bool(pygame.mixer.get_init()),
+    }
+
+
+def flatten(report):
+    """Map every timing in a report to a stable key, e.g. 'draw/glyphs=1000/density=1/cold' -> ms."""
+    flat = {}
+    res = report["results"]
+    for r in res.get("draw", []):
+        flat[f"draw/glyphs={r['glyphs']}/density={r['density']}/{r['frame']}"] = r["median_ms"]
+    for name, stats in res.get("keystrokes", {}).items():
+        flat[f"keystrokes/{name}"] = stats["median_ms"]
+    for r in res.get("text_io", []):
+        flat[f"text_io/bytes~{r['bytes'] // 1024}K/load"] = r["load_ms"]
+        flat[f"text_io/bytes~{r['bytes'] // 1024}K/build"] = r["build_ms"]
+        for key in ("native_save", "native_open"):
+            if key + "_ms" in r:
+                flat[f"text_io/bytes~{r['bytes'] // 1024}K/{key}"] = r[key + "_ms"]
+    # reports from before SVG / PDF were timed call the export group export_png
+    for name, stats in res.get("export", res.get("export_png", {})).items():
+        flat[f"export/{name}"] = stats["median_ms"]
+    return flat
+
+
+def compare(old, new, tolerance, floor_ms=0.05):
+    """Return (key, old_ms, new_ms) for every timing that got slower by more than tolerance."""
+    old_flat, new_flat = flatten(old), flatten(new)
+    regressions = []
+    for key, new_ms in new_flat.items():
+        old_ms = old_flat.get(key)
+        if old_ms is None:
+            continue
+        if new_ms > old_ms * (1 + tolerance) and new_ms - old_ms > floor_ms:
+            regressions.append((key, old_ms, new_ms))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless typewriter benchmarks (JSON output).")
+    parser.add_argument("--quick", action="store_true", help="smaller documents and fewer repeats")
+    parser.add_argument("--sizes", help=f"document sizes for text I/O (default {DEFAULT_SIZES})")
+    parser.add_argument("--repeat", type=int, help="samples per frame measurement")
+    parser.add_argument("--keys", type=int, help="keystrokes to time")
+    parser.add_argument("--only", help="comma list of: draw,keystrokes,text_io,export (export_png is an alias)")
+    parser.add_argument("--out", help="write JSON here instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    pygame.init()
+    try:
+        pygame.mixer.init()
+    except Exception:
+        pass
+
+    sizes = [parse_size(s) for s in (args.sizes or (QUICK_SIZES if args.quick else DEFAULT_SIZES)).split(",")]
+    repeat = args.repeat or (20 if args.quick else 100)
+    keys = args.keys or (200 if args.quick else 1000)
+    only = set(args.only.split(",")) if args.only else {"draw", "keystrokes", "text_io", "export"}
+    if "export_png" in only:
+        only.add("export")
+
+    results = {}
+    if "draw" in only:
+        results["draw"] = bench_draw(QUICK_GLYPH_COUNTS if args.quick else GLYPH_COUNTS, repeat)
+    if "keystrokes" in only:
+        results["keystrokes"] = bench_keystrokes(keys)
+    if "text_io" in only:
+        results["text_io"] = bench_text_io(sizes)
+    if "export" in only:
+        results["export"] = bench_export(repeat)
+    report = {"meta": metadata(), "results": results}
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    status = 0
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.tolerance)
+        for key, old_ms, new_ms in regressions:
+            print(f"REGRESSION {key}: {old_ms:.3f} ms -> {new_ms:.3f} ms", file=sys.stderr)
+        status = 1 if regressions else 0
+    pygame.quit()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
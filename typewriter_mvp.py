@@ -1,97 +1,87 @@
 # typewriter_mvp_blocky_keydown_draw_keyup_move.py
 # Printable characters are drawn & struck on KEYDOWN; horizontal blocky page move and column advance occur on KEYUP.
+#
+# Importing this module has no side effects: nothing is initialised, opened or synthesized until a
+# TypewriterEngine is built (or main() runs), so the engine can be driven headless for batch
+# rendering and automated testing.
+
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
 
 import pygame
+import argparse
+import asyncio
+import base64
+import bisect
+import io
+import itertools
+import csv
+import fnmatch
+import hashlib
+import heapq
+import json
+import platform
+import math
+import mmap
+import time
+from array import array
 import random
+import struct
 import sys
-import os
-import tkinter as tk
-from tkinter import filedialog
-
-# optional numpy sound synth fallback
-try:
-    import numpy as np
-
-    HAS_NUMPY = True
-except Exception:
-    HAS_NUMPY = False
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict, deque
+from urllib.parse import quote
 
-pygame.init()
 try:
-    pygame.mixer.init()
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 except Exception:
-    pass
-
-pygame.key.set_repeat(0)
+    BASE_DIR = os.getcwd()
 
 # ---------- window / paper constants ----------
 W, H = 1000, 780
-screen = pygame.display.set_mode((W, H))
-pygame.display.set_caption("Typewriter — Draw on KeyDown, Move on KeyUp")
-clock = pygame.time.Clock()
 
 # paper area (leave room for command bar at bottom)
 PAPER_X, PAPER_Y = 60, 40
 PAPER_W, PAPER_H = W - 2 * PAPER_X, H - 140
 PAPER_COLOR = (245, 241, 232)
+BG_COLOR = (30, 30, 30)
 
 FONT_NAME = "typo-writer/TypoWriter Light Demo.otf"
 FONT_SIZE = 18
-font = pygame.font.Font(FONT_NAME, FONT_SIZE)#font = pygame.font.SysFont(FONT_NAME, FONT_SIZE, bold=False)
+
+# typefaces F7 cycles through (label, font file); FONT_NAME is the one the typewriter starts with
+TYPEFACES = [
+    ("Light", "typo-writer/TypoWriter Light Demo.otf"),
+    ("Light Italic", "typo-writer/TypoWriter Light Italic Demo.otf"),
+    ("Thin", "typo-writer/TypoWriter Thin Demo.otf"),
+    ("Thin Italic", "typo-writer/TypoWriter Thin Italic Demo.otf"),
+    ("Regular", "typo-writer/TypoWriter Regular Demo.otf"),
+    ("Italic", "typo-writer/TypoWriter Italic Demo.otf"),
+    ("Bold", "typo-writer/TypoWriter Bold Demo.otf"),
+    ("Bold Italic", "typo-writer/TypoWriter Bold Italic Demo.otf"),
+    ("Distressed", "typo-writer/TypoWriter Distressed Demo.otf"),
+    ("Shaky", "typo-writer/TypoWriter_Shaky_Demo.otf"),
+]
+TYPE_SIZES = (14, 16, 18, 20, 22)  # sizes F8 cycles through; the character pitch stays FONT_SIZE's
 
 LINE_HEIGHT = int(FONT_SIZE * 1.6)
-CHAR_WIDTH = font.size("M")[0]
 
 LEFT_MARGIN = 20
 # carriage will be displayed in the center of the paper area:
 CARRIAGE_DISPLAY_X = PAPER_X + PAPER_W // 2
 
-cols_per_line = max(10, (PAPER_W - LEFT_MARGIN - 40) // CHAR_WIDTH) + 2
 visible_rows = PAPER_H // LINE_HEIGHT
-MAX_COL = cols_per_line - 1
-OFF_COL = MAX_COL + 1
 
 TAB_SIZE = 4 # how many spaces for a tab if you want to expand tabs (optional, we map tabs -> single space for simplicity)
 TOP_MARGIN_LINES = 1    # number of blank lines at top before the cursor starts (1 => second line)
 
-# ---------- runtime state ----------
-cursor_col = 0  # logical column index
-cursor_row = TOP_MARGIN_LINES  # absolute row index
-paper_scroll = 0  # how many rows scrolled off top
-paper_scroll_offset_px = 0.0  # during vertical animation
-
-# view_offset_px represents the paper's horizontal translation: paper is drawn at PAPER_X + view_offset_px
-view_offset_px = 0.0
-
-glyphs = []  # on-screen glyph objects (can be removed in editor mode)
-stamp_history = []  # append every struck glyph here; used for saving/exporting text
-
-# pages history
-saved_pages = []
-
-# UI state
-key_locked = False
-locked_key = None
-locked_char_display = ""
-pending_keydown = None  # store the pygame.Event for the keydown that is pending (strike on KEYDOWN, move on KEYUP)
-animating = False
-animation_cancel = False
-
-# bell state (once per row)
-bell_rung_rows = set()
-
-# edit/authentic mode
-authentic_mode = True
-
 # volumes
 KEY_VOL = 0.7
 BELL_VOL = 0.9
 THUNK_VOL = 0.9
 
-# small UI font
-ui_font = pygame.font.SysFont(FONT_NAME, 16)
-
-
 # modifier keys that should NOT lock (so Shift works)
 MODIFIER_KEYS = {
     pygame.K_LSHIFT, pygame.K_RSHIFT,
@@ -102,865 +92,5160 @@ MODIFIER_KEYS = {
 }
 MODIFIER_KEYS = {k for k in MODIFIER_KEYS if k is not None}
 
-# ---------- sound setup ----------
-strike_sound = None
-try:
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-except Exception:
-    base_dir = os.getcwd()
-strike_path = os.path.join(base_dir, "typewriter_click.wav")
-if os.path.isfile(strike_path):
-    try:
-        strike_sound = pygame.mixer.Sound(strike_path)
-    except Exception as e:
-        print("Failed to load typewriter_click.wav:", e)
-        strike_sound = None
+# ---------- command bar ----------
+COMMAND_BAR_H = 96
+COMMAND_BAR_Y = H - COMMAND_BAR_H
 
+buttons = [
+    {"label": "CLEAR", "id": "clear"},
+    {"label": "NEW PAGE", "id": "new_page"},
+    {"label": "SAVE AS...", "id": "save_as"},
+    {"label": "OPEN...", "id": "open"},
+    {"label": "EXPORT...", "id": "export"},
+    {"label": "TOGGLE EDIT MODE", "id": "toggle_edit"},
+    {"label": "QUIT", "id": "quit"}
+]
 
-def _make_click_sound():
-    if not HAS_NUMPY:
-        return None
-    sr = 22050
-    length = int(0.02 * sr)
-    noise = np.random.uniform(-1, 1, length)
-    env = np.linspace(1.0, 0.0, length)
-    data = (noise * env * 0.3 * (2 ** 15 - 1)).astype(np.int16)
-    stereo = np.column_stack([data, data])
-    try:
-        return pygame.sndarray.make_sound(stereo)
-    except Exception:
-        return None
 
+def resolve_asset(path):
+    """Asset paths are relative to this file, not to the current directory."""
+    return path if os.path.isabs(path) else os.path.join(BASE_DIR, path)
 
-def _make_bell_sound():
-    if not HAS_NUMPY:
-        return None
-    sr = 22050
-    t = np.linspace(0, 0.14, int(0.14 * sr))
-    freq = 1500.0
-    tone = 0.6 * np.sin(2 * np.pi * freq * t) * np.exp(-8 * t)
-    data = (tone * (2 ** 15 - 1)).astype(np.int16)
-    stereo = np.column_stack([data, data])
+
+# pygame < 2.1.3 only has the older names
+_image_tobytes = getattr(pygame.image, "tobytes", None) or pygame.image.tostring
+_image_frombytes = getattr(pygame.image, "frombytes", None) or pygame.image.fromstring
+
+_font_lock = threading.Lock()  # FreeType faces are opened from worker threads too (typeball warm-up, export)
+
+
+def load_font(name=FONT_NAME, size=FONT_SIZE):
+    with _font_lock:
+        pygame.font.init()
+        return pygame.font.Font(resolve_asset(name), size)#font = pygame.font.SysFont(FONT_NAME, FONT_SIZE, bold=False)
+
+
+def grid_for_char_width(char_width):
+    """Columns per line for a given character pitch; returns (cols_per_line, MAX_COL, OFF_COL)."""
+    cols_per_line = max(10, (PAPER_W - LEFT_MARGIN - 40) // char_width) + 2
+    return cols_per_line, cols_per_line - 1, cols_per_line
+
+
+# ---------- typeballs ----------
+# A typeball is a typeface at a size. Every glyph keeps the ball it was struck with as a face id, an
+# index into TYPEBALLS, so swapping the ball mid-page only changes what is typed from then on. Face ids
+# are only meaningful within one run: .twd files and the autosave journal store the (font, size) pairs
+# and map them back to ids with typeball_id() when they are read.
+TYPEBALLS = [(FONT_NAME, FONT_SIZE)]  # face id -> (font file, size); only ever appended to
+MAX_TYPEBALLS = 256  # face ids are stored in one byte
+MAX_TYPEBALL_NAME = 255  # bytes of a font file name in UTF-8; the journal stores its length in one byte
+_typeball_lock = threading.Lock()  # balls are registered by the main loop and by file-loading threads
+
+
+def typeball_id(name, size):
+    """The face id of a typeball, registering it on first use."""
+    key = (name, int(size))
+    if len(name.encode("utf-8")) > MAX_TYPEBALL_NAME:
+        raise ValueError(f"typeball font file name longer than {MAX_TYPEBALL_NAME} bytes: {name!r}")
+    with _typeball_lock:
+        try:
+            return TYPEBALLS.index(key)
+        except ValueError:
+            if len(TYPEBALLS) >= MAX_TYPEBALLS:
+                raise ValueError(f"more than {MAX_TYPEBALLS} typeballs") from None
+            face = len(TYPEBALLS)
+            TYPEBALLS.append(key)
+            return face
+
+
+def typeball_remap(balls):
+    """bytes.translate table from the face ids of a file or stream typed with balls (its TYPEBALLS) to
+    this run's; None when they are the same, as for a file typed in the same balls in the same order."""
+    faces = [typeball_id(name, size) for name, size in balls]
+    return None if faces == list(range(len(faces))) else bytes(faces + [0] * (256 - len(faces)))
+
+
+def typeball_file(face):
+    """The font file a ball is drawn with; a document typed with a ball this typewriter does not have
+    is drawn with the default one."""
+    name = TYPEBALLS[face][0]
+    return name if os.path.exists(resolve_asset(name)) else FONT_NAME
+
+
+def typeball_label(face):
+    name, size = TYPEBALLS[face]
+    label = next((label for label, path in TYPEFACES if path == name), os.path.splitext(os.path.basename(name))[0])
+    return f"{label} {size}pt"
+
+
+# ---------- glyph & stamp records ----------
+class Glyph:
+    """One piece of ink on the page. Slotted: a long session holds hundreds of thousands of these."""
+    __slots__ = ('char', 'row', 'col', 'offset_x', 'offset_y', 'darkness', 'pending', 'face')
+
+    def __init__(self, char, row, col, offset_x=0, offset_y=0, darkness=1.0, pending=False, face=0):
+        self.char = char
+        self.row = row
+        self.col = col
+        self.offset_x = offset_x
+        self.offset_y = offset_y
+        self.darkness = darkness
+        self.pending = pending
+        self.face = face  # typeball (see TYPEBALLS)
+
+
+class Stamp:
+    """A permanent record of one key strike, kept for saving even if the glyph is later removed."""
+    __slots__ = ('char', 'row', 'col')
+
+    def __init__(self, char, row, col):
+        self.char = char
+        self.row = row
+        self.col = col
+
+
+def copy_column(column, typecode):
+    """An array holding a copy of a column (array or memoryview over the same item type)."""
+    a = array(typecode)
+    a.frombytes(memoryview(column).cast('B'))
+    return a
+
+
+class GlyphTable:
+    """Column-oriented, array-backed storage for the glyphs of a finished page.
+
+    About 20 bytes per glyph instead of a Python object each; iterating yields fresh Glyph records.
+    Tables are built from Document.iter_glyphs() and so are in row order.
+    """
+    __slots__ = ('chars', 'rows', 'cols', 'offset_x', 'offset_y', 'darkness', 'faces')
+
+    def __init__(self):
+        self.chars = array('I')  # code points
+        self.rows = array('i')
+        self.cols = array('H')
+        self.offset_x = array('f')
+        self.offset_y = array('f')
+        self.darkness = array('f')
+        self.faces = array('B')
+
+    @classmethod
+    def from_glyphs(cls, glyphs):
+        table = cls()
+        for g in glyphs:
+            table.append(g)
+        return table
+
+    @classmethod
+    def from_columns(cls, columns):
+        """A table over existing columns (arrays or read-only memoryviews), keyed by slot name."""
+        table = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(table, name, columns[name])
+        return table
+
+    def append(self, g):
+        self.chars.append(ord(g.char))
+        self.rows.append(g.row)
+        self.cols.append(g.col)
+        self.offset_x.append(g.offset_x)
+        self.offset_y.append(g.offset_y)
+        self.darkness.append(g.darkness)
+        self.faces.append(g.face)
+
+    def extend_from(self, other, start, end):
+        """Append other's glyphs start:end."""
+        for name in self.__slots__:
+            getattr(self, name).frombytes(memoryview(getattr(other, name))[start:end].cast('B'))
+
+    def __len__(self):
+        return len(self.chars)
+
+    def copy(self):
+        """A table with its own arrays, e.g. to keep a page of a memory-mapped file once it is closed."""
+        return GlyphTable.from_columns({name: copy_column(getattr(self, name), typecode)
+                                        for name, typecode in GLYPH_TABLE_COLUMNS})
+
+    @property
+    def is_mapped(self):
+        return isinstance(self.chars, memoryview)
+
+    @property
+    def max_row(self):
+        return self.rows[-1] if self.rows else -1
+
+    def index_range(self, first_row, last_row):
+        """Indices of the glyphs on rows first_row..last_row."""
+        return range(bisect.bisect_left(self.rows, first_row), bisect.bisect_right(self.rows, last_row))
+
+    def glyph(self, i, row=None):
+        """The i-th glyph as a Glyph record (row, when the caller knows it, saves a lookup)."""
+        return Glyph(chr(self.chars[i]), self.rows[i] if row is None else row, self.cols[i],
+                     self.offset_x[i], self.offset_y[i], self.darkness[i], face=self.faces[i])
+
+    def __iter__(self):
+        for ch, r, c, ox, oy, d, f in zip(self.chars, self.rows, self.cols,
+                                          self.offset_x, self.offset_y, self.darkness, self.faces):
+            yield Glyph(chr(ch), r, c, ox, oy, d, face=f)
+
+
+# ---------- saved page store ----------
+# Finished pages are written zlib-compressed to an anonymous spill file as soon as they are saved, and
+# only the last few pages read are kept decoded, so memory stays flat however many pages a session
+# produces. Pages of an opened native document are views into the mapped file and are kept as they are.
+PAGE_CACHE_SIZE = 4
+PAGE_STORE_DIR = None  # spill file location; None = the system temp directory
+PAGE_STORE_LEVEL = 1  # zlib level: pages are written on NEW PAGE, keep it quick
+
+
+class SpilledPage:
+    """Where a saved page's compressed columns are in the spill file."""
+    __slots__ = ('offset', 'length', 'glyphs')
+
+    def __init__(self, offset, length, glyphs):
+        self.offset = offset
+        self.length = length
+        self.glyphs = glyphs
+
+
+class PageStore:
+    """The saved pages of a session: a list-like sequence of GlyphTables that grows at the end.
+
+    Safe to read from worker threads (export, autosave) while the main loop appends. Undo can take
+    pages off the end and put them back (pop/push); the spill file itself is only ever appended to,
+    so an entry stays readable after it is popped.
+    """
+
+    def __init__(self, tables=(), cache_size=PAGE_CACHE_SIZE):
+        self.entries = []  # per page: a SpilledPage, or a mapped GlyphTable
+        self.cache = OrderedDict()  # SpilledPage -> decoded GlyphTable
+        self.cache_size = cache_size
+        self.file = None
+        self.lock = threading.Lock()
+        for table in tables:
+            self.append(table)
+
+    def append(self, table):
+        if table.is_mapped:
+            with self.lock:
+                self.entries.append(table)
+            return
+        blob = zlib.compress(b"".join(getattr(table, name).tobytes() for name, _ in GLYPH_TABLE_COLUMNS),
+                             PAGE_STORE_LEVEL)
+        with self.lock:
+            if self.file is None:
+                self.file = tempfile.TemporaryFile(prefix="typewriter-pages-", dir=PAGE_STORE_DIR)
+            self.file.seek(0, os.SEEK_END)
+            offset = self.file.tell()
+            self.file.write(blob)
+            self.entries.append(SpilledPage(offset, len(blob), len(table)))
+
+    def pop(self):
+        """Take the last page off; returns its entry, which push() accepts back."""
+        with self.lock:
+            return self.entries.pop()
+
+    def push(self, entry):
+        with self.lock:
+            self.entries.append(entry)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __bool__(self):
+        return bool(self.entries)
+
+    def __getitem__(self, index):
+        with self.lock:
+            entry = self.entries[index]
+        return self.load(entry)
+
+    def load(self, entry):
+        """The GlyphTable of an entry."""
+        if isinstance(entry, GlyphTable):
+            return entry
+        with self.lock:
+            table = self.cache.get(entry)
+            if table is not None:
+                self.cache.move_to_end(entry)
+                return table
+            n = entry.glyphs
+            self.file.seek(entry.offset)
+            blob = self.file.read(entry.length)
+        data = memoryview(zlib.decompress(blob))
+        columns, pos = {}, 0
+        for name, typecode in GLYPH_TABLE_COLUMNS:
+            a = array(typecode)
+            a.frombytes(data[pos:pos + n * a.itemsize])
+            columns[name] = a
+            pos += n * a.itemsize
+        table = GlyphTable.from_columns(columns)
+        with self.lock:
+            self.cache[entry] = table
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return table
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def view(self, extra=()):
+        """The pages stored so far followed by `extra` tables, as a sequence that reads pages lazily."""
+        with self.lock:
+            return PageView(self, tuple(self.entries), list(extra))
+
+
+class PageView:
+    __slots__ = ('store', 'entries', 'extra')
+
+    def __init__(self, store, entries, extra):
+        self.store = store
+        self.entries = entries
+        self.extra = extra
+
+    def __len__(self):
+        return len(self.entries) + len(self.extra)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        stored = len(self.entries)
+        return self.store.load(self.entries[index]) if index < stored else self.extra[index - stored]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+# ---------- document model ----------
+STAMP_HISTORY_LIMIT = 4096
+OVERSTRUCK = '□'  # how a cell struck more than once reads as text
+
+
+def cells_line(cells, cols_per_line):
+    """A row of text from (col, char, strikes) cells, by the stamp_line rule: no strikes => space,
+    one => the char, more => '□'."""
+    line = [' '] * cols_per_line
+    width = 0
+    for c, ch, n in cells:
+        if 0 <= c < cols_per_line:
+            line[c] = ch if n == 1 else OVERSTRUCK
+            if c >= width:
+                width = c + 1
+    return "".join(line[:width]).rstrip()
+
+
+def table_cells(table, start, end):
+    """The (col, char, strikes) cells of a GlyphTable's glyphs start:end (one row)."""
+    cells = {}
+    for c, ch in zip(table.cols[start:end], table.chars[start:end]):
+        cell = cells.get(c)
+        if cell is None:
+            cells[c] = [ch, 1]
+        else:
+            cell[1] += 1
+    return ((c, chr(ch), n) for c, (ch, n) in cells.items())
+
+
+class Document:
+    """The ink of the current page.
+
+    On-screen glyph objects (can be removed in editor mode) are indexed by row then column; each cell
+    holds its glyphs in strike order so overstrikes stack the way they were typed. Every struck glyph
+    is also a permanent stamp, used for saving/exporting text: stamp_cells is kept up to date as keys
+    are struck, stamp_history only holds the strikes since the last compaction. Removing a glyph in
+    editor mode leaves its stamp; only an editor-mode undo (set_stamp) or restoring a snapshot takes
+    stamps back.
+
+    A page opened from a native document is attached as a GlyphTable, and its stamps as columns; their
+    rows are only decoded into glyph_rows / stamp_cells the first time something reads or changes them.
+    """
+
+    def __init__(self, cols_per_line):
+        self.cols_per_line = cols_per_line
+        self.glyph_rows = {}  # row -> {col -> [glyph, ...]}
+        self.max_glyph_row = -1  # highest row holding any glyph
+        self.lazy_table = None  # GlyphTable still backing the rows in lazy_rows
+        self.lazy_rows = {}  # row -> (start, end) glyph indices in lazy_table, not decoded yet
+        self.lazy_row_count = 0  # rows lazy_table was attached with
+        self.pending_glyph = None  # glyph struck on KEYDOWN, finalized on KEYUP
+        self.stamp_cells = {}  # row -> {col -> [first_char, strikes]}
+        self.stamp_max_row = -1
+        self.lazy_stamps = None  # stamp columns still backing the rows in lazy_stamp_rows
+        self.lazy_stamp_rows = {}  # row -> (start, end) in lazy_stamps, not decoded yet
+        self.stamp_history = []  # recent Stamp records, folded away by compact_stamp_history()
+        self.journal = None  # SessionJournal receiving every change, when autosave is on
+        # what changed since History last looked (see take_changes)
+        self.changed_rows = set()
+        self.changed_stamp_rows = set()
+        self.rows_replaced = self.stamps_replaced = True
+
+    def take_changes(self):
+        """(rows, stamp rows) changed since the last call; None in place of a set when all of them were replaced."""
+        rows = None if self.rows_replaced else self.changed_rows
+        stamp_rows = None if self.stamps_replaced else self.changed_stamp_rows
+        self.changed_rows, self.changed_stamp_rows = set(), set()
+        self.rows_replaced = self.stamps_replaced = False
+        return rows, stamp_rows
+
+    @property
+    def has_changes(self):
+        return bool(self.rows_replaced or self.stamps_replaced or self.changed_rows or self.changed_stamp_rows)
+
+    # glyph cell index
+    def attach_table(self, table, row_ids, row_starts):
+        """Back the (cleared) page with a table; row_starts[i]:row_starts[i + 1] are row_ids[i]'s glyphs."""
+        self.rows_replaced = True
+        self.lazy_table = table
+        self.lazy_rows = {row: (row_starts[i], row_starts[i + 1]) for i, row in enumerate(row_ids)}
+        self.lazy_row_count = len(self.lazy_rows)
+        self.max_glyph_row = max(self.lazy_rows, default=-1)
+
+    def _decode_row(self, row):
+        span = self.lazy_rows.pop(row, None)
+        if span is None:
+            return
+        t = self.lazy_table
+        cells = self.glyph_rows.setdefault(row, {})
+        for i in range(*span):
+            col = t.cols[i]
+            cells.setdefault(col, []).append(t.glyph(i, row))
+        if not self.lazy_rows:
+            self.lazy_table = None
+
+    def has_row(self, row):
+        return row in self.glyph_rows or row in self.lazy_rows
+
+    @property
+    def is_empty(self):
+        return not (self.glyph_rows or self.lazy_rows)
+
+    def add_glyph(self, g):
+        self.changed_rows.add(g.row)
+        if self.lazy_rows:
+            self._decode_row(g.row)
+        self.glyph_rows.setdefault(g.row, {}).setdefault(g.col, []).append(g)
+        if g.row > self.max_glyph_row:
+            self.max_glyph_row = g.row
+        if self.journal is not None:
+            self.journal.record((J_GLYPH, g.char, g.row, g.col, g.offset_x, g.offset_y, g.darkness, g.face))
+
+    def remove_cell(self, row, col):
+        """Remove every glyph at (row, col); returns the removed glyphs."""
+        if self.journal is not None:
+            self.journal.record((J_REMOVE, row, col))
+        self.changed_rows.add(row)
+        if self.lazy_rows:
+            self._decode_row(row)
+        cells = self.glyph_rows.get(row)
+        if not cells:
+            return []
+        removed = cells.pop(col, [])
+        if not cells:
+            del self.glyph_rows[row]
+            if row == self.max_glyph_row:
+                self.max_glyph_row = max(max(self.glyph_rows, default=-1), max(self.lazy_rows, default=-1))
+        return removed
+
+    def clear_glyphs(self):
+        if self.journal is not None:
+            self.journal.record((J_CLEAR,))
+        self.rows_replaced = True
+        self.glyph_rows.clear()
+        self.lazy_rows = {}
+        self.lazy_table = None
+        self.max_glyph_row = -1
+        self.pending_glyph = None
+
+    def page_table(self):
+        """The page as a GlyphTable: the attached table itself while none of its rows has been touched,
+        otherwise a new table with the rows not decoded yet copied straight from it."""
+        lazy = self.lazy_table
+        if lazy is None:
+            return GlyphTable.from_glyphs(self.iter_glyphs())
+        if not self.glyph_rows and len(self.lazy_rows) == self.lazy_row_count:
+            return lazy
+        table = GlyphTable()
+        for row in sorted(self.glyph_rows.keys() | self.lazy_rows.keys()):
+            span = self.lazy_rows.get(row)
+            if span is None:
+                for g in self.iter_row_glyphs(row):
+                    table.append(g)
+            else:
+                table.extend_from(lazy, *span)
+        return table
+
+    def set_row(self, row, glyphs):
+        """Replace the ink of a row with glyphs, in strike order (journaled as removals and additions)."""
+        if self.lazy_rows:
+            self._decode_row(row)
+        for col in list(self.glyph_rows.get(row, ())):
+            self.remove_cell(row, col)
+        for g in glyphs:
+            self.add_glyph(g)
+
+    def count_strikes_at(self, row, col):
+        if self.lazy_rows:
+            self._decode_row(row)
+        cells = self.glyph_rows.get(row)
+        return len(cells.get(col, ())) if cells else 0
+
+    def iter_row_glyphs(self, row):
+        if self.lazy_rows:
+            self._decode_row(row)
+        for cell in self.glyph_rows.get(row, {}).values():
+            yield from cell
+
+    def peek_row_glyphs(self, row):
+        """The glyphs of a row like iter_row_glyphs, but a row not decoded yet is read from the table
+        without decoding it (for views that only look, such as the overview)."""
+        span = self.lazy_rows.get(row)
+        if span is None:
+            yield from self.iter_row_glyphs(row)
+            return
+        t = self.lazy_table
+        for i in range(*span):
+            yield t.glyph(i, row)
+
+    def iter_glyphs(self):
+        """All glyphs in row order (cells within a row in insertion order)."""
+        for row in sorted(self.glyph_rows.keys() | self.lazy_rows.keys()):
+            yield from self.iter_row_glyphs(row)
+
+    # stamp model
+    def record_stamp(self, ch, row, col):
+        """Record a stamp. It stays when editor mode removes the glyph; only an editor-mode undo or a
+        snapshot restore takes it back."""
+        if self.journal is not None:
+            self.journal.record((J_STAMP, ch, row, col))
+        self.changed_stamp_rows.add(row)
+        if self.lazy_stamp_rows:
+            self._decode_stamp_row(row)
+        cell = self.stamp_cells.setdefault(row, {}).get(col)
+        if cell is None:
+            self.stamp_cells[row][col] = [ch, 1]
+        else:
+            cell[1] += 1
+        if row > self.stamp_max_row:
+            self.stamp_max_row = row
+        self.stamp_history.append(Stamp(ch, row, col))
+        if len(self.stamp_history) >= STAMP_HISTORY_LIMIT:
+            self.compact_stamp_history()
+
+    def set_stamp(self, ch, row, col, strikes):
+        """Set a stamp cell outright, e.g. to undo strikes; strikes=0 removes it."""
+        if self.journal is not None:
+            self.journal.record((J_SET_STAMP, ch, row, col, strikes))
+        self.changed_stamp_rows.add(row)
+        if self.lazy_stamp_rows:
+            self._decode_stamp_row(row)
+        cells = self.stamp_cells.setdefault(row, {})
+        if strikes:
+            cells[col] = [ch, strikes]
+            self.stamp_max_row = max(self.stamp_max_row, row)
+            return
+        cells.pop(col, None)
+        if not cells:
+            del self.stamp_cells[row]
+            if row == self.stamp_max_row:
+                self.stamp_max_row = max(max(self.stamp_cells, default=-1), max(self.lazy_stamp_rows, default=-1))
+
+    def stamp_columns(self):
+        """The stamp cells as column arrays in row order (see STAMP_COLUMNS), for saving."""
+        if self.lazy_stamps is not None and not self.stamp_cells:
+            return self.lazy_stamps  # nothing decoded or struck since they were loaded
+        for row in list(self.lazy_stamp_rows):
+            self._decode_stamp_row(row)
+        cols = {name: array(typecode) for name, typecode in STAMP_COLUMNS}
+        rows, cs, chars, strikes = (cols[name] for name, _ in STAMP_COLUMNS)
+        for row in sorted(self.stamp_cells):
+            for col, (ch, n) in self.stamp_cells[row].items():
+                rows.append(row)
+                cs.append(col)
+                chars.append(ord(ch))
+                strikes.append(n)
+        return cols
+
+    def load_stamp_columns(self, cols, row_ids, row_starts):
+        """Replace the stamp model with saved stamp columns, decoded a row at a time as they are needed."""
+        self.stamps_replaced = True
+        self.stamp_cells = {}
+        self.stamp_history.clear()
+        self.lazy_stamps = cols
+        self.lazy_stamp_rows = {row: (row_starts[i], row_starts[i + 1]) for i, row in enumerate(row_ids)}
+        self.stamp_max_row = max(self.lazy_stamp_rows, default=-1)
+
+    def clear_stamps(self):
+        self.stamps_replaced = True
+        self.stamp_cells = {}
+        self.stamp_history.clear()
+        self.lazy_stamps = None
+        self.lazy_stamp_rows = {}
+        self.stamp_max_row = -1
+
+    def _decode_stamp_row(self, row):
+        span = self.lazy_stamp_rows.pop(row, None)
+        if span is None:
+            return
+        cols, chars, strikes = (self.lazy_stamps[name] for name in ('cols', 'chars', 'strikes'))
+        cells = self.stamp_cells.setdefault(row, {})
+        for i in range(*span):
+            cells[cols[i]] = [chr(chars[i]), strikes[i]]
+        if not self.lazy_stamp_rows:
+            self.lazy_stamps = None
+
+    @property
+    def has_stamps(self):
+        return bool(self.stamp_cells or self.lazy_stamp_rows)
+
+    def compact_stamp_history(self):
+        """Drop the raw strike log; stamp_cells already holds everything saving needs."""
+        self.stamp_history.clear()
+
+    def stamp_line(self, row):
+        """Text of one row: no stamps => space, one stamp => that char, overstruck => '□'."""
+        span = self.lazy_stamp_rows.get(row)
+        if span is not None:
+            # read a row that is not decoded yet straight from the columns, and leave it lazy
+            cols, chars, strikes = (self.lazy_stamps[name][span[0]:span[1]] for name in ('cols', 'chars', 'strikes'))
+            width = min(self.cols_per_line, max(cols) + 1)
+            line = [' '] * width
+            for c, ch, n in zip(cols, chars, strikes):
+                if c < width:
+                    line[c] = chr(ch) if n == 1 else OVERSTRUCK
+            return "".join(line).rstrip()
+        cells = self.stamp_cells.get(row)
+        if not cells:
+            return ''
+        width = min(self.cols_per_line, max(cells) + 1)
+        chars = [' '] * width
+        for c, (ch, strikes) in cells.items():
+            if 0 <= c < width:
+                chars[c] = ch if strikes == 1 else OVERSTRUCK  # overwritten -> square
+        # rstrip trailing spaces
+        return "".join(chars).rstrip()
+
+    def row_text(self, row):
+        """Text of the ink on one row, by the stamp_line rule (a cell holding several glyphs => '□')."""
+        span = self.lazy_rows.get(row)
+        if span is not None:
+            return cells_line(table_cells(self.lazy_table, *span), self.cols_per_line)
+        cells = self.glyph_rows.get(row)
+        if not cells:
+            return ''
+        return cells_line(((c, cell[0].char, len(cell)) for c, cell in cells.items() if cell), self.cols_per_line)
+
+
+def unsave_page(doc, store):
+    """Take the last saved page back into the typewriter (undoing NEW PAGE); returns its store entry."""
+    journal, doc.journal = doc.journal, None
     try:
-        return pygame.sndarray.make_sound(stereo)
-    except Exception:
-        return None
+        entry = store.pop()
+        table = store.load(entry)
+        doc.clear_glyphs()
+        doc.attach_table(table, *row_index(table.rows))
+    finally:
+        doc.journal = journal
+    if journal is not None:
+        journal.record((J_POP_PAGE,))
+    return entry
+
+
+# ---------- native document format ----------
+# A .twd file keeps the full ink state of every page, so reopening reproduces exactly what was typed:
+# jitter offsets, darkness and the strike order stacked in each cell, plus the stamp model and the
+# cursor. Pages are stored column by column (the GlyphTable arrays) with an index of where each row's
+# glyphs start, so the file is memory-mapped and a row is only decoded when it scrolls into view.
+#
+#   header     b"TWD1", u32 version, u64 directory offset, u64 directory length
+#   columns    little-endian arrays, each 8-byte aligned
+#   directory  JSON: cols_per_line, cursor, generation, typeballs [[font, size]], pages [{glyphs, columns,
+#              row_ids, row_starts}], stamps, stamp_row_ids, stamp_row_starts; every array is
+#              referenced as [offset, count]
+#
+# The last page is the one in the typewriter, the ones before it are saved_pages, oldest first. A page's
+# faces column indexes typeballs; version 1 files have neither and were typed with the default ball.
+NATIVE_EXT = ".twd"
+NATIVE_MAGIC = b"TWD1"
+NATIVE_VERSION = 2
+NATIVE_HEADER = struct.Struct("<4sIQQ")
+GLYPH_TABLE_COLUMNS = [('chars', 'I'), ('rows', 'i'), ('cols', 'H'),
+                       ('offset_x', 'f'), ('offset_y', 'f'), ('darkness', 'f'), ('faces', 'B')]
+STAMP_COLUMNS = [('rows', 'i'), ('cols', 'H'), ('chars', 'I'), ('strikes', 'I')]
+
+
+class DocumentImage:
+    """Everything a native document holds. Its tables may be views into a memory-mapped file."""
+
+    def __init__(self, pages, stamps, cursor=None, cols_per_line=None, row_index=None, stamp_index=None):
+        self.pages = pages  # GlyphTables: saved pages, then the current page
+        self.stamps = stamps  # STAMP_COLUMNS name -> array, in row order
+        self.cursor = cursor  # (row, col) or None
+        self.cols_per_line = cols_per_line
+        self.row_index = row_index  # per page (row_ids, row_starts), when read from a file
+        self.stamp_index = stamp_index  # (row_ids, row_starts) of the stamps, when read from a file
+
+
+def row_index(rows):
+    """(row_ids, row_starts) of a row-ordered column: row_ids[i]'s entries are row_starts[i]:row_starts[i + 1]."""
+    ids, starts = array('i'), array('I')
+    prev = None
+    for i, row in enumerate(rows):
+        if row != prev:
+            ids.append(row)
+            starts.append(i)
+            prev = row
+    starts.append(len(rows))
+    return ids, starts
+
+
+def write_native(path, image, generation=0):
+    """Write a DocumentImage as a native document (atomically: temp file, fsync, rename)."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(bytes(NATIVE_HEADER.size))
+
+        def put(a):
+            f.write(bytes(-f.tell() % 8))
+            offset = f.tell()
+            if sys.byteorder == "big":
+                a = array(a.typecode if isinstance(a, array) else a.format, a)
+                a.byteswap()
+            f.write(a)
+            return [offset, len(a)]
+
+        stamp_ids, stamp_starts = row_index(image.stamps['rows'])
+        pages = []
+        for table in image.pages:
+            ids, starts = row_index(table.rows)
+            pages.append({
+                "glyphs": len(table),
+                "columns": {name: put(getattr(table, name)) for name, _ in GLYPH_TABLE_COLUMNS},
+                "row_ids": put(ids),
+                "row_starts": put(starts),
+            })
+        directory = json.dumps({
+            "cols_per_line": image.cols_per_line,
+            "cursor": list(image.cursor) if image.cursor else None,
+            "generation": generation,
+            "typeballs": [list(ball) for ball in TYPEBALLS[:]],
+            "pages": pages,
+            "stamps": {name: put(image.stamps[name]) for name, _ in STAMP_COLUMNS},
+            "stamp_row_ids": put(stamp_ids),
+            "stamp_row_starts": put(stamp_starts),
+        }).encode("utf-8")
+        dir_offset = f.tell()
+        f.write(directory)
+        f.seek(0)
+        f.write(NATIVE_HEADER.pack(NATIVE_MAGIC, NATIVE_VERSION, dir_offset, len(directory)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _read_native_directory(f):
+    magic, version, dir_offset, dir_len = NATIVE_HEADER.unpack(f.read(NATIVE_HEADER.size))
+    if magic != NATIVE_MAGIC:
+        raise ValueError("not a typewriter document")
+    if version > NATIVE_VERSION:
+        raise ValueError(f"typewriter document version {version} is newer than this typewriter")
+    f.seek(dir_offset)
+    return json.loads(f.read(dir_len).decode("utf-8"))
+
+
+def read_native(path, use_mmap=True):
+    """Open a native document; returns (DocumentImage, generation).
+
+    With use_mmap the columns are views into the mapped file and nothing is copied; otherwise (and on
+    big-endian machines) they are read into arrays, so the file can be replaced afterwards.
+    """
+    with open(path, "rb") as f:
+        directory = _read_native_directory(f)
+        mapped = use_mmap and sys.byteorder == "little"
+        if mapped:
+            buf = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        else:
+            f.seek(0)
+            buf = memoryview(f.read())
+
+    def column(ref, typecode):
+        offset, n = ref
+        a = array(typecode)
+        view = buf[offset:offset + n * a.itemsize]
+        if mapped:
+            return view.cast(typecode)
+        a.frombytes(view)
+        if sys.byteorder == "big":
+            a.byteswap()
+        return a
+
+    remap = typeball_remap(directory.get("typeballs", [(FONT_NAME, FONT_SIZE)]))
+
+    def face_column(ref, glyphs):
+        if ref is None:
+            return array('B', bytes(glyphs))
+        faces = column(ref, 'B')
+        return faces if remap is None else array('B', bytes(faces).translate(remap))
+
+    pages, index = [], []
+    for page in directory["pages"]:
+        columns = {name: column(page["columns"][name], typecode)
+                   for name, typecode in GLYPH_TABLE_COLUMNS if name != 'faces'}
+        columns['faces'] = face_column(page["columns"].get("faces"), page["glyphs"])
+        pages.append(GlyphTable.from_columns(columns))
+        index.append((column(page["row_ids"], 'i'), column(page["row_starts"], 'I')))
+    stamps = {name: column(directory["stamps"][name], typecode) for name, typecode in STAMP_COLUMNS}
+    stamp_index = (column(directory["stamp_row_ids"], 'i'), column(directory["stamp_row_starts"], 'I'))
+    cursor = tuple(directory["cursor"]) if directory.get("cursor") else None
+    image = DocumentImage(pages, stamps, cursor, directory.get("cols_per_line"), index, stamp_index)
+    return image, directory.get("generation", 0)
+
+
+# ---------- bulk typesetting ----------
+# Opening or pasting text strikes it the way typing it in would (tab stops, overstrike darkening, the
+# carriage stopping at the right margin) but without a key event, animation or Glyph object per
+# character: each chunk of lines is laid out with string operations, the ink of all its glyphs is drawn
+# at once with numpy, and the result is attached to the page as GlyphTable and stamp columns.
+INGEST_CHUNK = 1 << 20  # characters read from a stream at a time
+LINE_BREAKS = "\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029"  # what str.splitlines() breaks lines at
+_space_table = None
+
+
+def _whitespace_to_space(text):
+    # typing any whitespace strikes a space
+    global _space_table
+    if _space_table is None:
+        _space_table = {c: ' ' for c in range(0x3001) if chr(c).isspace() and c != 32}
+    return text.translate(_space_table)
+
+
+def _strip_break(line):
+    return line[:-2] if line.endswith("\r\n") else line[:-1]
+
+
+def iter_text_lines(source, chunk=INGEST_CHUNK):
+    """Lists of lines from a string or a text stream, a chunk at a time. n line breaks make n + 1 lines,
+    so text ending in a break ends on an empty line, as Return leaves the carriage on the next row."""
+    if isinstance(source, str):
+        source = io.StringIO(source)
+    carry = ""
+    while True:
+        block = source.read(chunk)
+        lines = (carry + block).splitlines(True)
+        if not block:
+            break
+        # an unfinished line, or one ending in a \r that may be half of a \r\n, waits for the next read
+        carry = lines.pop() if lines and (lines[-1][-1] == "\r" or lines[-1][-1] not in LINE_BREAKS) else ""
+        if lines:
+            yield [_strip_break(ln) for ln in lines]
+    last = lines.pop() if lines and lines[-1][-1] not in LINE_BREAKS else ""
+    yield [_strip_break(ln) for ln in lines] + [last]
 
 
-def _make_thunk_sound():
-    if not HAS_NUMPY:
-        return None
-    sr = 22050
-    t = np.linspace(0, 0.07, int(0.07 * sr))
-    freq = 110.0
-    tone = 0.9 * np.sin(2 * np.pi * freq * t) * np.exp(-18 * t)
-    click = 0.08 * np.sin(2 * np.pi * 2200 * t) * np.exp(-250 * t)
-    data = (tone + click) * (2 ** 15 - 1)
-    data = data.astype(np.int16)
-    stereo = np.column_stack([data, data])
+def expand_tabs(line, col, max_col):
+    """line with each tab replaced by the spaces strike_tab would strike from col (it stops short of max_col)."""
+    parts = []
+    for i, piece in enumerate(line.split('\t')):
+        if i:
+            n = max(0, min(TAB_SIZE - col % TAB_SIZE, max_col - col))
+            parts.append(' ' * n)
+            col += n
+        parts.append(piece)
+        col += len(piece)
+    return "".join(parts)
+
+
+def cell_keys(np, rows, cols):
+    return (np.asarray(rows).astype(np.int64) << 16) | np.asarray(cols)
+
+
+def typeset_lines(np, rng, lines, row, col, max_col, inked=None, face=0):
+    """Lay out and ink lines typed from (row, col) with typeball face; col only applies to the first line.
+
+    Returns the glyphs as numpy columns keyed like GLYPH_TABLE_COLUMNS, and the carriage column after
+    the last line. Nothing lands past max_col. inked is (sorted cell_keys, glyph counts) of the cells
+    already holding ink, which darken and shake an overstrike like strike() does.
+    """
+    laid, end_col = [], col
+    for i, line in enumerate(lines):
+        start = col if i == 0 else 0
+        if '\t' in line:
+            line = expand_tabs(line, start, max_col)
+        laid.append(line[:max(0, max_col + 1 - start)])
+        end_col = min(start + len(line), max_col + 1)
+    lengths = np.fromiter(map(len, laid), np.int64, len(laid))
+    chars = np.frombuffer(_whitespace_to_space("".join(laid)).encode("utf-32-le"), "<u4").astype(np.uint32)
+    n = len(chars)
+    line_of = np.repeat(np.arange(len(laid)), lengths)
+    cols = np.arange(n) - (np.cumsum(lengths) - lengths)[line_of]
+    cols[:lengths[0] if len(laid) else 0] += col
+    strikes = np.zeros(n)
+    if inked is not None and len(inked[0]):
+        keys, counts = inked
+        new_keys = cell_keys(np, row + line_of, cols)
+        at = np.minimum(np.searchsorted(keys, new_keys), len(keys) - 1)
+        strikes = np.where(keys[at] == new_keys, counts[at], 0)
+    darkness = np.minimum(1.0, rng.uniform(0.6, 0.95, n) + 0.12 * strikes)
+    offset_x = rng.uniform(-0.5, 0.5, n)
+    offset_y = rng.uniform(-0.5, 0.5, n)
+    edge = np.flatnonzero(cols == max_col)  # the last column shakes more, and more still when overstruck
+    if edge.size:
+        hit = strikes[edge] > 0
+        offset_x[edge] = np.where(hit, rng.integers(-2, 3, edge.size), rng.integers(-1, 2, edge.size))
+        offset_y[edge] = np.where(hit, rng.integers(-2, 3, edge.size), rng.integers(-1, 3, edge.size))
+    columns = {'chars': chars, 'rows': (row + line_of).astype(np.int32), 'cols': cols.astype(np.uint16),
+               'offset_x': offset_x.astype(np.float32), 'offset_y': offset_y.astype(np.float32),
+               'darkness': darkness.astype(np.float32), 'faces': np.full(n, face, np.uint8)}
+    return columns, end_col
+
+
+def merge_stamps(np, old, new_rows, new_cols, new_chars):
+    """Stamp columns (numpy, keyed like STAMP_COLUMNS) for old stamp columns plus one new strike per
+    given cell: a cell keeps its first char and adds up its strikes."""
+    rows = np.concatenate([np.asarray(old['rows'], np.int32), new_rows])
+    cols = np.concatenate([np.asarray(old['cols'], np.uint16), new_cols])
+    chars = np.concatenate([np.asarray(old['chars'], np.uint32), new_chars])
+    strikes = np.concatenate([np.asarray(old['strikes'], np.uint32), np.ones(len(new_rows), np.uint32)])
+    key = cell_keys(np, rows, cols)
+    order = np.argsort(key, kind='stable')  # old strikes first within a cell
+    key = key[order]
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]]) if len(key) else np.zeros(0, np.int64)
+    first = order[starts]
+    return {'rows': rows[first], 'cols': cols[first], 'chars': chars[first],
+            'strikes': np.add.reduceat(strikes[order], starts).astype(np.uint32) if len(key) else strikes}
+
+
+def clipboard_text():
+    """The text on the system clipboard, or None (needs the display to be initialised)."""
     try:
-        return pygame.sndarray.make_sound(stereo)
-    except Exception:
+        if hasattr(pygame.scrap, "get_text"):
+            return pygame.scrap.get_text() or None
+        if not pygame.scrap.get_init():
+            pygame.scrap.init()
+        data = pygame.scrap.get(pygame.SCRAP_TEXT)
+        return data.decode("utf-8", "replace").rstrip("\0") if data else None
+    except (pygame.error, AttributeError, NotImplementedError):
         return None
 
 
-click_fallback = _make_click_sound()
-bell_sound = _make_bell_sound()
-thunk_sound = _make_thunk_sound()
+def numpy_row_index(np, rows):
+    """row_index() of a sorted numpy row column."""
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else np.zeros(0, np.int64)
+    return rows[starts].tolist(), starts.tolist() + [len(rows)]
+
+
+def array_column(values, typecode):
+    """A numpy column as an array of the given typecode."""
+    a = array(typecode)
+    a.frombytes(values.astype(typecode).tobytes())
+    return a
+
+
+# ---------- autosave journal ----------
+# Every change to the document is appended to a journal of compact binary records. The main loop only
+# appends a tuple to a list; a writer thread encodes, writes and fsyncs them in batches. Once the journal
+# grows past JOURNAL_COMPACT_BYTES the writer folds it into a new snapshot. On startup, a session that
+# did not end cleanly is rebuilt from the latest snapshot plus the journal tail; a clean quit deletes it.
+#
+#   snapshot.bin          a native document whose directory carries the journal generation
+#   journal-<gen>.bin     frames of [payload length, crc32, records]; a torn last frame is ignored
+#
+# A snapshot of generation G already contains every journal below G. Opening a native document or a
+# text file, or going back to an editor snapshot, puts a J_BASE marker in the queue instead of a record
+# per glyph: the writer turns that document itself into the next snapshot (see _rebase).
+# Glyph records carry no typeball: the writer puts a J_FACE (font, size) in front of the first glyph of
+# a journal struck with a ball other than the default, and of every glyph where the ball changes. It is
+# the one record of variable length: its font file name follows the fixed fields.
+AUTOSAVE_DIR = os.path.join(os.path.expanduser("~"), ".typewriter", "session")
+JOURNAL_FLUSH_S = 0.5
+JOURNAL_COMPACT_BYTES = 4 * 1024 * 1024
+
+J_STAMP, J_GLYPH, J_REMOVE, J_CLEAR, J_NEW_PAGE, J_CURSOR, J_SET_STAMP, J_POP_PAGE, J_FACE = range(1, 10)
+J_BASE = 0  # (J_BASE, DocumentImage); never encoded
+JOURNAL_RECORDS = {  # type -> struct of the fields after the type byte (chars as code points)
+    J_STAMP: struct.Struct("<IiH"),
+    J_GLYPH: struct.Struct("<IiHfff"),
+    J_REMOVE: struct.Struct("<iH"),
+    J_CLEAR: struct.Struct("<"),
+    J_NEW_PAGE: struct.Struct("<"),
+    J_CURSOR: struct.Struct("<iH"),
+    J_SET_STAMP: struct.Struct("<IiHI"),  # undo: set a stamp cell's strike count
+    J_POP_PAGE: struct.Struct("<"),  # undo NEW PAGE: the last saved page becomes the current page again
+    J_FACE: struct.Struct("<HB"),  # size, byte length of the font file (UTF-8) that follows the struct
+}
+FRAME_HEADER = struct.Struct("<II")
+
+
+def _encode_record(rec):
+    kind = rec[0]
+    fields = rec[1:]
+    if kind in (J_STAMP, J_GLYPH, J_SET_STAMP):
+        fields = (ord(fields[0]),) + fields[1:]
+    elif kind == J_FACE:
+        name, size = fields
+        name = name.encode("utf-8")
+        return bytes((kind,)) + JOURNAL_RECORDS[kind].pack(size, len(name)) + name
+    return bytes((kind,)) + JOURNAL_RECORDS[kind].pack(*fields)
+
+
+class SessionState:
+    """What a journal replays into: the saved pages, the current page's Document and the cursor."""
+
+    def __init__(self, cols_per_line, doc=None):
+        self.saved_pages = PageStore()
+        self.doc = doc if doc is not None else Document(cols_per_line)
+        self.cursor = None  # (row, col) last recorded
+        self.face = 0  # typeball of the glyph records being replayed
+
+    def apply(self, kind, fields):
+        doc = self.doc
+        if kind == J_STAMP:
+            doc.record_stamp(chr(fields[0]), fields[1], fields[2])
+        elif kind == J_GLYPH:
+            doc.add_glyph(Glyph(chr(fields[0]), *fields[1:], face=self.face))
+        elif kind == J_REMOVE:
+            doc.remove_cell(*fields)
+        elif kind == J_CLEAR:
+            doc.clear_glyphs()
+        elif kind == J_NEW_PAGE:
+            self.saved_pages.append(GlyphTable.from_glyphs(doc.iter_glyphs()))
+            doc.clear_glyphs()
+        elif kind == J_CURSOR:
+            self.cursor = fields
+        elif kind == J_SET_STAMP:
+            doc.set_stamp(chr(fields[0]), *fields[1:])
+        elif kind == J_POP_PAGE:
+            unsave_page(doc, self.saved_pages)
+        elif kind == J_FACE:
+            self.face = typeball_id(fields[2].decode("utf-8"), fields[0])
+
+    def replay(self, path):
+        """Apply every intact frame of a journal file; stops at the first torn or corrupt frame."""
+        with open(path, "rb") as f:
+            data = f.read()
+        pos = 0
+        self.face = 0
+        while pos + FRAME_HEADER.size <= len(data):
+            length, crc = FRAME_HEADER.unpack_from(data, pos)
+            payload = data[pos + FRAME_HEADER.size:pos + FRAME_HEADER.size + length]
+            if len(payload) != length or zlib.crc32(payload) & 0xFFFFFFFF != crc:
+                break
+            self.apply_records(payload)
+            pos += FRAME_HEADER.size + length
+        self.doc.compact_stamp_history()
+
+    def apply_records(self, payload):
+        """Apply a run of encoded records, such as a journal frame's payload."""
+        i = 0
+        while i < len(payload):
+            kind = payload[i]
+            rec = JOURNAL_RECORDS[kind]
+            fields = rec.unpack_from(payload, i + 1)
+            i += 1 + rec.size
+            if kind == J_FACE:  # the font file follows the fixed fields
+                fields += (bytes(payload[i:i + fields[1]]),)
+                i += fields[1]
+            self.apply(kind, fields)
+
+    def write_snapshot(self, path, generation):
+        doc = self.doc
+        image = DocumentImage(self.saved_pages.view([GlyphTable.from_glyphs(doc.iter_glyphs())]),
+                              doc.stamp_columns(), self.cursor, doc.cols_per_line)
+        write_native(path, image, generation)
+
+    def read_snapshot(self, path):
+        """Load a snapshot; returns its generation.
+
+        Nothing is left pointing into the mapped file (compaction replaces it): saved pages are copied
+        into the page store one at a time, the current page and stamps into arrays.
+        """
+        image, generation = read_native(path)
+        self.saved_pages = PageStore(table.copy() for table in image.pages[:-1])
+        ids, starts = image.row_index[-1]
+        self.doc.attach_table(image.pages[-1].copy(), copy_column(ids, 'i'), copy_column(starts, 'I'))
+        stamps = {name: copy_column(image.stamps[name], typecode) for name, typecode in STAMP_COLUMNS}
+        ids, starts = image.stamp_index
+        self.doc.load_stamp_columns(stamps, copy_column(ids, 'i'), copy_column(starts, 'I'))
+        self.cursor = image.cursor
+        return generation
+
+    @property
+    def empty(self):
+        return not (self.saved_pages or not self.doc.is_empty or self.doc.has_stamps)
+
+
+class SessionJournal:
+    """Append-only autosave of one typewriter session in a directory (see the format notes above)."""
+
+    def __init__(self, directory, cols_per_line):
+        self.dir = directory
+        self.cols_per_line = cols_per_line
+        self.pending = []  # record tuples from the main thread, taken in batches by the writer
+        self.cursor = None
+        self._written_cursor = None
+        self._face = 0  # typeball of the last glyph record written to the current journal
+        self._wake = threading.Event()
+        self._stopping = False
+        self.error = None
+        os.makedirs(directory, exist_ok=True)
+        gens = self._journal_generations()
+        self.generation = (max(gens) + 1) if gens else self._snapshot_generation()
+        self.thread = threading.Thread(target=self._run, name="journal-writer", daemon=True)
+
+    @property
+    def snapshot_path(self):
+        return os.path.join(self.dir, "snapshot.bin")
+
+    def journal_path(self, generation):
+        return os.path.join(self.dir, f"journal-{generation}.bin")
+
+    def _journal_generations(self):
+        gens = []
+        for name in os.listdir(self.dir):
+            if name.startswith("journal-") and name.endswith(".bin"):
+                try:
+                    gens.append(int(name[8:-4]))
+                except ValueError:
+                    pass
+        return sorted(gens)
+
+    def _snapshot_generation(self):
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                return _read_native_directory(f).get("generation", 0)
+        except (OSError, ValueError):
+            return 0
+
+    def load(self, doc=None, upto=None):
+        """Rebuild the session on disk (snapshot + journals below `upto`) into a SessionState."""
+        state = SessionState(self.cols_per_line, doc)
+        base = 0
+        if os.path.exists(self.snapshot_path):
+            base = state.read_snapshot(self.snapshot_path)
+        for gen in self._journal_generations():
+            if gen >= base and (upto is None or gen < upto):
+                state.replay(self.journal_path(gen))
+        return state
+
+    # main thread
+    def record(self, rec):
+        self.pending.append(rec)
+
+    def note_cursor(self, row, col):
+        self.cursor = (row, col)
+
+    def start(self):
+        self.thread.start()
+
+    def close(self, discard=False):
+        """Stop the writer after a final flush; discard=True deletes the session (clean quit)."""
+        self._stopping = True
+        self._wake.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        if discard and self.error is None:
+            for name in os.listdir(self.dir):
+                if name == "snapshot.bin" or (name.startswith("journal-") and name.endswith(".bin")):
+                    os.remove(os.path.join(self.dir, name))
+
+    # writer thread
+    def _run(self):
+        while True:
+            self._wake.wait(JOURNAL_FLUSH_S)
+            self._wake.clear()
+            try:
+                size = self.flush()
+                if size > JOURNAL_COMPACT_BYTES:
+                    self.compact()
+            except Exception as e:
+                if self.error is None:
+                    print("Autosave failed:", e)
+                self.error = e
+            if self._stopping:
+                return
+
+    def flush(self):
+        """Write the records appended since the last flush as one frame; returns the journal's size."""
+        n = len(self.pending)
+        batch = self.pending[:n]
+        del self.pending[:n]  # anything appended meanwhile stays for the next flush
+        cursor = self.cursor
+        if cursor is not None and cursor != self._written_cursor:
+            batch.append((J_CURSOR,) + cursor)
+            self._written_cursor = cursor
+        records = []
+        for rec in batch:
+            if rec[0] == J_BASE:
+                self._write_frame(records)
+                records = []
+                self._rebase(rec[1])
+                continue
+            if rec[0] == J_GLYPH:
+                rec, face = rec[:-1], rec[-1]
+                if face != self._face:
+                    records.append((J_FACE,) + TYPEBALLS[face])
+                    self._face = face
+            records.append(rec)
+        return self._write_frame(records)
+
+    def _write_frame(self, records):
+        path = self.journal_path(self.generation)
+        if not records:
+            return os.path.getsize(path) if os.path.exists(path) else 0
+        payload = b"".join(_encode_record(rec) for rec in records)
+        with open(path, "ab") as f:
+            f.write(FRAME_HEADER.pack(len(payload), zlib.crc32(payload) & 0xFFFFFFFF) + payload)
+            f.flush()
+            os.fsync(f.fileno())
+            return f.tell()
+
+    def _rebase(self, image):
+        """An opened document replaces everything before it: it becomes the next snapshot as is."""
+        self.generation += 1
+        self._face = 0
+        write_native(self.snapshot_path, image, self.generation)
+        self._drop_journals_below(self.generation)
+
+    def _drop_journals_below(self, generation):
+        for gen in self._journal_generations():
+            if gen < generation:
+                os.remove(self.journal_path(gen))
+
+    def compact(self):
+        """Fold the snapshot and every finished journal into a new snapshot; new records go to the next journal."""
+        self.generation += 1
+        self._face = 0
+        state = self.load(upto=self.generation)
+        state.write_snapshot(self.snapshot_path, self.generation)
+        self._drop_journals_below(self.generation)
+
+
+class JournalTee:
+    """Hands every record of a session to several journals, e.g. the autosave and a BroadcastServer."""
+
+    def __init__(self, *journals):
+        self.journals = journals
+
+    def record(self, rec):
+        for journal in self.journals:
+            journal.record(rec)
+
+    def note_cursor(self, row, col):
+        for journal in self.journals:
+            journal.note_cursor(row, col)
+
+    def close(self, discard=False):
+        for journal in self.journals:
+            journal.close(discard)
+
+
+# ---------- live broadcast ----------
+# --serve [HOST:]PORT streams the session to read-only viewers (typewriter_viewer.py) over TCP. The
+# server is a journal like the autosave one: on the main thread it only collects the change records of
+# the frame, and once per frame packs them with the carriage and paper position into a single message
+# for an asyncio loop on its own thread, which does all the socket work. A viewer that joins gets a
+# snapshot of the current page first. A viewer with more than BROADCAST_BUFFER_LIMIT bytes still
+# unsent is skipped until it has caught up, then gets a fresh snapshot; it never holds up typing or the
+# other viewers.
+#
+#   stream         BROADCAST_MAGIC, then messages of [kind u8, payload length u32, payload]
+#   MSG_FRAME      VIEW_STATE, then journal records (J_GLYPH, J_REMOVE, J_CLEAR, J_NEW_PAGE, J_FACE)
+#   MSG_SNAPSHOT   VIEW_STATE, [directory length u32, JSON directory], the page's GlyphTable columns
+BROADCAST_HOST = "127.0.0.1"
+BROADCAST_PORT = 8765
+BROADCAST_MAGIC = b"TWB1"
+BROADCAST_BUFFER_LIMIT = 1 << 20
+MSG_FRAME, MSG_SNAPSHOT = 1, 2
+MSG_HEADER = struct.Struct("<BI")
+VIEW_STATE = struct.Struct("<iHiff")  # cursor row, cursor col, paper_scroll, view offset px, scroll offset px
+BROADCAST_RECORDS = (J_GLYPH, J_REMOVE, J_CLEAR, J_NEW_PAGE)  # what viewers draw; stamps are not sent
+BROADCAST_RESYNC = (J_BASE, J_POP_PAGE)  # the page was replaced wholesale: viewers get a new snapshot
+VIEWER_WAITING, VIEWER_LIVE, VIEWER_LAGGING = range(3)
+
+
+def parse_address(text, default_host=BROADCAST_HOST):
+    """(host, port) of 'HOST:PORT', 'PORT' or 'HOST'."""
+    host, sep, port = text.rpartition(":")
+    if not sep:
+        return (default_host, int(text)) if text.isdigit() else (text, BROADCAST_PORT)
+    return host.strip("[]") or default_host, int(port)
+
+
+def broadcast_message(kind, payload):
+    return MSG_HEADER.pack(kind, len(payload)) + payload
+
+
+def encode_snapshot(view, table, typeballs):
+    """A MSG_SNAPSHOT of a page; typeballs is the TYPEBALLS list its face ids refer to."""
+    directory = json.dumps({"glyphs": len(table), "typeballs": [list(ball) for ball in typeballs]}).encode("utf-8")
+    parts = [view, struct.pack("<I", len(directory)), directory]
+    for name, typecode in GLYPH_TABLE_COLUMNS:
+        column = getattr(table, name)
+        if sys.byteorder == "big":
+            column = array(typecode, column)
+            column.byteswap()
+        parts.append(bytes(column))
+    return broadcast_message(MSG_SNAPSHOT, b"".join(parts))
+
+
+def decode_snapshot(payload):
+    """(view state, GlyphTable) of a MSG_SNAPSHOT payload, its face ids mapped to this run's."""
+    view = VIEW_STATE.unpack_from(payload)
+    pos = VIEW_STATE.size
+    size = struct.unpack_from("<I", payload, pos)[0]
+    directory = json.loads(bytes(payload[pos + 4:pos + 4 + size]).decode("utf-8"))
+    pos += 4 + size
+    columns = {}
+    for name, typecode in GLYPH_TABLE_COLUMNS:
+        column = array(typecode)
+        end = pos + directory["glyphs"] * column.itemsize
+        column.frombytes(payload[pos:end])
+        if sys.byteorder == "big":
+            column.byteswap()
+        columns[name] = column
+        pos = end
+    remap = typeball_remap(directory["typeballs"])
+    if remap is not None:
+        columns["faces"] = array('B', bytes(columns["faces"]).translate(remap))
+    return view, GlyphTable.from_columns(columns)
+
+
+class BroadcastServer:
+    """Streams a typewriter session to read-only viewers (see the notes above).
+
+    record / note_cursor / close make it a journal (the engine tees it with the autosave one);
+    end_frame(engine) is called once per frame. Everything else runs on the server's own thread.
+    """
 
+    def __init__(self, host=BROADCAST_HOST, port=BROADCAST_PORT):
+        self.host = host
+        self.port = port
+        self.pending = []  # broadcast records of the current frame
+        self._face = -1  # typeball of the last glyph sent; -1: viewers need a J_FACE first
+        self._view = None  # VIEW_STATE last sent
+        self._resync = False
+        self.snapshot_wanted = False  # set by the loop when a viewer is waiting for a snapshot
+        self.viewers = {}  # StreamWriter -> VIEWER_*; only the loop thread changes it
+        self.loop = None
+        self.error = None
+        self._ready = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="broadcast", daemon=True)
+
+    def start(self):
+        """Start serving; raises OSError when the address cannot be listened on."""
+        self.thread.start()
+        self._ready.wait()
+        if self.error is not None:
+            raise self.error
+        return self
+
+    # main thread
+    def record(self, rec):
+        if rec[0] in BROADCAST_RESYNC:
+            self._resync = True
+        elif rec[0] in BROADCAST_RECORDS:
+            self.pending.append(rec)
+
+    def note_cursor(self, row, col):
+        pass  # end_frame sends the carriage with the rest of the view
+
+    def end_frame(self, engine):
+        """Hand the frame's changes to the loop as one message; a snapshot instead when one is due."""
+        if not self.viewers and not self.snapshot_wanted:
+            self.pending.clear()
+            self._resync = False
+            self._view = None
+            return
+        view = VIEW_STATE.pack(engine.cursor_row, engine.cursor_col, engine.paper_scroll,
+                               engine.view_offset_px, engine.paper_scroll_offset_px)
+        if self._resync or self.snapshot_wanted:
+            # the snapshot is serialized on the loop thread; the page table is not changed after this
+            everyone, self._resync, self.snapshot_wanted = self._resync, False, False
+            if everyone:
+                self.pending.clear()
+            else:
+                self._send_frame(view)  # the viewers already watching get the frame first
+            self._face = -1
+            self._view = view
+            self.loop.call_soon_threadsafe(self._deliver_snapshot, view, engine.doc.page_table(),
+                                           TYPEBALLS[:], everyone)
+            return
+        self._send_frame(view)
 
-def play_key():
-    """Play the strike WAV if available, else fallback sound."""
-    global strike_sound
-    if strike_sound:
+    def _send_frame(self, view):
+        if not self.pending and view == self._view:
+            return
+        records = []
+        for rec in self.pending:
+            if rec[0] == J_GLYPH:
+                rec, face = rec[:-1], rec[-1]
+                if face != self._face:
+                    records.append((J_FACE,) + TYPEBALLS[face])
+                    self._face = face
+            records.append(rec)
+        self.pending.clear()
+        self._view = view
+        message = broadcast_message(MSG_FRAME, view + b"".join(_encode_record(rec) for rec in records))
+        self.loop.call_soon_threadsafe(self._deliver_frame, message)
+
+    def close(self, discard=False):
+        if self.loop is not None and self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+    # server thread
+    def _run(self):
+        loop = self.loop = asyncio.new_event_loop()
         try:
-            strike_sound.set_volume(KEY_VOL)
-            strike_sound.play()
+            server = loop.run_until_complete(asyncio.start_server(self._serve, self.host, self.port))
+        except OSError as e:
+            self.error = e
+            loop.close()
+            self._ready.set()
             return
-        except Exception:
-            pass
-    if click_fallback:
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
         try:
-            click_fallback.set_volume(KEY_VOL)
-            click_fallback.play()
-        except Exception:
+            loop.run_forever()
+        finally:
+            server.close()
+            for writer in list(self.viewers):
+                writer.transport.abort()  # ends every _serve and _catch_up, however much is still unsent
+            loop.run_until_complete(asyncio.gather(*asyncio.all_tasks(loop), return_exceptions=True))
+            loop.run_until_complete(server.wait_closed())
+            loop.close()
+
+    async def _serve(self, reader, writer):
+        writer.write(BROADCAST_MAGIC)
+        self.viewers[writer] = VIEWER_WAITING
+        self.snapshot_wanted = True
+        try:
+            while await reader.read(4096):
+                pass  # viewers have nothing to say; reading is how a hang-up is noticed
+        except OSError:
             pass
-
-
-def play_bell():
-    if bell_sound:
+        finally:
+            del self.viewers[writer]
+            writer.close()
+
+    def _deliver_frame(self, message):
+        for writer, state in list(self.viewers.items()):
+            if state == VIEWER_LIVE and self._keeping_up(writer):
+                writer.write(message)
+
+    def _keeping_up(self, writer):
+        if writer.transport.get_write_buffer_size() <= BROADCAST_BUFFER_LIMIT:
+            return True
+        self.viewers[writer] = VIEWER_LAGGING
+        self.loop.create_task(self._catch_up(writer))
+        return False
+
+    async def _catch_up(self, writer):
+        """Let a slow viewer's backlog drain, then start it over from a snapshot."""
         try:
-            bell_sound.set_volume(BELL_VOL)
-            bell_sound.play()
+            await writer.drain()
+        except OSError:
             return
-        except Exception:
-            pass
-    play_key()
+        if writer in self.viewers:
+            self.viewers[writer] = VIEWER_WAITING
+            self.snapshot_wanted = True
+
+    def _deliver_snapshot(self, view, table, typeballs, everyone):
+        wanted = (VIEWER_WAITING, VIEWER_LIVE) if everyone else (VIEWER_WAITING,)
+        targets = [writer for writer, state in list(self.viewers.items()) if state in wanted and self._keeping_up(writer)]
+        if not targets:
+            return
+        message = encode_snapshot(view, table, typeballs)
+        for writer in targets:
+            writer.write(message)
+            self.viewers[writer] = VIEWER_LIVE
 
 
-def play_thunk():
-    if thunk_sound:
-        try:
-            thunk_sound.set_volume(THUNK_VOL)
-            thunk_sound.play()
-            return
-        except Exception:
-            pass
-    play_key()
-    pygame.time.delay(30)
-    play_key()
+# ---------- startup asset cache ----------
+# Startup synthesizes the strike, bell and thunk sounds, measures the font, and rasterizes an ink stamp
+# the first time each is struck. AssetCache keeps the results in ASSET_CACHE_DIR so the next start reads
+# them back instead. Entries are keyed on everything they are built from (font file, size, mixer format,
+# parameters, ASSET_CACHE_VERSION): change any of it and the entry is rebuilt and the stale one removed.
+ASSET_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".typewriter", "cache")
+ASSET_CACHE_VERSION = 1  # bump whenever sound synthesis or stamp rendering changes
+BLOB_HEADER = struct.Struct("<I")
 
 
-# ---------- utilities ----------
-def count_strikes_at(row, col):
-    return sum(1 for g in glyphs if g['row'] == row and g['col'] == col)
+def file_signature(path):
+    """[absolute path, size, mtime] of a file, or None if there is none; part of a cache key."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [os.path.abspath(path), st.st_size, st.st_mtime_ns]
 
 
-def pixel_for_col(col_index):
-    # column pixel position relative to the paper origin
-    return LEFT_MARGIN + col_index * CHAR_WIDTH
+def pack_blobs(blobs):
+    parts = [BLOB_HEADER.pack(len(blobs))]
+    for blob in blobs:
+        parts += [BLOB_HEADER.pack(len(blob)), blob]
+    return b"".join(parts)
 
 
-# ---------- blocky/stepped view animation ----------
-def animate_view_to_col_blocky(target_col, steps=4, step_ms=10, play_thunk_at_end=False, thunk_delay_ms=0):
-    """
-    Blocky/stepped animation to move view_offset_px so that target_col aligns with the fixed carriage center.
-    steps: number of discrete jumps
-    step_ms: milliseconds pause per step
-    Buffer events while animating and repost them afterward.
-    """
-    global animating, view_offset_px, animation_cancel
-    animating = True
-    animation_cancel = False
-    local_buffer = []
+def unpack_blobs(data):
+    (count,), pos = BLOB_HEADER.unpack_from(data), BLOB_HEADER.size
+    blobs = []
+    for _ in range(count):
+        (n,), pos = BLOB_HEADER.unpack_from(data, pos), pos + BLOB_HEADER.size
+        if pos + n > len(data):
+            raise ValueError("truncated blob")
+        blobs.append(data[pos:pos + n])
+        pos += n
+    return blobs
 
-    target_offset = CARRIAGE_DISPLAY_X - PAPER_X - pixel_for_col(target_col)
-    start_offset = view_offset_px
-    delta = target_offset - start_offset
 
-    for s in range(1, steps + 1):
-        if animation_cancel:
-            break
-        frac = s / steps
-        new_offset = start_offset + delta * frac
-        view_offset_px = new_offset
-
-        draw()
-        pygame.display.flip()
-
-        wait_until = pygame.time.get_ticks() + step_ms
-        while pygame.time.get_ticks() < wait_until:
-            for iev in pygame.event.get():
-                if iev.type == pygame.QUIT:
-                    animation_cancel = True
-                    pygame.event.post(iev)
-                else:
-                    local_buffer.append(iev)
-            clock.tick(120)
+class AssetCache:
+    """Versioned on-disk cache of startup assets. Best effort: anything unreadable is a miss, and a
+    failed write only costs the next start its head start."""
 
-    # ensure final position
-    if not animation_cancel:
-        view_offset_px = target_offset
-        draw()
-        pygame.display.flip()
+    def __init__(self, directory=ASSET_CACHE_DIR):
+        self.directory = directory
+        self.hits = self.misses = 0
 
-    if play_thunk_at_end and not animation_cancel:
-        if thunk_delay_ms:
-            pygame.time.delay(thunk_delay_ms)
-        play_thunk()
+    @staticmethod
+    def slug(text):
+        return "".join(c if c.isalnum() else "_" for c in os.path.basename(str(text)))
 
-    animating = False
-    animation_cancel = False
+    def path(self, kind, name, params):
+        key = json.dumps([ASSET_CACHE_VERSION, params], sort_keys=True)
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, f"{kind}-{self.slug(name)}-{digest}.bin")
 
-    for ev in local_buffer:
+    def load(self, kind, name, params):
+        """The bytes stored under (kind, name, params), or None."""
         try:
-            pygame.event.post(ev)
-        except Exception:
-            pass
+            with open(self.path(kind, name, params), "rb") as f:
+                data = f.read()
+        except OSError:
+            data = b""
+        if len(data) >= FRAME_HEADER.size:
+            length, crc = FRAME_HEADER.unpack_from(data)
+            payload = data[FRAME_HEADER.size:]
+            if length == len(payload) and zlib.crc32(payload) == crc:
+                self.hits += 1
+                return payload
+        self.misses += 1
+        return None
 
+    def store(self, kind, name, params, data):
+        """Store data atomically, replacing any entry of the same kind and name built from other params."""
+        path = self.path(kind, name, params)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                f.write(FRAME_HEADER.pack(len(data), zlib.crc32(data) & 0xFFFFFFFF))
+                f.write(data)
+            os.replace(path + ".tmp", path)
+            prefix = f"{kind}-{self.slug(name)}-"
+            for entry in os.listdir(self.directory):
+                stale = os.path.join(self.directory, entry)
+                if entry.startswith(prefix) and entry.endswith(".bin") and stale != path:
+                    os.remove(stale)
+        except OSError as e:
+            print("Could not write asset cache:", e)
 
-def animate_view_to_col_smooth(target_col, duration_ms=1000, play_thunk_at_end=False, thunk_delay_ms=0):
-    """
-    Smooth animation to move view_offset_px so that target_col aligns with the fixed carriage center.
-    Uses ease-out interpolation and buffers events while animating.
-    """
-    global animating, view_offset_px, animation_cancel
-    animating = True
-    animation_cancel = False
-    local_buffer = []
 
-    target_offset = CARRIAGE_DISPLAY_X - PAPER_X - pixel_for_col(target_col)
-    start_offset = view_offset_px
-    start_time = pygame.time.get_ticks()
-    end_time = start_time + duration_ms
+# ---------- sound setup ----------
+# Each sound class plays on its own reserved mixer channels whose volume is set once, so a strike never
+# cuts off the bell or thunk. Strikes rotate over a pool of KEY_VOICES channels, letting fast typing
+# overlap instead of restarting one sound. With numpy, the strike is pre-rendered in KEY_VARIATIONS
+# versions (pitch, tone, loudness) and one is picked per stroke. Everything is synthesized once, at
+# the mixer's own rate and format.
+KEY_VOICES = 6
+KEY_VARIATIONS = 8
+SPARE_CHANNELS = 4  # left unreserved for anything else that plays through the mixer
+
+
+def _numpy():
+    # optional numpy sound synth fallback; imported on first use so importing this module stays cheap
+    try:
+        import numpy as np
+        return np
+    except Exception:
+        return None
 
-    while True:
-        now = pygame.time.get_ticks()
-        if now >= end_time or animation_cancel:
-            view_offset_px = target_offset
-            draw()
-            pygame.display.flip()
-            break
 
-        frac = (now - start_time) / max(1, (end_time - start_time))
-        # ease-out
-        frac = 1 - (1 - frac) * (1 - frac)
-        view_offset_px = start_offset + (target_offset - start_offset) * frac
+def _mixer_rate():
+    return pygame.mixer.get_init()[0]
+
+
+def _sound_from_samples(np, samples):
+    """Make a Sound from float samples in [-1, 1], shape (n,) or (n, channels), in the mixer's format."""
+    _, size, channels = pygame.mixer.get_init()
+    samples = np.clip(samples, -1.0, 1.0)
+    if samples.ndim == 1:
+        samples = samples[:, None]
+    if samples.shape[1] != channels:
+        samples = np.repeat(samples[:, :1], channels, axis=1)
+    if abs(size) == 8:
+        data = (samples * 127 + (128 if size > 0 else 0)).astype(np.uint8 if size > 0 else np.int8)
+    elif size == 32:
+        data = samples.astype(np.float32)
+    elif abs(size) == 32:
+        data = (samples * (2 ** 31 - 1)).astype(np.int32)
+    else:
+        data = (samples * (2 ** 15 - 1)).astype(np.int16)
+    try:
+        return pygame.sndarray.make_sound(np.ascontiguousarray(data))
+    except Exception:
+        return None
 
-        # buffer events so UI remains responsive
-        for iev in pygame.event.get():
-            if iev.type == pygame.QUIT:
-                animation_cancel = True
-                pygame.event.post(iev)
-            else:
-                local_buffer.append(iev)
 
-        draw()
-        pygame.display.flip()
-        clock.tick(60)
+def _samples_from_sound(np, sound):
+    """Float samples in [-1, 1], shape (n, channels), of a Sound in the mixer's format."""
+    data = pygame.sndarray.array(sound)
+    if data.ndim == 1:
+        data = data[:, None]
+    if data.dtype == np.uint8:
+        return (data.astype(np.float32) - 128) / 128
+    if data.dtype.kind == 'f':
+        return data.astype(np.float32)
+    return data.astype(np.float32) / float(np.iinfo(data.dtype).max)
 
-    if play_thunk_at_end and not animation_cancel:
-        if thunk_delay_ms:
-            pygame.time.delay(thunk_delay_ms)
-        play_thunk()
 
-    animating = False
-    animation_cancel = False
+def _make_click_sound():
+    np = _numpy()
+    if np is None:
+        return None
+    sr = _mixer_rate()
+    length = int(0.02 * sr)
+    noise = np.random.uniform(-1, 1, length)
+    env = np.linspace(1.0, 0.0, length)
+    return _sound_from_samples(np, noise * env * 0.3)
+
+
+def _make_bell_sound():
+    np = _numpy()
+    if np is None:
+        return None
+    sr = _mixer_rate()
+    t = np.linspace(0, 0.14, int(0.14 * sr))
+    freq = 1500.0
+    tone = 0.6 * np.sin(2 * np.pi * freq * t) * np.exp(-8 * t)
+    return _sound_from_samples(np, tone)
 
-    # repost buffered events
-    for ev in local_buffer:
+
+def _make_thunk_sound():
+    np = _numpy()
+    if np is None:
+        return None
+    sr = _mixer_rate()
+    t = np.linspace(0, 0.07, int(0.07 * sr))
+    freq = 110.0
+    tone = 0.9 * np.sin(2 * np.pi * freq * t) * np.exp(-18 * t)
+    click = 0.08 * np.sin(2 * np.pi * 2200 * t) * np.exp(-250 * t)
+    return _sound_from_samples(np, tone + click)
+
+
+def _make_variations(sound, count):
+    """The sound plus count - 1 variations of pitch (resampled), tone (a little brighter or duller)
+    and loudness; just [sound] without numpy."""
+    np = _numpy()
+    if np is None or count < 2:
+        return [sound]
+    try:
+        base = _samples_from_sound(np, sound)
+    except Exception:
+        return [sound]
+    rng = np.random.default_rng()
+    n = len(base)
+    kernel = np.ones(5) / 5
+    variations = [sound]
+    for _ in range(count - 1):
+        pitch = rng.uniform(0.94, 1.06)
+        tone = rng.uniform(-0.6, 0.6)  # >0 adds back high end, <0 takes it away
+        gain = rng.uniform(0.8, 1.0)
+        pos = np.arange(0, n - 1, pitch)
+        resampled = np.stack([np.interp(pos, np.arange(n), base[:, c]) for c in range(base.shape[1])], axis=1)
+        smooth = np.stack([np.convolve(resampled[:, c], kernel, mode="same") for c in range(base.shape[1])], axis=1)
+        v = _sound_from_samples(np, (resampled + tone * (resampled - smooth)) * gain)
+        if v is not None:
+            variations.append(v)
+    return variations
+
+
+class SoundBank:
+    """Strike, bell and thunk sounds on reserved mixer channels. Silent when audio is disabled or the mixer is unavailable."""
+
+    def __init__(self, call_later, enabled=True, cache=None):
+        self.call_later = call_later
+        self.key_sounds = []  # strike variations; one is picked per stroke
+        self.bell_sound = None
+        self.thunk_sound = None
+        self.key_voices = []
+        self.bell_channel = None
+        self.thunk_channel = None
+        self._next_voice = 0
+        self._last_variation = -1
+        self._pick = random.Random()
+        if not enabled or not pygame.mixer.get_init():
+            return
+        strike_path = os.path.join(BASE_DIR, "typewriter_click.wav")
+        params = {
+            "mixer": list(pygame.mixer.get_init()),
+            "strike": file_signature(strike_path),
+            "variations": KEY_VARIATIONS,
+            "numpy": _numpy() is not None,
+        }
+        if not self._load_cached(cache, params):
+            self._synthesize(strike_path)
+            if cache is not None and self.key_sounds:
+                cache.store("sounds", "bank", params, pack_blobs(
+                    [s.get_raw() if s else b"" for s in [self.bell_sound, self.thunk_sound] + self.key_sounds]))
+        self._reserve_channels()
+
+    def _synthesize(self, strike_path):
+        strike_sound = None
+        if os.path.isfile(strike_path):
+            try:
+                strike_sound = pygame.mixer.Sound(strike_path)
+            except Exception as e:
+                print("Failed to load typewriter_click.wav:", e)
+        if strike_sound is None:
+            strike_sound = _make_click_sound()
+        if strike_sound is not None:
+            self.key_sounds = _make_variations(strike_sound, KEY_VARIATIONS)
+        self.bell_sound = _make_bell_sound()
+        self.thunk_sound = _make_thunk_sound()
+
+    def _load_cached(self, cache, params):
+        """Take the sounds from the asset cache (raw samples in the mixer's format); False on a miss."""
+        data = cache.load("sounds", "bank", params) if cache is not None else None
+        if data is None:
+            return False
+        try:
+            sounds = [pygame.mixer.Sound(buffer=blob) if blob else None for blob in unpack_blobs(data)]
+        except Exception:
+            return False
+        if len(sounds) < 3:
+            return False
+        self.bell_sound, self.thunk_sound = sounds[:2]
+        self.key_sounds = [s for s in sounds[2:] if s is not None]
+        return True
+
+    def _reserve_channels(self):
+        reserved = KEY_VOICES + 2
+        if pygame.mixer.get_num_channels() < reserved + SPARE_CHANNELS:
+            pygame.mixer.set_num_channels(reserved + SPARE_CHANNELS)
+        pygame.mixer.set_reserved(reserved)
+        channels = [pygame.mixer.Channel(i) for i in range(reserved)]
+        self.key_voices = channels[:KEY_VOICES]
+        self.bell_channel, self.thunk_channel = channels[KEY_VOICES:]
+        for ch in self.key_voices:
+            ch.set_volume(KEY_VOL)
+        self.bell_channel.set_volume(BELL_VOL)
+        self.thunk_channel.set_volume(THUNK_VOL)
+
+    def play_key(self):
+        """Play a strike variation (never the same one twice in a row) on the next free key voice."""
+        sounds = self.key_sounds
+        if not sounds or not self.key_voices:
+            return
+        i = self._pick.randrange(len(sounds))
+        if i == self._last_variation and len(sounds) > 1:
+            i = (i + 1) % len(sounds)
+        self._last_variation = i
+        voices = self.key_voices
+        start = self._next_voice
+        for k in range(len(voices)):
+            if not voices[(start + k) % len(voices)].get_busy():
+                break
+        else:
+            k = 0  # every voice busy: take over the one that started longest ago
+        self._next_voice = (start + k + 1) % len(voices)
         try:
-            pygame.event.post(ev)
+            voices[(start + k) % len(voices)].play(sounds[i])
         except Exception:
             pass
 
+    def play_bell(self):
+        if self.bell_sound and self.bell_channel:
+            try:
+                self.bell_channel.play(self.bell_sound)
+                return
+            except Exception:
+                pass
+        self.play_key()
+
+    def play_thunk(self):
+        if self.thunk_sound and self.thunk_channel:
+            try:
+                self.thunk_channel.play(self.thunk_sound)
+                return
+            except Exception:
+                pass
+        # no thunk sound: a double click, the second one scheduled rather than waited for
+        self.play_key()
+        self.call_later(30, self.play_key)
+
+
+# ---------- ink stamp atlas ----------
+# Every glyph on the page is one of a small set of "ink stamps": a character rendered at some
+# darkness together with its ghost halo. Rendering one costs two font.render calls and seven blits,
+# so each (char, quantized darkness) stamp is rasterized once and reused by draw() and the PNG export.
+INK_LEVELS = 32  # darkness is quantized to this many steps before lookup
+STAMP_CACHE_SIZE = 2048  # bounded LRU; a page rarely uses more than a few hundred stamps
+GHOST_OFFSETS = [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (1, 1)]
+GHOST_ALPHA = 0.35  # the halo's opacity relative to the glyph's
+
+
+def ink_level(darkness):
+    """The quantized darkness level (0 .. INK_LEVELS - 1) a glyph is drawn at."""
+    return int(round(max(0.0, min(1.0, darkness)) * (INK_LEVELS - 1)))
+
+
+def ink_alpha(level):
+    """Opacity (0-255) of a glyph's ink at a darkness level."""
+    return int(80 + 175 * level / (INK_LEVELS - 1))
+
+
+class InkAtlas:
+    def __init__(self, font, max_entries=STAMP_CACHE_SIZE, scale=1.0):
+        self._font = font  # a Font, or a () -> Font loader called when the first stamp is rasterized
+        self.max_entries = max_entries
+        self.ghost_offsets = [(round(ox * scale), round(oy * scale)) for ox, oy in GHOST_OFFSETS]
+        self.stamps = OrderedDict()  # (char, level) -> SRCALPHA surface
+        self.hits = self.misses = 0
+
+    @property
+    def font(self):
+        if callable(self._font):
+            self._font = self._font()
+        return self._font
+
+    def pack(self):
+        """Every cached stamp as bytes (an index plus raw RGBA pixels), oldest first, for AssetCache."""
+        index, pixels = [], []
+        for (ch, level), stamp in self.stamps.items():
+            index.append([ch, level, stamp.get_width(), stamp.get_height()])
+            pixels.append(_image_tobytes(stamp, "RGBA"))
+        return pack_blobs([json.dumps(index).encode("utf-8"), b"".join(pixels)])
+
+    def preload(self, data):
+        """Add the stamps of a pack() without rasterizing them; returns how many were added."""
+        blobs = unpack_blobs(data)
+        index, pixels = json.loads(blobs[0]), blobs[1]
+        pos = 0
+        for ch, level, w, h in index:
+            n = w * h * 4
+            if pos + n > len(pixels):
+                raise ValueError("truncated stamp pack")
+            self.stamps[(ch, level)] = _image_frombytes(pixels[pos:pos + n], (w, h), "RGBA")
+            pos += n
+        while len(self.stamps) > self.max_entries:
+            self.stamps.popitem(last=False)
+        return len(index)
+
+    def _render(self, ch, level):
+        alpha = ink_alpha(level)
+        text_surf = self.font.render(ch, True, (0, 0, 0))
+        stamp = pygame.Surface(text_surf.get_size(), pygame.SRCALPHA)
+        text_surf.set_alpha(alpha)
+        stamp.blit(text_surf, (0, 0))
+        # the ghost is the same rendering at reduced alpha, smeared one pixel around the glyph
+        text_surf.set_alpha(int(alpha * GHOST_ALPHA))
+        for ox, oy in self.ghost_offsets:
+            stamp.blit(text_surf, (ox, oy))
+        return stamp
+
+    def get(self, ch, darkness):
+        """Return the cached ink stamp (glyph + ghost halo) for ch at the given darkness."""
+        key = (ch, ink_level(darkness))
+        stamp = self.stamps.get(key)
+        if stamp is not None:
+            self.hits += 1
+            self.stamps.move_to_end(key)
+            return stamp
+        self.misses += 1
+        stamp = self._render(*key)
+        self.stamps[key] = stamp
+        if len(self.stamps) > self.max_entries:
+            self.stamps.popitem(last=False)
+        return stamp
+
+
+# ---------- typecase ----------
+# The typecase holds an InkAtlas per typeball. Every ball's stamps are drawn from the default ball's
+# top-left, moved down or up so the baselines line up, on the default ball's character pitch. Switching
+# to a ball must not stall typing, so the balls the user may switch to next are warmed on a worker
+# thread: it opens the font, measures it and rasterizes (or reads back from the asset cache) the stamps
+# of printable ASCII at the darkness fresh strikes land on; the main loop takes the warmed atlas when
+# the ball is first drawn. A ball drawn before its warm-up is done opens right away and has the warmed
+# stamps added between frames. Only TYPECASE_SIZE balls are kept: the one drawn least recently goes,
+# its new stamps written to the asset cache by the worker.
+TYPECASE_SIZE = 8
+WARM_CHARS = [chr(c) for c in range(32, 127)]
+WARM_LEVELS = range(round(0.6 * (INK_LEVELS - 1)), INK_LEVELS)  # fresh strikes are 0.6-0.95 dark, overstrikes darker
+
+
+class Typecase:
+    """The ink atlases and metrics of the typeballs in use; scale is > 1 for print resolution."""
+
+    def __init__(self, cache=None, scale=1.0, max_faces=TYPECASE_SIZE):
+        self.cache = cache  # AssetCache for metrics and stamps, or None
+        self.scale = scale
+        self.max_faces = max_faces
+        self.atlases = OrderedDict()  # face -> InkAtlas, least recently drawn first
+        self.metrics = {}  # face -> {"char_width", "ascent"}
+        self.shifts = {}  # face -> px its stamps are drawn below the default ball's
+        self.evicted_hits = self.evicted_misses = 0
+        self._face = self._atlas = None  # the ball drawn last, reused without touching the LRU order
+        self._shift = 0
+        self._lock = threading.Lock()
+        self._tasks = deque()  # (face, None) to warm a ball up, (face, atlas) to cache an evicted one
+        self._working = False
+        self._worker = None
+        self._closing = False
+        self._warming = set()  # faces queued for a warm-up or being warmed up
+        self._warmed = {}  # face -> InkAtlas a warm-up finished
+
+    # fonts, metrics and cached stamps
+    def _loader(self, face):
+        name, size = typeball_file(face), max(1, round(TYPEBALLS[face][1] * self.scale))
+        return lambda: load_font(name, size)
+
+    def _cache_key(self, face, kind):
+        name, size = TYPEBALLS[face]
+        params = {"font": file_signature(resolve_asset(name)), "size": size}
+        if kind == "stamps":
+            params.update(levels=INK_LEVELS, ghost=GHOST_OFFSETS)
+        # entries of one name replace each other, so every size but the default gets its own
+        return kind, name if size == FONT_SIZE else f"{name}@{size}", params
+
+    def _measure(self, face, font):
+        """Metrics of a ball; font is a Font or a () -> Font, only called when they are not cached."""
+        cache = self.cache if self.scale == 1.0 else None
+        data = cache.load(*self._cache_key(face, "metrics")) if cache is not None else None
+        if data is not None:
+            try:
+                metrics = json.loads(data)
+                if "ascent" in metrics:
+                    return metrics
+            except ValueError:
+                pass
+        font = font() if callable(font) else font
+        metrics = {"char_width": font.size("M")[0], "ascent": font.get_ascent()}
+        if cache is not None:
+            cache.store(*self._cache_key(face, "metrics"), json.dumps(metrics).encode("utf-8"))
+        return metrics
+
+    def face_metrics(self, face):
+        metrics = self.metrics.get(face)
+        if metrics is None:
+            atlas = self.atlases.get(face)
+            metrics = self.metrics[face] = self._measure(face, (lambda: atlas.font) if atlas else self._loader(face))
+        return metrics
+
+    def _new_atlas(self, face):
+        """An atlas of a ball holding its cached stamps; its font is opened when a stamp is missing."""
+        atlas = InkAtlas(self._loader(face), scale=self.scale)
+        if self.cache is not None and self.scale == 1.0:
+            data = self.cache.load(*self._cache_key(face, "stamps"))
+            if data is not None:
+                try:
+                    atlas.preload(data)
+                except (ValueError, IndexError, struct.error, pygame.error):
+                    atlas.stamps.clear()
+        return atlas
+
+    def _store(self, face, atlas):
+        if self.cache is not None and self.scale == 1.0 and atlas.misses:
+            self.cache.store(*self._cache_key(face, "stamps"), atlas.pack())
+            atlas.misses = 0
+
+    def store_stamps(self):
+        """Write the new stamps of every ball in the case, or warmed for it, to the asset cache."""
+        for face, atlas in list(self.atlases.items()) + list(self._warmed.items()):
+            self._store(face, atlas)
+
+    # drawing
+    def atlas(self, face):
+        """The atlas of a ball, taken into the case if it is not there yet."""
+        atlas = self.atlases.get(face)
+        if atlas is not None:
+            self.atlases.move_to_end(face)
+            return atlas
+        atlas = self._warmed.pop(face, None) or self._new_atlas(face)
+        self.atlases[face] = atlas
+        self.shifts[face] = round(self.face_metrics(0)["ascent"] - self.face_metrics(face)["ascent"])
+        while len(self.atlases) > self.max_faces:
+            old, evicted = self.atlases.popitem(last=False)
+            self.evicted_hits += evicted.hits
+            self.evicted_misses += evicted.misses
+            if old == self._face:
+                self._face = self._atlas = None
+            if evicted.misses and self.cache is not None:
+                self._submit(old, evicted)
+        return atlas
+
+    def blit(self, surface, ch, darkness, face, x, y):
+        """Blit the ink stamp of ch in ball `face`, placed as the default ball's would be at (x, y)."""
+        if face != self._face:
+            self._atlas = self.atlas(face)
+            self._face, self._shift = face, self.shifts[face]
+        surface.blit(self._atlas.get(ch, darkness), (x, y + self._shift))
+
+    @property
+    def hits(self):
+        return self.evicted_hits + sum(atlas.hits for atlas in self.atlases.values())
+
+    @property
+    def misses(self):
+        return self.evicted_misses + sum(atlas.misses for atlas in self.atlases.values())
+
+    # warm-up
+    def warm(self, faces):
+        """Get balls ready on the worker thread before they are drawn."""
+        for face in faces:
+            if face not in self.atlases and face not in self._warmed and face not in self._warming:
+                self._warming.add(face)
+                self._submit(face, None)
+
+    def _submit(self, face, atlas):
+        with self._lock:
+            self._tasks.append((face, atlas))
+            if self._working:
+                return
+            self._working = True
+            self._worker = threading.Thread(target=self._work, name="typecase", daemon=True)
+        self._worker.start()
+
+    def _work(self):
+        while True:
+            with self._lock:
+                if not self._tasks:
+                    self._working = False
+                    return
+                face, atlas = self._tasks.popleft()
+            try:
+                if atlas is not None:
+                    self._store(face, atlas)
+                else:
+                    self._warm_up(face)
+            except Exception as e:
+                print("Could not load typeball", typeball_label(face) + ":", e)
+            finally:
+                if atlas is None:
+                    self._warming.discard(face)
+
+    def _warm_up(self, face):
+        atlas = self._new_atlas(face)
+        metrics = self._measure(face, lambda: atlas.font)
+        for level in WARM_LEVELS:
+            for ch in WARM_CHARS:
+                if self._closing:
+                    return
+                if (ch, level) not in atlas.stamps:
+                    atlas.get(ch, level / (INK_LEVELS - 1))
+                    time.sleep(0)  # hand the interpreter back to the main loop between stamps
+        self.metrics.setdefault(face, metrics)
+        self._warmed[face] = atlas
+
+    def close(self):
+        """Give up on warm-ups still running and finish writing evicted balls to the asset cache."""
+        with self._lock:
+            self._closing = True
+            self._tasks = deque(task for task in self._tasks if task[1] is not None)
+            worker = self._worker
+        if worker is not None:
+            worker.join()
+        self.store_stamps()
+
+    def poll(self):
+        """Between frames: add warmed stamps to balls that were opened before their warm-up finished,
+        and keep only the most recent few warmed balls nobody has drawn yet."""
+        if not self._warmed:
+            return
+        for face in list(self._warmed):
+            atlas = self.atlases.get(face)
+            if atlas is not None:
+                for key, stamp in self._warmed.pop(face).stamps.items():
+                    atlas.stamps.setdefault(key, stamp)
+                while len(atlas.stamps) > atlas.max_entries:
+                    atlas.stamps.popitem(last=False)
+        for face in list(self._warmed)[:-self.max_faces]:
+            del self._warmed[face]
+
+
+# ---------- animation scheduler ----------
+# Carriage and paper-feed animations are time-based tweens advanced once per frame by the main loop,
+# so input keeps being processed while the page moves. Each animated property has at most one tween;
+# starting a new one retargets it from wherever the property currently is.
+class Tween:
+    __slots__ = ('setter', 'start', 'end', 'start_ms', 'duration_ms', 'steps', 'on_done')
+
+    def __init__(self, setter, start, end, start_ms, duration_ms, steps=0, on_done=None):
+        self.setter = setter
+        self.start = start
+        self.end = end
+        self.start_ms = start_ms
+        self.duration_ms = duration_ms
+        self.steps = steps  # >0: blocky, jumps a 1/steps of the way every duration_ms/steps; 0: ease-out
+        self.on_done = on_done
+
+    def value_at(self, now):
+        elapsed = min(max(now - self.start_ms, 0), self.duration_ms)  # a clock behind start_ms must not overshoot
+        if self.steps:
+            frac = min(self.steps, elapsed * self.steps // max(1, self.duration_ms) + 1) / self.steps
+        else:
+            frac = elapsed / max(1, self.duration_ms)
+            frac = 1 - (1 - frac) * (1 - frac)  # ease-out
+        return self.start + (self.end - self.start) * frac
+
+    def done_at(self, now):
+        return now - self.start_ms >= self.duration_ms
+
+
+class Animator:
+    def __init__(self, ticks):
+        self.ticks = ticks  # () -> milliseconds
+        self.tweens = {}  # property name ('view', 'scroll') -> Tween
+        self.timers = []  # heap of (due_ms, seq, fn) for delayed one-shot callbacks
+        self._timer_seq = 0
+        self.probe = None  # FrameProbe timing each tween step and the timers, when instrumentation is on
+
+    def start(self, name, setter, start, end, duration_ms, steps=0, on_done=None):
+        now = self.ticks()
+        tween = Tween(setter, start, end, now, duration_ms, steps, on_done)
+        self.tweens[name] = tween
+        setter(tween.value_at(now))
+
+    def cancel(self, name):
+        return self.tweens.pop(name, None)
+
+    def finish(self, name):
+        """Jump a running tween to its end value and run its completion callback."""
+        tween = self.tweens.pop(name, None)
+        if tween is not None:
+            tween.setter(tween.end)
+            if tween.on_done:
+                tween.on_done()
+
+    def call_later(self, delay_ms, fn):
+        self._timer_seq += 1
+        heapq.heappush(self.timers, (self.ticks() + delay_ms, self._timer_seq, fn))
+
+    def update(self, now):
+        """Advance every tween and fire due timers; called once per frame from the main loop."""
+        probe = self.probe
+        for name, tween in list(self.tweens.items()):
+            t0 = time.perf_counter() if probe else 0.0
+            if tween.done_at(now):
+                self.finish(name)
+            else:
+                tween.setter(tween.value_at(now))
+            if probe:
+                probe.add('anim:' + name, time.perf_counter() - t0)
+        if self.timers and self.timers[0][0] <= now:
+            t0 = time.perf_counter() if probe else 0.0
+            while self.timers and self.timers[0][0] <= now:
+                heapq.heappop(self.timers)[2]()
+            if probe:
+                probe.add('anim:timers', time.perf_counter() - t0)
+
+    def finish_all(self):
+        """Land every tween and fire every pending timer right away (headless/batch use)."""
+        while self.tweens or self.timers:
+            for name in list(self.tweens):
+                self.finish(name)
+            while self.timers:
+                heapq.heappop(self.timers)[2]()
+
+
+# ---------- baked paper layer ----------
+# Finalized glyphs are composited into per-row ink strips when their key is released.
+# The strips for the visible rows are composed into one paper surface, which is only rebuilt when the
+# paper scrolls or ink lands on it; a frame is then one blit plus the glyph whose key is held.
+# Strips are a bounded cache: a row scrolled far out of view is dropped and rebuilt from the
+# document the next time it is needed, so memory does not grow with the length of the page.
+ROW_BLEED = 4  # px kept above/below each strip so jitter and ghost halos are not clipped
+ROW_CACHE_SIZE = visible_rows * 4
+PAPER_BAND = pygame.Rect(0, PAPER_Y, W, PAPER_H)
+
+
+def is_drawable_char(ch):
+    return isinstance(ch, str) and len(ch) == 1 and (ch == ' ' or ch.isprintable())
+
+
+class PaperLayer:
+    def __init__(self, typecase, char_width, doc, max_rows=ROW_CACHE_SIZE):
+        self.typecase = typecase
+        self.char_width = char_width
+        self.doc = doc
+        self.max_rows = max_rows
+        self.row_layers = OrderedDict()  # row -> SRCALPHA strip holding every baked glyph of that row
+        self.surface = pygame.Surface((PAPER_W, PAPER_H))
+        self.surface_key = None  # (paper_scroll, scroll offset px, ink_version) surface was composed for
+        self.ink_version = 0
+        self.row_versions = {}  # row -> ink_version of its last change since the last reset
+        self.reset_version = 0
+        self.row_hits = self.row_misses = 0  # strip lookups of non-blank rows
+        self.compose_hits = self.compose_misses = 0
+
+    def _blit_glyph_into(self, layer, g):
+        ch = g.char
+        if not is_drawable_char(ch):
+            return
+        x = LEFT_MARGIN + g.col * self.char_width + g.offset_x
+        y = ROW_BLEED + g.offset_y
+        self.typecase.blit(layer, ch, g.darkness, g.face, x, y)
+
+    def row_layer(self, row):
+        """The ink strip of a row, built from the document on first use; None for a blank row."""
+        layer = self.row_layers.get(row)
+        if layer is not None:
+            self.row_hits += 1
+            self.row_layers.move_to_end(row)
+            return layer
+        if not self.doc.has_row(row):
+            return None
+        self.row_misses += 1
+        layer = pygame.Surface((PAPER_W, LINE_HEIGHT + 2 * ROW_BLEED), pygame.SRCALPHA)
+        for g in self.doc.iter_row_glyphs(row):
+            if not g.pending:
+                self._blit_glyph_into(layer, g)
+        self.row_layers[row] = layer
+        if len(self.row_layers) > self.max_rows:
+            self.row_layers.popitem(last=False)
+        return layer
+
+    def bake(self, g):
+        """Composite a finalized glyph into its row strip (called once, when its key is released)."""
+        layer = self.row_layers.get(g.row)
+        if layer is not None:
+            self._blit_glyph_into(layer, g)
+        # a row without a cached strip picks the glyph up when the strip is built
+        self.ink_version += 1
+        self.row_versions[g.row] = self.ink_version
+
+    def rebake_row(self, row):
+        """Rebuild one row strip from scratch, e.g. after editor-mode backspace removed ink."""
+        self.row_layers.pop(row, None)
+        self.ink_version += 1
+        self.row_versions[row] = self.ink_version
+
+    def reset(self):
+        """Drop every strip; they are rebuilt from the document as rows come into view (new page, clear, open)."""
+        self.row_layers.clear()
+        self.ink_version += 1
+        self.row_versions.clear()
+        self.reset_version = self.ink_version
+
+    def row_version(self, row):
+        """Changes whenever the ink of `row` does, so anything derived from a row can tell it is stale."""
+        return max(self.row_versions.get(row, 0), self.reset_version)
+
+    def compose(self, paper_scroll, paper_scroll_offset_px):
+        key = (paper_scroll, int(paper_scroll_offset_px), self.ink_version)
+        if key == self.surface_key:
+            self.compose_hits += 1
+            return self.surface
+        self.compose_misses += 1
+        self.surface_key = key
+        self.surface.fill(PAPER_COLOR)
+        # rows scrolling in/out during a vertical feed are included, the rest is clipped by the surface
+        shift = -paper_scroll_offset_px / LINE_HEIGHT
+        first_row = max(0, paper_scroll + math.floor(shift))
+        last_row = paper_scroll + math.ceil(shift) + visible_rows - 1
+        for row in range(first_row, last_row + 1):
+            layer = self.row_layer(row)
+            if layer is not None:
+                y = (row - paper_scroll) * LINE_HEIGHT + int(paper_scroll_offset_px) - ROW_BLEED
+                self.surface.blit(layer, (0, y))
+        return self.surface
+
+
+# ---------- manuscript overview ----------
+# F2 shows every page side by side, zoomed out, with the saved pages first and the current page last.
+# Each row is drawn from small tiles. The finest level is scaled down once from the row's ink, and
+# every coarser level is scaled down from the level above it (a mip chain). Tiles are cached with the
+# version of the row they came from, so new ink replaces only the tiles of the rows it touched.
+# Scrolling or zooming the overview blits cached tiles without touching a glyph.
+OVERVIEW_LEVELS = 4  # zoom levels 1:2, 1:4, 1:8 and 1:16
+OVERVIEW_START_LEVEL = 2
+OVERVIEW_GAP = 24  # px between thumbnails
+OVERVIEW_LABEL_H = 20
+OVERVIEW_CACHE_BYTES = 48 << 20  # tile cache budget
+OVERVIEW_BLANK_BYTES = 64  # what a cached blank row counts against the budget
+OVERVIEW_BG = (52, 52, 52)
+
+
+class Overview:
+    """Zoomed-out thumbnails of every page, composed from cached mipmapped row tiles."""
+
+    def __init__(self, typecase, char_width, max_bytes=OVERVIEW_CACHE_BYTES):
+        self.typecase = typecase
+        self.char_width = char_width
+        self.max_bytes = max_bytes
+        # (page, row, level) -> (row version, Surface or None for a blank row); a saved page is keyed by
+        # its PageStore entry, the current page by None
+        self.tiles = OrderedDict()
+        self.tile_bytes = 0
+        self.tile_hits = self.tile_misses = 0
+        self.heights = {}  # PageStore entry -> rows of that saved page
+        self.entries = ()  # the saved pages laid out
+        self.level = OVERVIEW_START_LEVEL
+        self.scroll_y = 0
+        self.page_rows = []  # rows shown per page (saved pages, then the current one)
+        self.rects = []  # thumbnail of each page, in overview coordinates
+        self.content_h = 0
+        self.surface = pygame.Surface((W, PAPER_H))
+        self.surface_key = None
+
+    @staticmethod
+    def tile_size(level):
+        f = 2 << level
+        return max(1, PAPER_W // f), max(1, LINE_HEIGHT // f)
+
+    def _row_image(self, glyphs):
+        """A row at full size on opaque paper, from (char, col, offset_x, offset_y, darkness, face) tuples."""
+        image = pygame.Surface((PAPER_W, LINE_HEIGHT))
+        image.fill(PAPER_COLOR)
+        typecase = self.typecase
+        for ch, col, ox, oy, darkness, face in glyphs:
+            if is_drawable_char(ch):
+                typecase.blit(image, ch, darkness, face, LEFT_MARGIN + col * self.char_width + ox, oy)
+        return image
+
+    def tile(self, page, row, level, version, source):
+        """The tile of one row at one level; source(row) gives the row's glyph tuples, or None if blank."""
+        key = (page, row, level)
+        entry = self.tiles.get(key)
+        if entry is not None and entry[0] == version:
+            self.tile_hits += 1
+            self.tiles.move_to_end(key)
+            return entry[1]
+        self.tile_misses += 1
+        if level == 0:
+            glyphs = source(row)
+            finer = self._row_image(glyphs) if glyphs else None
+        else:
+            finer = self.tile(page, row, level - 1, version, source)
+        tile = pygame.transform.smoothscale(finer, self.tile_size(level)) if finer is not None else None
+        if entry is not None:
+            self.tile_bytes -= self._bytes(entry[1])
+        self.tiles[key] = (version, tile)
+        self.tiles.move_to_end(key)
+        self.tile_bytes += self._bytes(tile)
+        while self.tile_bytes > self.max_bytes and len(self.tiles) > 1:
+            _, (_, old) = self.tiles.popitem(last=False)
+            self.tile_bytes -= self._bytes(old)
+        return tile
+
+    @staticmethod
+    def _bytes(tile):
+        return OVERVIEW_BLANK_BYTES if tile is None else tile.get_width() * tile.get_height() * tile.get_bytesize()
+
+    def _sync_store(self, store):
+        """Follow the saved pages, measuring the ones not seen before."""
+        self.entries = tuple(store.entries)
+        for entry in self.entries:
+            if entry not in self.heights:
+                self.heights[entry] = store.load(entry).max_row + 1
+        return [self.heights[entry] for entry in self.entries]
+
+    def layout(self, page_rows):
+        """Place the thumbnails left to right in a centred grid; sets rects and content_h."""
+        self.page_rows = page_rows
+        tw, pitch = self.tile_size(self.level)
+        cols = max(1, (W - OVERVIEW_GAP) // (tw + OVERVIEW_GAP))
+        left = (W - min(cols, len(page_rows)) * (tw + OVERVIEW_GAP) + OVERVIEW_GAP) // 2
+        self.rects = []
+        y = OVERVIEW_GAP
+        for start in range(0, len(page_rows), cols):
+            heights = [max(rows, visible_rows) * pitch for rows in page_rows[start:start + cols]]
+            for j, h in enumerate(heights):
+                self.rects.append(pygame.Rect(left + j * (tw + OVERVIEW_GAP), y + OVERVIEW_LABEL_H, tw, h))
+            y += OVERVIEW_LABEL_H + max(heights) + OVERVIEW_GAP
+        self.content_h = y
+        self.scroll_by(0)
+
+    def scroll_by(self, dy):
+        self.scroll_y = max(0, min(self.content_h - PAPER_H, self.scroll_y + dy))
+
+    def scroll_to(self, page, row):
+        """Scroll so `row` of `page` is in the middle of the band."""
+        if page < len(self.rects):
+            self.scroll_y = self.rects[page].y + row * self.tile_size(self.level)[1] - PAPER_H // 2
+            self.scroll_by(0)
+
+    def hit(self, x, y):
+        """(page, row) under the band coordinates (x, y), or None."""
+        y += self.scroll_y
+        pitch = self.tile_size(self.level)[1]
+        for page, rect in enumerate(self.rects):
+            if rect.collidepoint(x, y):
+                return page, min((y - rect.y) // pitch, max(self.page_rows[page] - 1, 0))
+        return None
 
-# Smooth vertical feed (unchanged)
-def animate_paper_scroll_to(target_scroll, duration_ms=260):
-    global animating, paper_scroll, paper_scroll_offset_px, animation_cancel
-    if target_scroll < 0:
-        target_scroll = 0
-    animating = True
-    animation_cancel = False
-    local_buffer = []
-    start_scroll = paper_scroll
-    delta_rows = target_scroll - start_scroll
-    start_offset = 0.0
-    end_offset = -delta_rows * LINE_HEIGHT
-    start_time = pygame.time.get_ticks()
-    end_time = start_time + duration_ms
-    while True:
-        now = pygame.time.get_ticks()
-        if now >= end_time or animation_cancel:
-            paper_scroll_offset_px = 0.0
-            paper_scroll = target_scroll
-            draw()
-            pygame.display.flip()
-            break
-        frac = (now - start_time) / max(1, (end_time - start_time))
-        frac = 1 - (1 - frac) * (1 - frac)
-        paper_scroll_offset_px = start_offset + (end_offset - start_offset) * frac
-        for iev in pygame.event.get():
-            if iev.type == pygame.QUIT:
-                animation_cancel = True
-                pygame.event.post(iev)
+    def show(self, store, current_rows, row):
+        """Lay out the pages and scroll to `row` of the current page."""
+        self.layout(self._sync_store(store) + [current_rows])
+        self.scroll_to(len(self.rects) - 1, row)
+
+    def zoom(self, step, focus=None):
+        """Change level by step (positive = further out), keeping focus, a (page, row), in the middle of
+        the band; by default the row already there."""
+        if focus is None:
+            focus = self.hit(W // 2, PAPER_H // 2) or self._nearest(PAPER_H // 2)
+        self.level = max(0, min(OVERVIEW_LEVELS - 1, self.level + step))
+        self.layout(self.page_rows)
+        if focus is not None:
+            self.scroll_to(*focus)
+
+    def _nearest(self, y):
+        y += self.scroll_y
+        pitch = self.tile_size(self.level)[1]
+        for page, rect in enumerate(self.rects):
+            if rect.y <= y < rect.bottom + OVERVIEW_GAP:
+                return page, max(0, min((y - rect.y) // pitch, self.page_rows[page] - 1))
+        return None
+
+    def compose(self, store, doc, paper, current_rows, paper_scroll, cursor_row, font, mark=None):
+        """The overview band for the given pages, recomposed only when the view or the ink changed.
+
+        mark, a (page, row, col, length) span, is outlined (the find match being shown).
+        """
+        page_rows = self._sync_store(store) + [current_rows]
+        if page_rows != self.page_rows:
+            self.layout(page_rows)
+        key = (self.level, self.scroll_y, self.entries, current_rows, paper.ink_version, paper_scroll, cursor_row, mark)
+        if key == self.surface_key:
+            return self.surface
+        self.surface_key = key
+        surface = self.surface
+        surface.fill(OVERVIEW_BG)
+        pitch = self.tile_size(self.level)[1]
+        current = len(self.rects) - 1
+        for page, rect in enumerate(self.rects):
+            top = rect.y - self.scroll_y
+            if top - OVERVIEW_LABEL_H >= PAPER_H or top + rect.height <= 0:
+                continue
+            label = f"Page {page + 1}" + (" (current)" if page == current else "")
+            surface.blit(font.render(label, True, (200, 200, 200)), (rect.x, top - OVERVIEW_LABEL_H + 2))
+            surface.fill(PAPER_COLOR, (rect.x, top, rect.width, rect.height))
+            if page == current:
+                entry, version, source = None, paper.row_version, self._doc_source(doc)
             else:
-                local_buffer.append(iev)
-        draw()
-        pygame.display.flip()
-        clock.tick(60)
-    paper_scroll_offset_px = 0.0
-    paper_scroll = target_scroll
-    animating = False
-    animation_cancel = False
-    for ev in local_buffer:
-        try:
-            pygame.event.post(ev)
-        except Exception:
-            pass
+                entry = self.entries[page]
+                version, source = (lambda row: 0), self._table_source(store, entry)
+            first = max(0, -top // pitch)
+            last = min(self.page_rows[page], (PAPER_H - top) // pitch + 1)
+            for row in range(first, last):
+                tile = self.tile(entry, row, self.level, version(row), source)
+                if tile is not None:
+                    surface.blit(tile, (rect.x, top + row * pitch))
+            if page == current:
+                # the part of the page on screen, and the carriage's row
+                view = pygame.Rect(rect.x - 2, top + paper_scroll * pitch - 1, rect.width + 4, visible_rows * pitch + 2)
+                pygame.draw.rect(surface, (90, 110, 200), view, 2)
+                y = top + cursor_row * pitch + pitch // 2
+                pygame.draw.line(surface, (220, 20, 20), (rect.x - 8, y), (rect.x - 3, y), 2)
+            if mark is not None and mark[0] == page:
+                _, row, col, length = mark
+                f = 2 << self.level
+                x = rect.x + (LEFT_MARGIN + col * self.char_width) // f
+                pygame.draw.rect(surface, FIND_MARK_COLOR,
+                                 (x - 2, top + row * pitch - 2, length * self.char_width // f + 4, pitch + 4), 2)
+        return surface
+
+    @staticmethod
+    def _doc_source(doc):
+        def source(row):
+            if not doc.has_row(row):
+                return None
+            return [(g.char, g.col, g.offset_x, g.offset_y, g.darkness, g.face)
+                    for g in doc.peek_row_glyphs(row) if not g.pending]
+        return source
+
+    @staticmethod
+    def _table_source(store, entry):
+        table = None  # the page is read from the store on the first tile that needs it
+
+        def source(row):
+            nonlocal table
+            if table is None:
+                table = store.load(entry)
+            return [(chr(table.chars[i]), table.cols[i], table.offset_x[i], table.offset_y[i], table.darkness[i],
+                     table.faces[i]) for i in table.index_range(row, row)]
+        return source
+
+
+# ---------- find ----------
+# Ctrl+F searches the ink of every page. Each page is indexed as the text of its rows by the stamp_line
+# rule (a cell struck more than once reads as '□'), joined into one lower-cased string per page, so a
+# query is a handful of str.find calls. Saved pages never change and are indexed once, the first time
+# they are searched. The current page follows PaperLayer's row versions: only rows whose ink changed
+# since the last query (new glyphs, editor-mode removals) are read again.
+FIND_MAX_HITS = 10000
+FIND_MARK_COLOR = (230, 170, 40)
+
+
+class PageText:
+    """One page's rows as a single lower-cased string, with where each row starts in it."""
+    __slots__ = ('text', 'row_ids', 'starts')
+
+    def __init__(self, rows):
+        """rows: (row, text) in row order; blank rows may be left out."""
+        self.row_ids = []
+        self.starts = []
+        parts = []
+        pos = 0
+        for row, line in rows:
+            folded = line.lower()
+            if len(folded) == len(line):  # keep columns lined up; such a row is matched case-sensitively
+                line = folded
+            self.row_ids.append(row)
+            self.starts.append(pos)
+            parts.append(line)
+            pos += len(line) + 1
+        self.text = "\n".join(parts)
+
+    def find(self, query, limit):
+        """(row, col) of up to limit matches of a lower-cased query, in reading order."""
+        hits = []
+        text, starts = self.text, self.starts
+        pos = text.find(query)
+        while pos >= 0 and len(hits) < limit:
+            i = bisect.bisect_right(starts, pos) - 1
+            hits.append((self.row_ids[i], pos - starts[i]))
+            pos = text.find(query, pos + 1)
+        return hits
+
+
+class FindIndex:
+    """Row text of the saved pages and the current page, kept up to date for searching."""
+    # saved pages are keyed by their PageStore entry, so pages taken off by undo and put back keep theirs
+
+    def __init__(self):
+        self.saved = {}  # PageStore entry -> PageText of that saved page, built on first search
+        self.rows = {}  # current page: row -> text of its non-blank rows
+        self.reset_version = None  # PaperLayer.reset_version the rows were read after
+        self.synced = 0  # PaperLayer.ink_version the rows are up to date with
+        self.current = None  # PageText of the current page, None when a row changed
+
+    def sync(self, store, doc, paper):
+        for entry in store.entries:
+            if entry not in self.saved:
+                table = store.load(entry)
+                ids, starts = row_index(table.rows)
+                self.saved[entry] = PageText((row, cells_line(table_cells(table, starts[k], starts[k + 1]),
+                                                              doc.cols_per_line))
+                                             for k, row in enumerate(ids))
+        if paper.reset_version != self.reset_version:
+            self.reset_version = paper.reset_version
+            changed = doc.glyph_rows.keys() | doc.lazy_rows.keys()
+            self.rows = {}
+        elif paper.ink_version != self.synced:
+            changed = [row for row, version in paper.row_versions.items() if version > self.synced]
+        else:
+            changed = ()
+        self.synced = paper.ink_version
+        for row in changed:
+            line = doc.row_text(row)
+            if line:
+                self.rows[row] = line
+            else:
+                self.rows.pop(row, None)
+        if changed or self.current is None:
+            self.current = PageText((row, self.rows[row]) for row in sorted(self.rows))
+
+    def find(self, query, store, doc, paper, limit=FIND_MAX_HITS):
+        """(page, row, col) of every match of query, ignoring case; the current page is page len(store)."""
+        self.sync(store, doc, paper)
+        query = query.lower()
+        hits = []
+        if not query:
+            return hits
+        for page, text in enumerate([self.saved[entry] for entry in store.entries] + [self.current]):
+            hits.extend((page, row, col) for row, col in text.find(query, limit - len(hits)))
+            if len(hits) >= limit:
+                break
+        return hits
+
+
+# ---------- undo history ----------
+# Undo, redo and named snapshots keep whole versions of the document. A version maps every row to an
+# immutable chunk (the row's glyphs, or its stamps) in a persistent 32-way trie of tuples. Recording
+# an edit copies only the path down to the rows that changed and shares everything else with the
+# version before, so a step costs O(changed rows) however long the page is. Going back to a version
+# diffs the two tries, skipping the subtrees they share, and rewrites only the rows that differ through
+# the Document, so the paper, the find index and the autosave journal see ordinary row changes.
+UNDO_LIMIT = 500  # undo steps kept
+UNDO_GROUP_MS = 1500  # strikes and editor-mode removals without a pause this long are one undo step
+TRIE_BITS = 5
+TRIE_MASK = (1 << TRIE_BITS) - 1
+TRIE_EMPTY = (None,) * (TRIE_MASK + 1)
+
+
+def _trie_set(node, shift, row, chunk):
+    items = list(node or TRIE_EMPTY)
+    i = (row >> shift) & TRIE_MASK
+    items[i] = chunk if shift == 0 else _trie_set(items[i], shift - TRIE_BITS, row, chunk)
+    return tuple(items)
+
+
+def _trie_grow(node, shift, to_shift):
+    while shift < to_shift:
+        node = None if node is None else (node,) + TRIE_EMPTY[1:]
+        shift += TRIE_BITS
+    return node
+
+
+def _trie_diff(a, b, shift, prefix, out):
+    for i in range(TRIE_MASK + 1):
+        x = a[i] if a is not None else None
+        y = b[i] if b is not None else None
+        if x is not y:
+            if shift == 0:
+                out.append(prefix << TRIE_BITS | i)
+            else:
+                _trie_diff(x, y, shift - TRIE_BITS, prefix << TRIE_BITS | i, out)
 
 
-# ---------- drawing ----------
-COMMAND_BAR_H = 96
-COMMAND_BAR_Y = H - COMMAND_BAR_H
+def _trie_items(node, shift, prefix):
+    for i, child in enumerate(node):
+        if child is not None:
+            if shift == 0:
+                yield prefix << TRIE_BITS | i, child
+            else:
+                yield from _trie_items(child, shift - TRIE_BITS, prefix << TRIE_BITS | i)
+
+
+class RowMap:
+    """An immutable row -> chunk map; set() returns a new map that shares every untouched node."""
+    __slots__ = ('root', 'shift')
+
+    def __init__(self, root=None, shift=0):
+        self.root = root  # None when empty
+        self.shift = shift  # bit shift of the root level; the leaves (shift 0) hold the chunks
+
+    @classmethod
+    def from_items(cls, items):
+        """A map built bottom-up from (row, chunk) pairs, in O(rows)."""
+        level = {}
+        for row, chunk in items:
+            if chunk is not None:
+                level.setdefault(row >> TRIE_BITS, list(TRIE_EMPTY))[row & TRIE_MASK] = chunk
+        if not level:
+            return cls()
+        shift = 0
+        while list(level) != [0]:
+            parents = {}
+            for key, node in level.items():
+                parents.setdefault(key >> TRIE_BITS, list(TRIE_EMPTY))[key & TRIE_MASK] = tuple(node)
+            level = parents
+            shift += TRIE_BITS
+        return cls(tuple(level[0]), shift)
+
+    def get(self, row):
+        node, shift = self.root, self.shift
+        if row < 0 or row >> (shift + TRIE_BITS):
+            return None
+        while node is not None:
+            node = node[(row >> shift) & TRIE_MASK]
+            if shift == 0:
+                return node
+            shift -= TRIE_BITS
+        return None
 
-buttons = [
-    {"label": "CLEAR", "id": "clear"},
-    {"label": "NEW PAGE", "id": "new_page"},
-    {"label": "SAVE AS...", "id": "save_as"},
-    {"label": "OPEN...", "id": "open"},
-    {"label": "EXPORT PNG...", "id": "export_png"},
-    {"label": "TOGGLE EDIT MODE", "id": "toggle_edit"},
-    {"label": "QUIT", "id": "quit"}
-]
-button_rects = []
-
-
-def draw():
-    screen.fill((30, 30, 30))
-
-    # Draw paper rectangle shifted by view_offset_px
-    paper_draw_x = int(PAPER_X + view_offset_px)
-    pygame.draw.rect(screen, PAPER_COLOR, (paper_draw_x, PAPER_Y, PAPER_W, PAPER_H))
-
-    # draw visible glyphs; position relative to paper_draw_x + LEFT_MARGIN
-    min_row = paper_scroll
-    max_row = paper_scroll + visible_rows - 1
-    for g in glyphs:
-        if g['row'] < min_row or g['row'] > max_row:
-            continue
-
-        ch = g.get('char', '')
-        # Skip non-single-printable characters
-        if not (isinstance(ch, str) and len(ch) == 1 and (ch == ' ' or ch.isprintable())):
-            continue
-
-        x = paper_draw_x + LEFT_MARGIN + g['col'] * CHAR_WIDTH + g.get('offset_x', 0)
-        y = PAPER_Y + (g['row'] - paper_scroll) * LINE_HEIGHT + g.get('offset_y', 0) + paper_scroll_offset_px
-        if x + CHAR_WIDTH < paper_draw_x or x > paper_draw_x + PAPER_W:
-            continue
-        text_surf = font.render(g['char'], True, (0, 0, 0))
-        tmp = pygame.Surface(text_surf.get_size(), pygame.SRCALPHA)
-        darkness = max(0.0, min(1.0, g.get('darkness', 1.0)))
-        alpha = int(80 + 175 * darkness)
-        text_surf.set_alpha(alpha)
-        tmp.blit(text_surf, (0, 0))
-        ghost = font.render(g['char'], True, (0, 0, 0))
-        ghost.set_alpha(int(alpha * 0.35))
-        for ox, oy in [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (1, 1)]:
-            tmp.blit(ghost, (ox, oy))
-        screen.blit(tmp, (x, y))
-
-    # draw carriage underline at fixed center X
-    cursor_vis = cursor_row - paper_scroll
-    if 0 <= cursor_vis < visible_rows:
-        line_top = PAPER_Y + cursor_vis * LINE_HEIGHT + paper_scroll_offset_px
-        underline_y = line_top + LINE_HEIGHT - 10  # 3 px above the bottom of the line
-        underline_half_width = CHAR_WIDTH // 2
-        start_x = CARRIAGE_DISPLAY_X - underline_half_width + 7
-        end_x = CARRIAGE_DISPLAY_X + underline_half_width + 5
-        pygame.draw.line(screen, (220, 20, 20), (start_x, underline_y), (end_x, underline_y), 2)
-
-    # command bar
-    pygame.draw.rect(screen, (45, 45, 45), (0, COMMAND_BAR_Y, W, COMMAND_BAR_H))
-    gap = 12
-    pad = 12
-    x = pad
-    y = COMMAND_BAR_Y + 10
-    button_h = COMMAND_BAR_H - 24
-    button_rects.clear()
-    for b in buttons:
-        label = b["label"]
-        text_surf = ui_font.render(label, True, (240, 240, 240))
-        w = max(120, text_surf.get_width() + 28)
-        rect = pygame.Rect(x, y, w, button_h)
-        pygame.draw.rect(screen, (70, 70, 70), rect, border_radius=8)
-        pygame.draw.rect(screen, (90, 90, 90), rect, 2, border_radius=8)
-        tx = x + (w - text_surf.get_width()) // 2
-        ty = y + (button_h - text_surf.get_height()) // 2
-        screen.blit(text_surf, (tx, ty))
-        button_rects.append((rect, b["id"]))
-        x += w + gap
-
-    status = f"Mode: {'AUTHENTIC' if authentic_mode else 'EDITOR'}   Cursor: col {cursor_col} row {cursor_row}   Pages saved: {len(saved_pages)}"
-    s_surf = ui_font.render(status, True, (200, 200, 200))
-    screen.blit(s_surf, (x + 8, COMMAND_BAR_Y + 14))
-
-    if key_locked:
-        label = ui_font.render("Key down: " + (locked_char_display or ""), True, (220, 220, 220))
-        screen.blit(label, (x + 8, COMMAND_BAR_Y + 40))
-
-
-# ---------- document/text helpers & actions ----------
-def build_text_from_stamps():
-    """Build plain-text representation from stamp_history.
-       Rules:
-         - no stamps => space
-         - one stamp  => that char
-         - >1 stamps  => square char '□'
+    def set(self, row, chunk):
+        shift = self.shift
+        while row >> (shift + TRIE_BITS):
+            shift += TRIE_BITS
+        return RowMap(_trie_set(_trie_grow(self.root, self.shift, shift), shift, row, chunk), shift)
+
+    def diff(self, other):
+        """The rows whose chunk is not the same object in other (sorted)."""
+        shift = max(self.shift, other.shift)
+        out = []
+        a, b = _trie_grow(self.root, self.shift, shift), _trie_grow(other.root, other.shift, shift)
+        if a is not b:
+            _trie_diff(a, b, shift, 0, out)
+        return out
+
+    def items(self):
+        return _trie_items(self.root, self.shift, 0) if self.root is not None else iter(())
+
+
+class TableSpan:
+    """A row chunk that is still a span of an immutable table: a GlyphTable, or the stamp columns."""
+    __slots__ = ('table', 'start', 'end')
+
+    def __init__(self, table, start, end):
+        self.table = table
+        self.start = start
+        self.end = end
+
+
+def glyph_chunk(doc, row):
+    """The glyphs of a row as a chunk: (char, col, offset_x, offset_y, darkness, face) in strike order."""
+    span = doc.lazy_rows.get(row)
+    if span is not None:
+        return TableSpan(doc.lazy_table, *span)
+    cells = doc.glyph_rows.get(row)
+    if not cells:
+        return None
+    return tuple((g.char, g.col, g.offset_x, g.offset_y, g.darkness, g.face) for cell in cells.values() for g in cell)
+
+
+def chunk_glyphs(row, chunk):
+    if chunk is None:
+        return ()
+    if isinstance(chunk, TableSpan):
+        return [chunk.table.glyph(i, row) for i in range(chunk.start, chunk.end)]
+    return [Glyph(ch, row, col, ox, oy, darkness, face=face) for ch, col, ox, oy, darkness, face in chunk]
+
+
+def table_row_map(table):
+    """RowMap of a page's GlyphTable, rows left as spans of it."""
+    ids, starts = row_index(table.rows)
+    return RowMap.from_items((row, TableSpan(table, starts[i], starts[i + 1])) for i, row in enumerate(ids))
+
+
+def stamp_chunk(doc, row):
+    """The stamps of a row as a chunk: (col, first_char, strikes) cells."""
+    span = doc.lazy_stamp_rows.get(row)
+    if span is not None:
+        return TableSpan(doc.lazy_stamps, *span)
+    cells = doc.stamp_cells.get(row)
+    if not cells:
+        return None
+    return tuple((col, ch, n) for col, (ch, n) in cells.items())
+
+
+def chunk_stamps(chunk):
+    """{col: (first_char, strikes)} of a stamp chunk."""
+    if chunk is None:
+        return {}
+    if isinstance(chunk, TableSpan):
+        cols, chars, strikes = (chunk.table[name][chunk.start:chunk.end] for name in ('cols', 'chars', 'strikes'))
+        return {c: (chr(ch), n) for c, ch, n in zip(cols, chars, strikes)}
+    return {col: (ch, n) for col, ch, n in chunk}
+
+
+class Version:
+    """The whole document at one undo step: nothing in it is ever modified."""
+    __slots__ = ('rows', 'stamps', 'store', 'pages', 'cursor')
+
+    def __init__(self, rows, stamps, store, pages, cursor):
+        self.rows = rows  # RowMap of the current page's glyph chunks
+        self.stamps = stamps  # RowMap of stamp chunks
+        self.store = store  # the PageStore the saved pages are in
+        self.pages = pages  # per saved page: (store entry, RowMap of it or None if never seen as current)
+        self.cursor = cursor
+
+    def same_document(self, other):
+        return (self.rows is other.rows and self.stamps is other.stamps and self.store is other.store
+                and len(self.pages) == len(other.pages)
+                and all(a[0] is b[0] for a, b in zip(self.pages, other.pages)))
+
+
+class History:
+    """Undo/redo stacks and named snapshots of Versions, built from the Document's change sets."""
+
+    def __init__(self, limit=UNDO_LIMIT):
+        self.limit = limit
+        self.version = None  # the document as of the last commit
+        self.undo_stack = []
+        self.redo_stack = []
+        self.snapshots = {}  # name -> Version
+
+    def commit(self, doc, store, cursor):
+        """Record what changed since the last commit as a new undo step; returns True if anything had."""
+        prev = self.version
+        changed_rows, changed_stamp_rows = doc.take_changes()
+        if prev is None or changed_rows is None:
+            table = doc.lazy_table
+            rows = RowMap.from_items(itertools.chain(
+                ((row, TableSpan(table, start, end)) for row, (start, end) in doc.lazy_rows.items()),
+                ((row, glyph_chunk(doc, row)) for row in doc.glyph_rows)))
+        else:
+            rows = prev.rows
+            for row in changed_rows:
+                chunk = glyph_chunk(doc, row)
+                if chunk is not None or rows.get(row) is not None:
+                    rows = rows.set(row, chunk)
+        if prev is None or changed_stamp_rows is None:
+            columns = doc.lazy_stamps
+            stamps = RowMap.from_items(itertools.chain(
+                ((row, TableSpan(columns, start, end)) for row, (start, end) in doc.lazy_stamp_rows.items()),
+                ((row, stamp_chunk(doc, row)) for row in doc.stamp_cells)))
+        else:
+            stamps = prev.stamps
+            for row in changed_stamp_rows:
+                chunk = stamp_chunk(doc, row)
+                if chunk is not None or stamps.get(row) is not None:
+                    stamps = stamps.set(row, chunk)
+        entries = store.entries
+        pages = ()
+        if prev is not None and prev.store is store:
+            k = 0
+            while k < min(len(prev.pages), len(entries)) and prev.pages[k][0] is entries[k]:
+                k += 1
+            pages = prev.pages[:k]
+        # a page saved since the last commit is the current page as that commit saw it
+        pages += tuple((entry, prev.rows if prev is not None and i == len(prev.pages) else None)
+                       for i, entry in enumerate(entries[len(pages):], len(pages)))
+        version = Version(rows, stamps, store, pages, cursor)
+        self.version = version
+        if prev is None or version.same_document(prev):
+            return False
+        self.undo_stack.append(prev)
+        del self.undo_stack[:-self.limit]
+        self.redo_stack.clear()
+        return True
+
+    def undo(self):
+        """The version to go back to, or None; the caller checks it out."""
+        if not self.undo_stack:
+            return None
+        self.redo_stack.append(self.version)
+        return self.undo_stack.pop()
+
+    def redo(self):
+        if not self.redo_stack:
+            return None
+        self.undo_stack.append(self.version)
+        return self.redo_stack.pop()
+
+    def jump(self, version):
+        """Going to a snapshot: an undo step like any other."""
+        self.undo_stack.append(self.version)
+        del self.undo_stack[:-self.limit]
+        self.redo_stack.clear()
+        return version
+
+
+# ---------- full-document export ----------
+# EXPORT renders whole pages at print resolution on a worker thread. A page is rasterized in
+# horizontal bands of EXPORT_BAND_ROWS text rows that are streamed straight into the PNG encoder, so
+# memory stays at one band however long the manuscript is, and typing carries on meanwhile.
+EXPORT_DPI = 300
+SCREEN_DPI = 96  # the on-screen paper counts as 96 dpi; export scale = dpi / SCREEN_DPI
+EXPORT_SAVED_PAGES = True  # also export every page pushed with NEW PAGE, one PNG / SVG / PDF page per page
+EXPORT_BAND_ROWS = 8
+RULE_COLOR = (230, 230, 220)
+
+
+class PngStreamWriter:
+    """Minimal 8-bit RGB PNG encoder that takes scanlines a band at a time."""
+
+    def __init__(self, f, width, height):
+        self.f = f
+        self.width = width
+        self.compressor = zlib.compressobj(6)
+        f.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def _chunk(self, kind, data):
+        self.f.write(struct.pack(">I", len(data)) + kind + data)
+        self.f.write(struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+    def write_rows(self, rgb):
+        stride = self.width * 3
+        # filter type 0 (none) in front of every scanline
+        lines = b"".join(b"\x00" + rgb[i:i + stride] for i in range(0, len(rgb), stride))
+        data = self.compressor.compress(lines)
+        if data:
+            self._chunk(b"IDAT", data)
+
+    def close(self):
+        self._chunk(b"IDAT", self.compressor.flush())
+        self._chunk(b"IEND", b"")
+
+
+def export_page_png(table, path, char_width, dpi=EXPORT_DPI, progress=None, cancelled=None):
+    """Rasterize one page (a GlyphTable) to a PNG at dpi, band by band.
+
+    progress(fraction) is called after every band; export stops early once cancelled() is true.
     """
-    # determine how many rows we need
-    if not stamp_history:
-        max_row = max(0, cursor_row)
-    else:
-        max_row = max(max(s['row'] for s in stamp_history), cursor_row)
-
-    # initialize a table of lists (accumulated stamps per cell)
-    rows = []
-    for r in range(max_row + 1):
-        rows.append([[] for _ in range(cols_per_line)])
-
-    # fill lists
-    for s in stamp_history:
-        r = s['row']
-        c = s['col']
-        if 0 <= r <= max_row and 0 <= c < cols_per_line:
-            rows[r][c].append(s['char'])
-
-    # build lines
-    lines = []
-    for r in range(max_row + 1):
-        chars = []
-        for c in range(cols_per_line):
-            cell = rows[r][c]
-            if not cell:
-                chars.append(' ')
-            elif len(cell) == 1:
-                chars.append(cell[0])
+    scale = dpi / SCREEN_DPI
+    line_h = LINE_HEIGHT * scale
+    width = round(PAPER_W * scale)
+    height = round(max(visible_rows, table.max_row + 2) * line_h)
+    band_h = max(1, round(EXPORT_BAND_ROWS * line_h))
+    typecase = Typecase(scale=scale, max_faces=MAX_TYPEBALLS)
+    band = pygame.Surface((width, band_h))
+    rule_w = max(1, round(scale))
+    with open(path, "wb") as f:
+        writer = PngStreamWriter(f, width, height)
+        for top in range(0, height, band_h):
+            if cancelled and cancelled():
+                return False
+            h = min(band_h, height - top)
+            band.fill(PAPER_COLOR)
+            first_row, last_row = int(top / line_h), int((top + h) / line_h)
+            for row in range(first_row, last_row + 1):
+                y = round(row * line_h) - top
+                pygame.draw.line(band, RULE_COLOR, (round(10 * scale), y), (width - round(10 * scale), y), rule_w)
+            # glyphs of the neighbouring rows may jitter or bleed into this band
+            for i in table.index_range(first_row - 1, last_row + 1):
+                ch = chr(table.chars[i])
+                if not is_drawable_char(ch):
+                    continue
+                x = (LEFT_MARGIN + table.cols[i] * char_width + table.offset_x[i]) * scale
+                y = (table.rows[i] * LINE_HEIGHT + table.offset_y[i]) * scale - top
+                typecase.blit(band, ch, table.darkness[i], table.faces[i], x, y)
+            writer.write_rows(_image_tobytes(band.subsurface((0, 0, width, h)), 'RGB'))
+            if progress:
+                progress(min(1.0, (top + h) / height))
+            time.sleep(0)  # let the main loop have the interpreter between bands
+        writer.close()
+    return True
+
+
+def export_paths(path, count):
+    """One file for a single page or a PDF, otherwise name-001.png, name-002.png, ... in page order."""
+    if count == 1 or export_format(path) == "pdf":
+        return [path]
+    stem, ext = os.path.splitext(path)
+    return [f"{stem}-{i:03d}{ext or '.png'}" for i in range(1, count + 1)]
+
+
+# ---------- vector export ----------
+# EXPORT to a .svg or .pdf name writes the pages as text instead of pixels: every glyph becomes one
+# positioned character in its typeball's font, the font file itself included once, with its offsets
+# kept exactly and its darkness level mapped to an opacity. The ghost halo of the raster stamps becomes
+# a stroke at GHOST_ALPHA of that opacity. Both writers walk a page's rows in order and write as they go,
+# so memory stays flat and a long manuscript comes out in a fraction of the time and size of a 300 dpi PNG.
+# SVG: one file per page, like PNG. A single page embeds its fonts as data URLs (base64, a third larger
+# than the font file) so the drawing stands alone; when several pages are exported each font file is
+# written once next to them (name-font1.ttf, ...) and the pages refer to it by relative URL, instead of
+# every page carrying its own copy. PDF: one file for the whole manuscript, one PDF page per typewriter
+# page; pages taller than PDF_MAX_PAGE_PT (the format's limit) are split across several PDF pages.
+VECTOR_PROGRESS_ROWS = 64  # rows written between progress reports / cancel checks
+PX_TO_PT = 72 / SCREEN_DPI
+PDF_MAX_PAGE_PT = 14400
+GHOST_STROKE_W = 2  # px; a stroke this wide reaches 1px outside the outline, like GHOST_OFFSETS
+
+
+def export_format(path):
+    """'svg', 'pdf' or 'png' (the default), from a file name's extension."""
+    ext = os.path.splitext(path)[1].lower()
+    return ext[1:] if ext in (".svg", ".pdf") else "png"
+
+
+def _num(v):
+    """A coordinate for the output: at most two decimals, no trailing zeros."""
+    s = f"{v:.2f}".rstrip("0").rstrip(".")
+    return "0" if s == "-0" else s
+
+
+def _vector_baseline():
+    """Distance from a row's top to the shared baseline: every ball is aligned to the default ball's,
+    as Typecase does for the raster stamps."""
+    return Typecase().face_metrics(0)["ascent"]
+
+
+class SfntFont:
+    """The parts of a TrueType / OpenType file needed to embed it in a PDF: glyph ids, advances, metrics."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = data = f.read()
+        self.cff = data[:4] == b"OTTO"  # CFF outlines; otherwise glyf
+        tables = {}
+        for i in range(struct.unpack_from(">H", data, 4)[0]):
+            tag, _, offset, _ = struct.unpack_from(">4sIII", data, 12 + 16 * i)
+            tables[tag] = offset
+        head, hhea = tables[b"head"], tables[b"hhea"]
+        self.units_per_em = struct.unpack_from(">H", data, head + 18)[0]
+        self.bbox = struct.unpack_from(">4h", data, head + 36)
+        self.ascent, self.descent = struct.unpack_from(">2h", data, hhea + 4)
+        self._metrics = struct.unpack_from(">H", data, hhea + 34)[0]
+        self._hmtx = tables[b"hmtx"]
+        self.cmap = self._read_cmap(tables[b"cmap"])
+
+    def _read_cmap(self, cmap):
+        data = self.data
+        subtables = {}
+        for i in range(struct.unpack_from(">H", data, cmap + 2)[0]):
+            platform_id, encoding, offset = struct.unpack_from(">HHI", data, cmap + 4 + 8 * i)
+            subtables[(platform_id, encoding)] = cmap + offset
+        for key in ((3, 10), (0, 4), (3, 1), (0, 3), (0, 1), (0, 0)):
+            offset = subtables.get(key)
+            if offset is None:
+                continue
+            fmt = struct.unpack_from(">H", data, offset)[0]
+            if fmt == 4:
+                return self._cmap_format4(offset)
+            if fmt == 12:
+                return self._cmap_format12(offset)
+        return {}
+
+    def _cmap_format4(self, offset):
+        data = self.data
+        seg2 = struct.unpack_from(">H", data, offset + 6)[0]
+        n = seg2 // 2
+        ends = struct.unpack_from(f">{n}H", data, offset + 14)
+        starts = struct.unpack_from(f">{n}H", data, offset + 16 + seg2)
+        deltas = struct.unpack_from(f">{n}h", data, offset + 16 + 2 * seg2)
+        range_at = offset + 16 + 3 * seg2
+        ranges = struct.unpack_from(f">{n}H", data, range_at)
+        cmap = {}
+        for i in range(n):
+            for c in range(starts[i], min(ends[i], 0xFFFE) + 1):
+                if ranges[i]:
+                    gid = struct.unpack_from(">H", data, range_at + 2 * i + ranges[i] + 2 * (c - starts[i]))[0]
+                    gid = (gid + deltas[i]) & 0xFFFF if gid else 0
+                else:
+                    gid = (c + deltas[i]) & 0xFFFF
+                if gid:
+                    cmap[c] = gid
+        return cmap
+
+    def _cmap_format12(self, offset):
+        cmap = {}
+        for i in range(struct.unpack_from(">I", self.data, offset + 12)[0]):
+            start, end, gid = struct.unpack_from(">3I", self.data, offset + 16 + 12 * i)
+            cmap.update(zip(range(start, end + 1), range(gid, gid + end - start + 1)))
+        return cmap
+
+    def gid(self, ch):
+        return self.cmap.get(ord(ch), 0)
+
+    def advance(self, gid):
+        return struct.unpack_from(">H", self.data, self._hmtx + 4 * min(gid, self._metrics - 1))[0]
+
+    def scaled(self, units):
+        """Font units in the 1000-unit glyph space of PDF font dictionaries."""
+        return round(units * 1000 / self.units_per_em)
+
+
+def _xml_text(ch):
+    return {"&": "&amp;", "<": "&lt;", ">": "&gt;"}.get(ch, ch)
+
+
+def _font_type(data):
+    """'otf' for an sfnt with CFF outlines (tagged OTTO), otherwise 'ttf'."""
+    return "otf" if data[:4] == b"OTTO" else "ttf"
+
+
+def export_svg_fonts(path, tables):
+    """Write the font file of every typeball the pages use next to path, once per file, as
+    name-font1.ttf, name-font2.otf, ...; returns {face: file name} for export_page_svg."""
+    stem = os.path.splitext(path)[0]
+    files, fonts = {}, {}
+    for face in sorted(set().union(*(bytes(table.faces) for table in tables))):
+        source = resolve_asset(typeball_file(face))
+        if source not in files:
+            with open(source, "rb") as f:
+                data = f.read()
+            name = f"{stem}-font{len(files) + 1}.{_font_type(data)}"
+            with open(name, "wb") as f:
+                f.write(data)
+            files[source] = os.path.basename(name)
+        fonts[face] = files[source]
+    return fonts
+
+
+def export_page_svg(table, path, char_width, progress=None, cancelled=None, fonts=None):
+    """Write one page (a GlyphTable) as an SVG drawing, row by row.
+
+    Coordinates are the screen's pixels (the paper is 96 dpi), so the drawing prints at paper size.
+    fonts maps face ids to font files beside path (see export_svg_fonts); without it the fonts are
+    embedded. progress(fraction) is called every VECTOR_PROGRESS_ROWS rows; export stops early once
+    cancelled() is true.
+    """
+    rows = max(visible_rows, table.max_row + 2)
+    width, height = PAPER_W, rows * LINE_HEIGHT
+    baseline = _vector_baseline()
+    faces = sorted(set(bytes(table.faces)))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                f'<svg xmlns="http://www.w3.org/2000/svg" width="{_num(width * PX_TO_PT)}pt" '
+                f'height="{_num(height * PX_TO_PT)}pt" viewBox="0 0 {width} {height}">\n<style>\n')
+        for face in faces:
+            if fonts is not None:
+                url = quote(fonts[face])
             else:
-                chars.append('□')  # overwritten -> square
-        # rstrip trailing spaces
-        line = "".join(chars).rstrip()
-        lines.append(line)
-    return "\n".join(lines)
-
-
-def load_text_into_glyphs(text):
-    global glyphs, cursor_row, cursor_col, paper_scroll, bell_rung_rows, view_offset_px
-    glyphs = []
-    lines = text.splitlines()
-    # expand tabs earlier if you do that: lines = [ln.expandtabs(TAB_SIZE) for ln in lines]
-    for r, line in enumerate(lines):
-        for c, ch in enumerate(line):
-            if c >= cols_per_line:
-                break
-            if ch.isspace(): ch = ' '
-            glyphs.append({'char': ch, 'row': r, 'col': c,
-                           'offset_x': random.randint(-1,1),
-                           'offset_y': random.randint(-1,1),
-                           'darkness': random.uniform(0.75, 1.0)})
-
-    cursor_row = max(TOP_MARGIN_LINES, len(lines) - 1 if lines else TOP_MARGIN_LINES)
-    cursor_col = len(lines[-1]) if lines else 0
-    if cursor_col > MAX_COL:
-        cursor_col = MAX_COL
-    paper_scroll = max(0, cursor_row - visible_rows + 1)
-    bell_rung_rows = set()
-    view_offset_px = CARRIAGE_DISPLAY_X - PAPER_X - pixel_for_col(cursor_col)
-
-
-
-def ask_save_text_and_write(default_ext=".txt"):
-    root = tk.Tk()
-    root.withdraw()
-    fname = filedialog.asksaveasfilename(defaultextension=default_ext,
-                                         filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
-    root.destroy()
+                with open(resolve_asset(typeball_file(face)), "rb") as font:
+                    data = font.read()
+                url = f"data:font/{_font_type(data)};base64,{base64.b64encode(data).decode('ascii')}"
+            f.write(f'@font-face {{ font-family: "ball{face}"; src: url({url}); }}\n'
+                    f'.f{face} {{ font-family: "ball{face}"; font-size: {TYPEBALLS[face][1]}px; }}\n')
+        for level in range(INK_LEVELS):
+            alpha = ink_alpha(level) / 255
+            f.write(f".d{level} {{ fill-opacity: {alpha:.3f}; stroke-opacity: {alpha * GHOST_ALPHA:.3f}; }}\n")
+        f.write(f"text {{ fill: #000; stroke: #000; stroke-width: {GHOST_STROKE_W}px; stroke-linejoin: round; "
+                "paint-order: stroke; white-space: pre; }\n</style>\n"
+                f'<rect width="{width}" height="{height}" fill="#{bytes(PAPER_COLOR).hex()}"/>\n'
+                f'<path stroke="#{bytes(RULE_COLOR).hex()}" d="'
+                + "".join(f"M10 {row * LINE_HEIGHT}H{width - 10}" for row in range(rows)) + '"/>\n')
+        for top in range(0, rows, VECTOR_PROGRESS_ROWS):
+            if cancelled and cancelled():
+                return False
+            if progress:
+                progress(top / rows)
+            time.sleep(0)  # let the main loop have the interpreter between bands
+            parts = []
+            for i in table.index_range(top, top + VECTOR_PROGRESS_ROWS - 1):
+                ch = chr(table.chars[i])
+                if ch == " " or not is_drawable_char(ch):
+                    continue
+                x = LEFT_MARGIN + table.cols[i] * char_width + table.offset_x[i]
+                y = table.rows[i] * LINE_HEIGHT + table.offset_y[i] + baseline
+                parts.append(f'<text class="f{table.faces[i]} d{ink_level(table.darkness[i])}" '
+                             f'x="{_num(x)}" y="{_num(y)}">{_xml_text(ch)}</text>\n')
+            f.write("".join(parts))
+        f.write("</svg>\n")
+    if progress:
+        progress(1.0)
+    return True
+
+
+class PdfWriter:
+    """Writes a PDF object by object as it is produced; only the objects' file offsets are kept, for the
+    cross-reference table at the end. Numbers for objects written later (the page tree, fonts) are
+    reserved up front so that earlier objects can refer to them."""
+
+    def __init__(self, f):
+        self.f = f
+        self.offsets = {}
+        self.count = 0
+        self.pos = 0
+        self._write(b"%PDF-1.6\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data):
+        self.f.write(data)
+        self.pos += len(data)
+
+    def reserve(self):
+        self.count += 1
+        return self.count
+
+    def object(self, num, body):
+        """Write object num; body is the object's source (str)."""
+        self.offsets[num] = self.pos
+        self._write(f"{num} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+
+    def stream(self, num, chunks, entries=""):
+        """Write object num as a Flate-compressed stream of the byte strings chunks yields."""
+        length = self.reserve()
+        self.offsets[num] = self.pos
+        self._write(f"{num} 0 obj\n<< /Length {length} 0 R /Filter /FlateDecode{entries} >>\nstream\n".encode("latin-1"))
+        start, compressor = self.pos, zlib.compressobj(6)
+        for chunk in chunks:
+            self._write(compressor.compress(chunk))
+        self._write(compressor.flush())
+        size = self.pos - start
+        self._write(b"\nendstream\nendobj\n")
+        self.object(length, str(size))
+
+    def close(self, root):
+        xref = self.pos
+        lines = [f"xref\n0 {self.count + 1}\n", "0000000000 65535 f \n"]
+        lines += [f"{self.offsets[num]:010d} 00000 n \n" for num in range(1, self.count + 1)]
+        lines.append(f"trailer\n<< /Size {self.count + 1} /Root {root} 0 R >>\nstartxref\n{xref}\n%%EOF\n")
+        self._write("".join(lines).encode("latin-1"))
+
+
+class _PdfFont:
+    """A typeball embedded in a PDF: a Type 0 font over the whole TrueType file, addressed by glyph id."""
+
+    def __init__(self, writer, face):
+        self.num = writer.reserve()
+        self.face = face
+        self.sfnt = SfntFont(resolve_asset(typeball_file(face)))
+        self.used = {}  # glyph id -> character, for the widths and the ToUnicode map
+
+    def code(self, ch):
+        gid = self.sfnt.gid(ch)
+        self.used.setdefault(gid, ch)
+        return f"<{gid:04X}>"
+
+    def write(self, writer):
+        sfnt = self.sfnt
+        name = "".join(c for c in os.path.splitext(os.path.basename(typeball_file(self.face)))[0] if c.isalnum())
+        cid, descriptor, font_file, to_unicode = (writer.reserve() for _ in range(4))
+        gids = sorted(self.used)
+        widths = " ".join(f"{gid} [{sfnt.scaled(sfnt.advance(gid))}]" for gid in gids)
+        writer.object(self.num, f"<< /Type /Font /Subtype /Type0 /BaseFont /{name} /Encoding /Identity-H "
+                                f"/DescendantFonts [{cid} 0 R] /ToUnicode {to_unicode} 0 R >>")
+        writer.object(cid, f"<< /Type /Font /Subtype /CIDFontType{0 if sfnt.cff else 2} /BaseFont /{name} "
+                           "/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> "
+                           f"/FontDescriptor {descriptor} 0 R /W [{widths}]"
+                           + ("" if sfnt.cff else " /CIDToGIDMap /Identity") + " >>")
+        bbox = " ".join(str(sfnt.scaled(v)) for v in sfnt.bbox)
+        writer.object(descriptor, f"<< /Type /FontDescriptor /FontName /{name} /Flags 32 /FontBBox [{bbox}] "
+                                  f"/ItalicAngle 0 /Ascent {sfnt.scaled(sfnt.ascent)} /Descent {sfnt.scaled(sfnt.descent)} "
+                                  f"/CapHeight {sfnt.scaled(sfnt.ascent)} /StemV 80 "
+                                  f"/FontFile{3 if sfnt.cff else 2} {font_file} 0 R >>")
+        writer.stream(font_file, [sfnt.data], " /Subtype /OpenType" if sfnt.cff else f" /Length1 {len(sfnt.data)}")
+        writer.stream(to_unicode, [self._cmap(gids).encode("latin-1")])
+
+    def _cmap(self, gids):
+        lines = ["/CIDInit /ProcSet findresource begin 12 dict begin begincmap",
+                 "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def",
+                 "/CMapName /Adobe-Identity-UCS def /CMapType 2 def",
+                 "1 begincodespacerange <0000> <FFFF> endcodespacerange"]
+        for i in range(0, len(gids), 100):
+            block = gids[i:i + 100]
+            lines.append(f"{len(block)} beginbfchar")
+            lines += [f"<{gid:04X}> <{self.used[gid].encode('utf-16-be').hex().upper()}>" for gid in block]
+            lines.append("endbfchar")
+        lines.append("endcmap CMapName currentdict /CMap defineresource pop end end")
+        return "\n".join(lines)
+
+
+def _pdf_page_content(table, first_row, last_row, char_width, baseline, font_for, step):
+    """Content stream chunks for rows first_row..last_row of a page, in the page's pixel coordinates
+    (y down, the top of first_row at 0). step(rows written) is called between bands; it returns False
+    to stop."""
+    height = (last_row - first_row + 1) * LINE_HEIGHT
+    rgb = lambda color: " ".join(_num(c / 255) for c in color)
+    rules = "".join(f"10 {y} m {PAPER_W - 10} {y} l " for y in range(0, height, LINE_HEIGHT))
+    yield (f"{_num(PX_TO_PT)} 0 0 {_num(-PX_TO_PT)} 0 {_num(height * PX_TO_PT)} cm "
+           f"{rgb(PAPER_COLOR)} rg 0 0 {PAPER_W} {height} re f "
+           f"{rgb(RULE_COLOR)} RG 1 w {rules}S\n"
+           f"0 g 0 G {GHOST_STROKE_W} w 1 j BT 2 Tr\n").encode("latin-1")
+    face = level = None
+    for top in range(first_row, last_row + 1, VECTOR_PROGRESS_ROWS):
+        if not step(top - first_row):
+            break
+        parts = []
+        for i in table.index_range(top, min(last_row, top + VECTOR_PROGRESS_ROWS - 1)):
+            ch = chr(table.chars[i])
+            if ch == " " or not is_drawable_char(ch):
+                continue
+            if table.faces[i] != face:
+                face = table.faces[i]
+                font = font_for(face)
+                parts.append(f"/F{face} {TYPEBALLS[face][1]} Tf")
+            if ink_level(table.darkness[i]) != level:
+                level = ink_level(table.darkness[i])
+                parts.append(f"/G{level} gs")
+            x = LEFT_MARGIN + table.cols[i] * char_width + table.offset_x[i]
+            y = (table.rows[i] - first_row) * LINE_HEIGHT + table.offset_y[i] + baseline
+            parts.append(f"1 0 0 -1 {_num(x)} {_num(y)} Tm {font.code(ch)} Tj")
+        if parts:
+            yield ("\n".join(parts) + "\n").encode("latin-1")
+    yield b"ET\n"
+
+
+def export_pdf(pages, path, char_width, progress=None, cancelled=None):
+    """Write pages (GlyphTables) as one PDF, page by page; the fonts follow once every glyph they are
+    needed for is known.
+
+    progress(fraction) is called every VECTOR_PROGRESS_ROWS rows; export stops early once cancelled() is
+    true, leaving an unfinished file.
+    """
+    baseline = _vector_baseline()
+    slice_rows = int(PDF_MAX_PAGE_PT / PX_TO_PT / LINE_HEIGHT)
+    total_rows = sum(max(visible_rows, table.max_row + 2) for table in pages)
+    done_rows = 0
+    with open(path, "wb") as f:
+        writer = PdfWriter(f)
+        catalog, page_tree, resources = writer.reserve(), writer.reserve(), writer.reserve()
+        fonts, kids = {}, []
+
+        def font_for(face):
+            if face not in fonts:
+                fonts[face] = _PdfFont(writer, face)
+            return fonts[face]
+
+        def step(rows_written):
+            if cancelled and cancelled():
+                return False
+            if progress:
+                progress((done_rows + rows_written) / total_rows)
+            time.sleep(0)  # let the main loop have the interpreter between bands
+            return True
+
+        for table in pages:
+            rows = max(visible_rows, table.max_row + 2)
+            for first in range(0, rows, slice_rows):
+                last = min(rows, first + slice_rows) - 1
+                content, page = writer.reserve(), writer.reserve()
+                writer.stream(content, _pdf_page_content(table, first, last, char_width, baseline, font_for, step))
+                if cancelled and cancelled():
+                    return False
+                writer.object(page, f"<< /Type /Page /Parent {page_tree} 0 R /MediaBox [0 0 "
+                                    f"{_num(PAPER_W * PX_TO_PT)} {_num((last - first + 1) * LINE_HEIGHT * PX_TO_PT)}] "
+                                    f"/Resources {resources} 0 R /Contents {content} 0 R >>")
+                kids.append(page)
+                done_rows += last - first + 1
+        for font in fonts.values():
+            font.write(writer)
+        states = " ".join(f"/G{level} << /Type /ExtGState /ca {ink_alpha(level) / 255:.3f} "
+                          f"/CA {ink_alpha(level) / 255 * GHOST_ALPHA:.3f} >>" for level in range(INK_LEVELS))
+        font_refs = " ".join(f"/F{face} {font.num} 0 R" for face, font in sorted(fonts.items()))
+        writer.object(resources, f"<< /Font << {font_refs} >> /ExtGState << {states} >> >>")
+        writer.object(page_tree, f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>")
+        writer.object(catalog, f"<< /Type /Catalog /Pages {page_tree} 0 R >>")
+        writer.close(catalog)
+    if progress:
+        progress(1.0)
+    return True
+
+
+class ExportJob(threading.Thread):
+    """Exports a list of pages on a worker thread; poll progress / done from the main loop."""
+
+    def __init__(self, pages, path, char_width, dpi=EXPORT_DPI):
+        super().__init__(daemon=True)
+        self.pages = pages
+        self.path = path
+        self.paths = export_paths(path, len(pages))
+        self.char_width = char_width
+        self.dpi = dpi
+        self.progress = 0.0
+        self.error = None
+        self.done = False
+        self.cancel_requested = False
+
+    def cancel(self):
+        self.cancel_requested = True
+
+    def _report(self, fraction):
+        self.progress = fraction
+
+    def run(self):
+        n = len(self.pages)
+        cancelled = lambda: self.cancel_requested
+        try:
+            kind = export_format(self.path)
+            if kind == "pdf":
+                export_pdf(self.pages, self.path, self.char_width, self._report, cancelled)
+                return
+            fonts = export_svg_fonts(self.path, self.pages) if kind == "svg" and n > 1 else None
+            for i, (table, path) in enumerate(zip(self.pages, self.paths)):
+                def report(fraction, i=i):
+                    self._report((i + fraction) / n)
+                if kind == "svg":
+                    finished = export_page_svg(table, path, self.char_width, report, cancelled, fonts)
+                else:
+                    finished = export_page_png(table, path, self.char_width, self.dpi, report, cancelled)
+                if not finished:
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+
+
+# ---------- instrumentation ----------
+# Optional per-frame timing of the main loop's phases, each animation and sound playback, plus a few
+# gauges (visible glyphs, cache hit rates, fps), for tracking down lag. It is off until enabled (F3
+# overlay or --profile); until then the hot paths only check engine.probe for None.
+# anim:* and sound time is nested inside events/update; 'total' is the sum of the top-level phases.
+PROBE_HISTORY = 3600  # frames kept for a dump (a minute at 60 fps)
+PROBE_PHASES = ('events', 'update', 'draw', 'overlay', 'flip')
+PROBE_SECTIONS = PROBE_PHASES + ('anim:view', 'anim:scroll', 'anim:timers', 'sound')
+PROBE_GAUGES = ('fps', 'visible_glyphs', 'atlas_hit_rate', 'row_hit_rate', 'paper_hit_rate')
+OVERLAY_RECT = pygame.Rect(0, 0, W, PAPER_Y)  # the margin above the paper
+OVERLAY_REFRESH_MS = 250
+
+
+def _hit_rate(hits, misses):
+    total = hits + misses
+    return round(hits / total, 4) if total else None
+
+
+class FrameProbe:
+    def __init__(self, history=PROBE_HISTORY):
+        self.frames = deque(maxlen=history)  # one dict per frame: section ms + gauges
+        self.current = dict.fromkeys(PROBE_SECTIONS, 0.0)
+        self.frame_no = 0
+        self._in_wrapped = False
+
+    def add(self, section, seconds):
+        self.current[section] = self.current.get(section, 0.0) + seconds * 1000.0
+
+    def wrap(self, section, fn):
+        """Time every call of fn under section; calls nested in another wrapped call are not counted twice."""
+        def timed(*args):
+            if self._in_wrapped:
+                return fn(*args)
+            self._in_wrapped = True
+            t0 = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                self._in_wrapped = False
+                self.add(section, time.perf_counter() - t0)
+        return timed
+
+    def end_frame(self, gauges):
+        record = {'frame': self.frame_no}
+        record.update((k, round(v, 4)) for k, v in self.current.items())
+        record['total'] = round(sum(self.current[k] for k in PROBE_PHASES), 4)
+        record.update(gauges)
+        self.frames.append(record)
+        self.frame_no += 1
+        self.current = dict.fromkeys(PROBE_SECTIONS, 0.0)
+
+    def recent(self, section, frames=30):
+        """Mean ms of a section over the last few frames (for the overlay)."""
+        tail = list(self.frames)[-frames:]
+        return sum(f.get(section, 0.0) for f in tail) / len(tail) if tail else 0.0
+
+    def summary(self):
+        out = {}
+        for section in PROBE_SECTIONS + ('total',):
+            samples = sorted(f.get(section, 0.0) for f in self.frames)
+            if samples:
+                out[section] = {
+                    'mean_ms': round(sum(samples) / len(samples), 4),
+                    'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+                    'max_ms': round(samples[-1], 4),
+                }
+        return out
+
+    def dump(self, prefix):
+        """Write prefix.json (metadata, summary, frames) and prefix.csv (one row per frame); returns both paths."""
+        frames = list(self.frames)
+        columns = ['frame'] + list(PROBE_SECTIONS) + ['total'] + list(PROBE_GAUGES)
+        for f in frames:
+            columns.extend(k for k in f if k not in columns)
+        report = {
+            'meta': {
+                'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+                'python': platform.python_version(),
+                'pygame': pygame.version.ver,
+                'video_driver': pygame.display.get_driver() if pygame.display.get_init() else None,
+                'frames': len(frames),
+            },
+            'summary': self.summary(),
+            'frames': frames,
+        }
+        json_path, csv_path = prefix + ".json", prefix + ".csv"
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+        with open(csv_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(frames)
+        return json_path, csv_path
+
+
+# ---------- dialogs ----------
+# File dialogs come from a dialog host made on first use and kept for the session. TkDialogs puts the
+# native dialogs on one hidden Tk root (tkinter is only imported then); FilePicker is a file browser
+# drawn in the pygame window, used on request or when Tk is not installed or cannot start.
+DOCUMENT_FILETYPES = [("Text files", "*.txt"), ("Typewriter documents", "*" + NATIVE_EXT), ("All files", "*.*")]
+EXPORT_FILETYPES = [("PNG image", "*.png"), ("SVG drawing", "*.svg"), ("PDF document", "*.pdf"),
+                    ("All files", "*.*")]
+DIALOG_BACKEND = "auto"  # "tk", "pygame", or "auto": native dialogs when Tk is available
+
+
+class TkDialogs:
+    def __init__(self):
+        import tkinter
+        from tkinter import filedialog
+        self.filedialog = filedialog
+        self.root = tkinter.Tk()
+        self.root.withdraw()
+
+    def _done(self, fname):
+        self.root.update()  # let the dialog window actually go away before the next frame
+        return fname or None
+
+    def ask_save(self, title, filetypes, default_ext):
+        return self._done(self.filedialog.asksaveasfilename(
+            parent=self.root, title=title, defaultextension=default_ext, filetypes=filetypes))
+
+    def ask_open(self, title, filetypes):
+        return self._done(self.filedialog.askopenfilename(parent=self.root, title=title, filetypes=filetypes))
+
+    def close(self):
+        self.root.destroy()
+
+
+class FilePicker:
+    """A modal file browser drawn over the paper. Up/Down/PgUp/PgDn or the mouse wheel move through the
+    list, Enter or a double click opens a folder or picks a file, Backspace edits the name (or goes up a
+    folder when it is empty), Tab shows all files / only matching ones, Escape cancels."""
+
+    ROW_H = 22
+    PANEL = pygame.Rect(PAPER_X + 40, PAPER_Y + 20, PAPER_W - 80, PAPER_H - 40)
+    PANEL_COLOR = (52, 52, 52)
+    TEXT_COLOR = (230, 230, 230)
+    DIM_COLOR = (150, 150, 150)
+    SELECT_COLOR = (90, 110, 150)
+
+    def __init__(self, screen, font, directory=None):
+        self.screen = screen
+        self.font = font
+        self.directory = directory or os.getcwd()  # kept between dialogs, like a native dialog does
+
+    def ask_save(self, title, filetypes, default_ext):
+        return self._run(title, filetypes, default_ext, saving=True)
+
+    def ask_open(self, title, filetypes):
+        return self._run(title, filetypes, None, saving=False)
+
+    def close(self):
+        pass
+
+    # ---- state ----
+    def _list(self):
+        patterns = [p for _, p in self.filetypes if p not in ("*", "*.*")]
+        try:
+            names = sorted(os.listdir(self.directory), key=str.lower)
+        except OSError as e:
+            self.message = str(e)
+            names = []
+        dirs = [n for n in names if os.path.isdir(os.path.join(self.directory, n)) and not n.startswith(".")]
+        files = [n for n in names if os.path.isfile(os.path.join(self.directory, n))
+                 and (self.show_all or not patterns or any(fnmatch.fnmatch(n.lower(), p) for p in patterns))]
+        self.entries = [".."] + [d + os.sep for d in dirs] + files
+        self.selected = 0
+        self.top = 0
+
+    def _chdir(self, path):
+        self.directory = os.path.abspath(path)
+        self._list()
+
+    def _activate(self, entry):
+        """Enter a folder, or return the chosen path for a file entry."""
+        if entry == "..":
+            self._chdir(os.path.dirname(self.directory))
+        elif entry.endswith(os.sep):
+            self._chdir(os.path.join(self.directory, entry))
+        elif self.saving:
+            self.name = entry
+            return self._accept()
+        else:
+            return os.path.join(self.directory, entry)
+        return None
+
+    def _accept(self):
+        """The path typed into the name field, once it is valid (and confirmed if it exists)."""
+        if not self.name:
+            return None
+        path = os.path.join(self.directory, os.path.expanduser(self.name))
+        if os.path.isdir(path):
+            self.name = ""
+            self._chdir(path)
+            return None
+        if self.saving and self.default_ext and not os.path.splitext(path)[1]:
+            path += self.default_ext
+        if self.saving and os.path.exists(path) and self.confirm != path:
+            self.confirm = path
+            self.message = f"{os.path.basename(path)} exists - press Enter again to replace it"
+            return None
+        if not self.saving and not os.path.isfile(path):
+            self.message = f"No such file: {self.name}"
+            return None
+        return path
+
+    # ---- loop ----
+    def _run(self, title, filetypes, default_ext, saving):
+        self.title, self.filetypes, self.default_ext, self.saving = title, filetypes, default_ext, saving
+        self.name, self.message, self.confirm, self.show_all = "", "", None, False
+        self.on_list = True  # Enter acts on the selected entry rather than on the typed name
+        self._list()
+        background = self.screen.copy()
+        clock = pygame.time.Clock()
+        last_click = (None, 0)
+        rows = (self.PANEL.h - 4 * self.ROW_H - 24) // self.ROW_H
+        while True:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    pygame.event.post(event)  # leave it for the main loop
+                    return None
+                if event.type == pygame.KEYDOWN:
+                    result = self._key(event, rows)
+                    if result is not None:
+                        return result or None
+                elif event.type == pygame.MOUSEWHEEL:
+                    self.top = max(0, min(self.top - event.y * 3, len(self.entries) - rows))
+                elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                    i = self._row_at(event.pos, rows)
+                    if i is not None:
+                        now = pygame.time.get_ticks()
+                        double = last_click[0] == i and now - last_click[1] < 400
+                        last_click = (i, now)
+                        self.selected = i
+                        self.on_list = True
+                        if double:
+                            result = self._activate(self.entries[i])
+                            if result:
+                                return result
+            self._draw(background, rows)
+            pygame.display.flip()
+            clock.tick(30)
+
+    def _key(self, event, rows):
+        """Handle a key; returns a path to finish, "" to cancel, or None to go on."""
+        k = event.key
+        if k == pygame.K_ESCAPE:
+            return ""
+        if k in (pygame.K_UP, pygame.K_DOWN, pygame.K_PAGEUP, pygame.K_PAGEDOWN):
+            step = {pygame.K_UP: -1, pygame.K_DOWN: 1, pygame.K_PAGEUP: -rows, pygame.K_PAGEDOWN: rows}[k]
+            self.selected = max(0, min(self.selected + step, len(self.entries) - 1))
+            self.top = min(max(self.top, self.selected - rows + 1), self.selected)
+            self.on_list = True
+            return None
+        if k in (pygame.K_RETURN, pygame.K_KP_ENTER):
+            if self.on_list or not self.name:
+                return self._activate(self.entries[self.selected])
+            return self._accept()
+        if k == pygame.K_TAB:
+            self.show_all = not self.show_all
+            self._list()
+        elif k == pygame.K_BACKSPACE:
+            if self.name:
+                self.name = self.name[:-1]
+            else:
+                self._chdir(os.path.dirname(self.directory))
+        elif event.unicode and event.unicode.isprintable():
+            self.name += event.unicode
+            self.on_list = False
+        self.confirm = None
+        self.message = ""
+        return None
+
+    def _row_at(self, pos, rows):
+        x, y = pos
+        top = self.PANEL.y + 2 * self.ROW_H + 12
+        if not self.PANEL.collidepoint(pos) or y < top:
+            return None
+        i = self.top + (y - top) // self.ROW_H
+        return i if i < min(len(self.entries), self.top + rows) else None
+
+    def _draw(self, background, rows):
+        panel = self.PANEL
+        self.screen.blit(background, (0, 0))
+        pygame.draw.rect(self.screen, self.PANEL_COLOR, panel)
+        pygame.draw.rect(self.screen, self.DIM_COLOR, panel, 1)
+        x, y = panel.x + 12, panel.y + 8
+
+        def text(s, color, at):
+            self.screen.blit(self.font.render(s, True, color), at)
+
+        heading = f"{self.title} - {self.directory}"
+        while len(heading) > 8 and self.font.size(heading)[0] > panel.w - 24:
+            heading = f"{self.title} - ..." + heading[len(self.title) + 7:]  # drop the front of the path
+        text(heading, self.TEXT_COLOR, (x, y))
+        kinds = "all files" if self.show_all else ", ".join(p for _, p in self.filetypes if p != "*.*")
+        text(f"showing {kinds} (Tab to switch)", self.DIM_COLOR, (x, y + self.ROW_H))
+        y += 2 * self.ROW_H + 12
+        for i in range(self.top, min(len(self.entries), self.top + rows)):
+            if i == self.selected:
+                pygame.draw.rect(self.screen, self.SELECT_COLOR, (panel.x + 4, y - 2, panel.w - 8, self.ROW_H))
+            text(self.entries[i], self.TEXT_COLOR, (x, y))
+            y += self.ROW_H
+        y = panel.bottom - 2 * self.ROW_H - 4
+        if self.message:
+            text(self.message, (230, 180, 120), (x, y))
+        label = "File name: " if self.saving else "Open: "
+        text(label + self.name + "_", self.TEXT_COLOR, (x, y + self.ROW_H))
+
+
+def open_dialogs(backend, screen, font):
+    """The dialog host for backend ("tk", "pygame" or "auto")."""
+    if backend != "pygame":
+        try:
+            return TkDialogs()
+        except Exception as e:  # no tkinter, or no display for Tk
+            if backend == "tk":
+                print("Native file dialogs unavailable, using the in-window picker:", e)
+    return FilePicker(screen, font)
+
+
+def ask_save_text_and_write(engine, default_ext=".txt"):
+    fname = engine.dialogs.ask_save("Save as", DOCUMENT_FILETYPES, default_ext)
     if not fname: return None
     try:
-        txt = build_text_from_stamps()
-        with open(fname, "w", encoding="utf-8") as f:
-            f.write(txt)
+        if fname.lower().endswith(NATIVE_EXT):
+            engine.save_native(fname)
+        else:
+            with open(fname, "w", encoding="utf-8") as f:
+                engine.write_text_from_stamps(f)
         return fname
     except Exception as e:
         print("Save failed:", e)
         return None
 
 
-def ask_open_file_and_load():
-    root = tk.Tk()
-    root.withdraw()
-    fname = filedialog.askopenfilename(filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
-    root.destroy()
+def ask_open_file_and_load(engine):
+    fname = engine.dialogs.ask_open("Open", DOCUMENT_FILETYPES)
     if not fname: return None
     try:
+        if fname.lower().endswith(NATIVE_EXT):
+            engine.load_native(fname)
+            return fname
         with open(fname, "r", encoding="utf-8") as f:
-            txt = f.read()
-        load_text_into_glyphs(txt)
+            engine.load_text_into_glyphs(f)
         return fname
     except Exception as e:
         print("Open failed:", e)
         return None
 
 
-def ask_save_png_and_write(surface):
-    root = tk.Tk()
-    root.withdraw()
-    fname = filedialog.asksaveasfilename(defaultextension=".png",
-                                         filetypes=[("PNG image", "*.png"), ("All files", "*.*")])
-    root.destroy()
-    if not fname: return None
-    try:
-        pygame.image.save(surface, fname)
-        return fname
-    except Exception as e:
-        print("Export PNG failed:", e)
-        return None
+def ask_export_path(dialogs):
+    return dialogs.ask_save("Export", EXPORT_FILETYPES, ".png")
 
 
-def action_clear():
-    global glyphs, cursor_col, cursor_row, paper_scroll, bell_rung_rows, view_offset_px
-    glyphs = []
-    cursor_col = 0
-    cursor_row = TOP_MARGIN_LINES
-    paper_scroll = 0
-    bell_rung_rows.clear()
-    view_offset_px = CARRIAGE_DISPLAY_X - PAPER_X - pixel_for_col(cursor_col)
-
-
-def action_new_page():
-    global glyphs, cursor_col, cursor_row, paper_scroll, saved_pages, bell_rung_rows, view_offset_px
-    saved_pages.append([dict(g) for g in glyphs])
-    glyphs = []
-    cursor_col = 0
-    cursor_row = TOP_MARGIN_LINES
-    paper_scroll = 0
-    bell_rung_rows.clear()
-    view_offset_px = CARRIAGE_DISPLAY_X - PAPER_X - pixel_for_col(cursor_col)
-
-
-def action_save_as():
-    fname = ask_save_text_and_write()
-    if fname:
-        print("Saved to", fname)
-
-
-def action_open():
-    fname = ask_open_file_and_load()
-    if fname:
-        print("Loaded", fname)
-
-
-def action_export_png():
-    surf = pygame.Surface((PAPER_W, PAPER_H))
-    surf.fill(PAPER_COLOR)
-    for i in range(visible_rows + 1):
-        y = i * LINE_HEIGHT + int(paper_scroll_offset_px)
-        pygame.draw.line(surf, (230, 230, 220), (10, y), (PAPER_W - 10, y), 1)
-    min_row = paper_scroll
-    max_row = paper_scroll + visible_rows - 1
-    base_x = LEFT_MARGIN + int(view_offset_px)
-    for g in glyphs:
-        if g['row'] < min_row or g['row'] > max_row:
-            continue
-        x = base_x + (g['col'] * CHAR_WIDTH) + g.get('offset_x', 0)
-        y = (g['row'] - paper_scroll) * LINE_HEIGHT + g.get('offset_y', 0) + int(paper_scroll_offset_px)
-        txt = font.render(g['char'], True, (0, 0, 0))
-        tmp = pygame.Surface(txt.get_size(), pygame.SRCALPHA)
-        darkness = max(0.0, min(1.0, g.get('darkness', 1.0)))
-        alpha = int(80 + 175 * darkness)
-        txt.set_alpha(alpha)
-        tmp.blit(txt, (0, 0))
-        ghost = font.render(g['char'], True, (0, 0, 0))
-        ghost.set_alpha(int(alpha * 0.35))
-        for ox, oy in [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (1, 1)]:
-            tmp.blit(ghost, (ox, oy))
-        surf.blit(tmp, (x, y))
-    fname = ask_save_png_and_write(surf)
-    if fname:
-        print("Exported PNG to", fname)
-
-
-def action_toggle_edit():
-    global authentic_mode
-    authentic_mode = not authentic_mode
-
-
-def action_quit():
-    pygame.event.post(pygame.event.Event(pygame.QUIT))
-
-
-action_map = {
-    "clear": action_clear,
-    "new_page": action_new_page,
-    "save_as": action_save_as,
-    "open": action_open,
-    "export_png": action_export_png,
-    "toggle_edit": action_toggle_edit,
-    "quit": action_quit
-}
+# ---------- engine ----------
+class TypewriterEngine:
+    """Document model, key handling and rendering of one typewriter.
 
-# initialize view offset so initial cursor is centered
-view_offset_px = CARRIAGE_DISPLAY_X - PAPER_X - pixel_for_col(cursor_col)
+    With a screen surface it drives a window; headless=True renders into an offscreen surface and
+    keeps audio off, for batch rendering and automated testing. Pass ticks (a () -> ms callable) to
+    run animations on a virtual clock, and seed for reproducible ink. With journal_dir the session is
+    autosaved there (and recovered from there if the last one did not end with close()). With an
+    AssetCache, sounds, font metrics and ink stamps are read from it instead of being rebuilt.
+    dialog_backend picks the file dialogs (see open_dialogs).
+    """
+
+    def __init__(self, screen=None, headless=False, audio=None, ticks=None, seed=None, journal_dir=None,
+                 asset_cache=None, dialog_backend=DIALOG_BACKEND):
+        self.headless = headless or screen is None
+        self.screen = screen if screen is not None else pygame.Surface((W, H))
+        if ticks is None:
+            ticks = (lambda: int(time.monotonic() * 1000)) if self.headless else pygame.time.get_ticks
+        self.ticks = ticks
+        self.rng = random.Random(seed)
+
+        self.asset_cache = asset_cache
+        # a font is only opened once a stamp that is not in the cache has to be rasterized
+        self.typecase = Typecase(asset_cache)
+        self.typecase.atlas(0)
+        # every typeball strikes on the default ball's pitch, so switching never moves the ink
+        self.char_width = self.typecase.face_metrics(0)["char_width"]
+        self.cols_per_line, self.max_col, self.off_col = grid_for_char_width(self.char_width)
+        self.face = 0  # the typeball new strikes use (see TYPEBALLS)
+        self._ui_font = None
+        self.dialog_backend = dialog_backend
+        self._dialogs = None
+
+        self.animator = Animator(ticks)
+        self.sounds = SoundBank(self.animator.call_later, enabled=not self.headless if audio is None else audio,
+                                cache=asset_cache)
+        self.doc = Document(self.cols_per_line)
+        self.paper = PaperLayer(self.typecase, self.char_width, self.doc)
+        self.overview = Overview(self.typecase, self.char_width)
+
+        # runtime state
+        self.cursor_col = 0  # logical column index
+        self.cursor_row = TOP_MARGIN_LINES  # absolute row index
+        self.paper_scroll = 0  # how many rows scrolled off top
+        self.paper_scroll_offset_px = 0.0  # during vertical animation
+        # view_offset_px represents the paper's horizontal translation: paper is drawn at PAPER_X + view_offset_px
+        # (initialized so the initial cursor is centered)
+        self.view_offset_px = self.view_offset_for_col(self.cursor_col)
+
+        # pages history (one GlyphTable per finished page, spilled to disk)
+        self.saved_pages = PageStore()
+
+        # UI state
+        self.running = True
+        self.key_locked = False
+        self.locked_key = None
+        self.locked_char_display = ""
+        self.pending_keydown = None  # store the pygame.Event for the keydown that is pending (strike on KEYDOWN, move on KEYUP)
+        self.button_rects = []
+
+        # bell state (once per row)
+        self.bell_rung_rows = set()
+
+        # edit/authentic mode
+        self.authentic_mode = True
+
+        # frame bookkeeping for dirty-rect presentation
+        self.dirty_rects = []  # screen rects to push with pygame.display.update()
+        self.full_redraw = True
+        self.last_paper_state = None
+        self.last_bar_state = None
+        self.last_find_state = None
+
+        # find (Ctrl+F): find_query is None while the find bar is closed
+        self.find_index = FindIndex()
+        self.find_query = None
+        self.find_hits = []  # (page, row, col) of every match
+        self.find_pos = -1  # the match shown
+
+        # background EXPORT (see ExportJob)
+        self.export_job = None
+
+        # live broadcast to viewers (see BroadcastServer); None unless serving
+        self.broadcast = None
+
+        # instrumentation (see FrameProbe); None until enabled
+        self.probe = None
+        self.show_overlay = False
+        self.show_overview = False
+        self.overlay_due_ms = 0
+        self._probe_base = None
+
+        # autosave journal; attached last so a recovered session is not journaled twice
+        self.journal = None
+        if journal_dir:
+            self._open_journal(journal_dir)
+
+        # undo/redo and snapshots (see History); the page as it starts is the first version
+        self.history = History()
+        self.history.commit(self.doc, self.saved_pages, (self.cursor_row, self.cursor_col))
+        self._undo_ink = self.paper.ink_version
+        self._undo_edit_ms = 0
+
+        # the balls F7 / F8 switch to are loaded in the background, so switching is instant
+        if not self.headless:
+            self.typecase.warm(self.typeball_neighbours(self.face))
+
+        self.action_map = {
+            "clear": self.action_clear,
+            "new_page": self.action_new_page,
+            "save_as": self.action_save_as,
+            "open": self.action_open,
+            "export": self.action_export,
+            "toggle_edit": self.action_toggle_edit,
+            "quit": self.action_quit
+        }
+
+    def _open_journal(self, journal_dir):
+        try:
+            journal = SessionJournal(journal_dir, self.cols_per_line)
+            state = journal.load(self.doc)
+        except Exception as e:
+            print("Autosave disabled:", e)
+            return
+        if not state.empty:
+            self.saved_pages = state.saved_pages
+            if state.cursor:
+                self.cursor_row, self.cursor_col = state.cursor
+            self.paper_scroll = max(0, self.cursor_row - visible_rows + 1)
+            self.view_offset_px = self.view_offset_for_col(self.cursor_col)
+            self._reset_paper()
+            print("Recovered unsaved session from", journal_dir)
+        self.journal = journal
+        self.doc.journal = journal
+        journal.start()
+
+    def start_broadcast(self, host=BROADCAST_HOST, port=BROADCAST_PORT):
+        """Serve this session to read-only viewers; returns the BroadcastServer (OSError if it cannot listen)."""
+        server = BroadcastServer(host, port).start()
+        self.broadcast = server
+        self.journal = server if self.journal is None else JournalTee(self.journal, server)
+        self.doc.journal = self.journal
+        return server
+
+    def close(self):
+        """End the session cleanly: flush and delete the autosave journal, and cache any new ink stamps."""
+        if self.journal is not None:
+            self.doc.journal = None
+            self.journal.close(discard=True)
+            self.journal = None
+        self.broadcast = None
+        if self._dialogs is not None:
+            self._dialogs.close()
+            self._dialogs = None
+        self.typecase.close()
+
+    # ---------- typeballs ----------
+    @property
+    def font(self):
+        return self.typecase.atlas(self.face).font
+
+    def typeball_neighbours(self, face):
+        """The balls F7 / F8 (and Shift) switch to from face."""
+        name, size = TYPEBALLS[face]
+        paths = [path for _, path in TYPEFACES]
+        i = paths.index(name) if name in paths else 0
+        j = min(range(len(TYPE_SIZES)), key=lambda k: abs(TYPE_SIZES[k] - size))
+        return [typeball_id(paths[(i + 1) % len(paths)], size), typeball_id(paths[i - 1], size),
+                typeball_id(name, TYPE_SIZES[min(j + 1, len(TYPE_SIZES) - 1)]), typeball_id(name, TYPE_SIZES[max(j - 1, 0)])]
+
+    def select_typeball(self, name, size):
+        """Strike from now on with a typeball; the ink already on the paper keeps its own."""
+        if not os.path.exists(resolve_asset(name)):
+            print("Typeball not found:", name)
+            return
+        self.face = typeball_id(name, size)
+        self.typecase.atlas(self.face)
+        if not self.headless:
+            self.typecase.warm(self.typeball_neighbours(self.face))
+
+    def cycle_typeball(self, key, back=False):
+        """F7: next (Shift: previous) typeface at the same size; F8: next size up (Shift: down)."""
+        neighbours = self.typeball_neighbours(self.face)
+        face = neighbours[(0 if key == pygame.K_F7 else 2) + back]
+        self.select_typeball(*TYPEBALLS[face])
+
+    @property
+    def dialogs(self):
+        # made when the first dialog opens, so Tk is neither imported nor started until it is needed
+        if self._dialogs is None:
+            self._dialogs = open_dialogs(self.dialog_backend, self.screen, self.ui_font)
+        return self._dialogs
+
+    @property
+    def ui_font(self):
+        # small UI font; created on first draw so headless engines that never draw skip the system font scan
+        if self._ui_font is None:
+            self._ui_font = pygame.font.SysFont(FONT_NAME, 16)
+        return self._ui_font
+
+    # ---------- utilities ----------
+    def pixel_for_col(self, col_index):
+        # column pixel position relative to the paper origin
+        return LEFT_MARGIN + col_index * self.char_width
+
+    def view_offset_for_col(self, col_index):
+        return CARRIAGE_DISPLAY_X - PAPER_X - self.pixel_for_col(col_index)
+
+    def finalize_pending_glyph(self):
+        """Clear the pending flag of the glyph struck on KEYDOWN and bake it into the paper layer."""
+        g = self.doc.pending_glyph
+        if g is None:
+            return None
+        self.doc.pending_glyph = None
+        g.pending = False
+        self.bake_glyph(g)
+        return g
+
+    def bake_glyph(self, g):
+        self.paper.bake(g)
+        self.mark_cell_dirty(g.row, g.col)
+
+    # ---------- animations ----------
+    def _set_view_offset(self, value):
+        self.view_offset_px = value
+
+    def _set_scroll_offset(self, value):
+        self.paper_scroll_offset_px = value
+
+    def _thunk_after(self, delay_ms):
+        if delay_ms:
+            return lambda: self.animator.call_later(delay_ms, self.sounds.play_thunk)
+        return self.sounds.play_thunk
+
+    def animate_view_to_col_blocky(self, target_col, steps=4, step_ms=10, play_thunk_at_end=False, thunk_delay_ms=0):
+        """
+        Blocky/stepped animation to move view_offset_px so that target_col aligns with the fixed carriage center.
+        steps: number of discrete jumps
+        step_ms: milliseconds per step
+        """
+        on_done = self._thunk_after(thunk_delay_ms) if play_thunk_at_end else None
+        self.animator.start('view', self._set_view_offset, self.view_offset_px, self.view_offset_for_col(target_col),
+                            steps * step_ms, steps=steps, on_done=on_done)
+
+    def animate_view_to_col_smooth(self, target_col, duration_ms=1000, play_thunk_at_end=False, thunk_delay_ms=0):
+        """
+        Smooth animation to move view_offset_px so that target_col aligns with the fixed carriage center.
+        Uses ease-out interpolation.
+        """
+        on_done = self._thunk_after(thunk_delay_ms) if play_thunk_at_end else None
+        self.animator.start('view', self._set_view_offset, self.view_offset_px, self.view_offset_for_col(target_col),
+                            duration_ms, on_done=on_done)
+
+    # Smooth vertical feed
+    def animate_paper_scroll_to(self, target_scroll, duration_ms=260):
+        if target_scroll < 0:
+            target_scroll = 0
+        # a feed still in flight is completed first so paper_scroll is settled before we measure from it
+        self.animator.finish('scroll')
+        delta_rows = target_scroll - self.paper_scroll
+
+        def land():
+            self.paper_scroll = target_scroll
+            self.paper_scroll_offset_px = 0.0
+
+        self.animator.start('scroll', self._set_scroll_offset, 0.0, -delta_rows * LINE_HEIGHT, duration_ms, on_done=land)
+
+    def update(self, now=None):
+        """Advance animations to `now` (defaults to the engine clock) and collect a finished export."""
+        now = self.ticks() if now is None else now
+        self.animator.update(now)
+        self.typecase.poll()
+        # typing is folded into one undo step until it pauses
+        if self.paper.ink_version != self._undo_ink:
+            self._undo_ink = self.paper.ink_version
+            self._undo_edit_ms = now
+        elif now - self._undo_edit_ms >= UNDO_GROUP_MS and not self.key_locked and self.doc.has_changes:
+            self.commit_history()
+        if self.journal is not None:
+            self.journal.note_cursor(self.cursor_row, self.cursor_col)
+        if self.broadcast is not None:
+            self.broadcast.end_frame(self)
+        job = self.export_job
+        if job is not None and job.done:
+            self.export_job = None
+            if job.error:
+                print("Export failed:", job.error)
+            elif job.cancel_requested:
+                print("Export cancelled")
+            else:
+                print("Exported to", *job.paths)
+
+    def settle(self):
+        """Finish every running animation immediately."""
+        self.animator.finish_all()
+
+    # ---------- drawing ----------
+    def mark_cell_dirty(self, row, col):
+        x = int(PAPER_X + self.view_offset_px) + LEFT_MARGIN + col * self.char_width - self.char_width // 2
+        y = PAPER_Y + (row - self.paper_scroll) * LINE_HEIGHT + int(self.paper_scroll_offset_px) - ROW_BLEED
+        rect = pygame.Rect(x, y, self.char_width * 2, LINE_HEIGHT + 2 * ROW_BLEED).clip(PAPER_BAND)
+        if rect.width and rect.height:
+            self.dirty_rects.append(rect)
+
+    def draw_paper_band(self):
+        screen = self.screen
+        if self.show_overview:
+            screen.blit(self.overview.compose(self.saved_pages, self.doc, self.paper, self.current_page_rows(),
+                                              self.paper_scroll, self.cursor_row, self.ui_font, self.find_mark()),
+                        PAPER_BAND)
+            return
+        screen.fill(BG_COLOR, PAPER_BAND)
+
+        # Draw paper (with its baked ink) shifted by view_offset_px
+        paper_draw_x = int(PAPER_X + self.view_offset_px)
+        screen.blit(self.paper.compose(self.paper_scroll, self.paper_scroll_offset_px), (paper_draw_x, PAPER_Y))
+
+        # the glyph whose key is still held is not baked yet
+        g = self.doc.pending_glyph
+        if g is not None and self.paper_scroll <= g.row < self.paper_scroll + visible_rows and is_drawable_char(g.char):
+            x = paper_draw_x + LEFT_MARGIN + g.col * self.char_width + g.offset_x
+            y = PAPER_Y + (g.row - self.paper_scroll) * LINE_HEIGHT + g.offset_y + self.paper_scroll_offset_px
+            self.typecase.blit(screen, g.char, g.darkness, g.face, x, y)
+
+        # draw carriage underline at fixed center X
+        cursor_vis = self.cursor_row - self.paper_scroll
+        if 0 <= cursor_vis < visible_rows:
+            line_top = PAPER_Y + cursor_vis * LINE_HEIGHT + self.paper_scroll_offset_px
+            underline_y = line_top + LINE_HEIGHT - 10  # 3 px above the bottom of the line
+            underline_half_width = self.char_width // 2
+            start_x = CARRIAGE_DISPLAY_X - underline_half_width + 7
+            end_x = CARRIAGE_DISPLAY_X + underline_half_width + 5
+            pygame.draw.line(screen, (220, 20, 20), (start_x, underline_y), (end_x, underline_y), 2)
+
+        # the find match being shown
+        mark = self.find_mark()
+        if mark is not None and mark[0] == len(self.saved_pages):
+            _, row, col, length = mark
+            x = paper_draw_x + LEFT_MARGIN + col * self.char_width
+            y = PAPER_Y + (row - self.paper_scroll) * LINE_HEIGHT + int(self.paper_scroll_offset_px)
+            rect = pygame.Rect(x - 2, y, length * self.char_width + 4, LINE_HEIGHT).clip(PAPER_BAND)
+            if rect.width and rect.height:
+                pygame.draw.rect(screen, FIND_MARK_COLOR, rect, 2)
+
+    def draw_command_bar(self):
+        screen = self.screen
+        ui_font = self.ui_font
+        pygame.draw.rect(screen, (45, 45, 45), (0, COMMAND_BAR_Y, W, COMMAND_BAR_H))
+        gap = 12
+        pad = 12
+        x = pad
+        y = COMMAND_BAR_Y + 10
+        button_h = COMMAND_BAR_H - 24
+        self.button_rects.clear()
+        for b in buttons:
+            label = b["label"]
+            text_surf = ui_font.render(label, True, (240, 240, 240))
+            w = max(120, text_surf.get_width() + 28)
+            rect = pygame.Rect(x, y, w, button_h)
+            pygame.draw.rect(screen, (70, 70, 70), rect, border_radius=8)
+            pygame.draw.rect(screen, (90, 90, 90), rect, 2, border_radius=8)
+            tx = x + (w - text_surf.get_width()) // 2
+            ty = y + (button_h - text_surf.get_height()) // 2
+            screen.blit(text_surf, (tx, ty))
+            self.button_rects.append((rect, b["id"]))
+            x += w + gap
+
+        status = f"Mode: {'AUTHENTIC' if self.authentic_mode else 'EDITOR'}   Cursor: col {self.cursor_col} row {self.cursor_row}   Pages saved: {len(self.saved_pages)}   Type: {typeball_label(self.face)}"
+        if self.export_job is not None:
+            status += f"   Exporting {self.export_percent()}%"
+        if self.show_overview:
+            status += f"   Overview 1:{2 << self.overview.level} (+/- zoom, F2 close)"
+        s_surf = ui_font.render(status, True, (200, 200, 200))
+        screen.blit(s_surf, (x + 8, COMMAND_BAR_Y + 14))
+
+        if self.key_locked:
+            label = ui_font.render("Key down: " + (self.locked_char_display or ""), True, (220, 220, 220))
+            screen.blit(label, (x + 8, COMMAND_BAR_Y + 40))
+
+    def draw_find_bar(self):
+        """The find query and match count, in the margin above the paper."""
+        if self.find_hits:
+            more = "+" if len(self.find_hits) >= FIND_MAX_HITS else ""
+            count = f"{self.find_pos + 1} of {len(self.find_hits)}{more}"
+        else:
+            count = "no matches" if self.find_query else ""
+        line = f"Find: {self.find_query}_   {count}   [Enter next, Shift+Enter previous, Esc close]"
+        self.screen.fill(BG_COLOR, OVERLAY_RECT)
+        self.screen.blit(self.ui_font.render(line, True, FIND_MARK_COLOR), (8, 10))
+        self.dirty_rects.append(OVERLAY_RECT)
+
+    def draw(self):
+        """Redraw the parts of the frame that changed since the last call and queue their dirty rects."""
+        if self.full_redraw:
+            self.full_redraw = False
+            self.screen.fill(BG_COLOR)
+            self.last_paper_state = self.last_bar_state = self.last_find_state = None
+            self.overlay_due_ms = 0
+            self.dirty_rects[:] = [self.screen.get_rect()]
+
+        # any movement of the paper or carriage dirties the whole band; new ink only dirties its cell
+        paper_state = (int(self.view_offset_px), self.paper_scroll, int(self.paper_scroll_offset_px), self.cursor_row)
+        paper_state += (self.find_mark(),)
+        if self.show_overview:
+            paper_state = ('overview', self.overview.level, self.overview.scroll_y, self.paper.ink_version,
+                           len(self.saved_pages), self.doc.max_glyph_row) + paper_state
+        if paper_state != self.last_paper_state:
+            self.last_paper_state = paper_state
+            self.dirty_rects.append(PAPER_BAND)
+        if self.dirty_rects:
+            self.draw_paper_band()
+
+        bar_state = (self.authentic_mode, self.cursor_col, self.cursor_row, len(self.saved_pages),
+                     self.key_locked, self.locked_char_display, self.export_percent(),
+                     self.show_overview and self.overview.level, self.face)
+        if bar_state != self.last_bar_state:
+            self.last_bar_state = bar_state
+            self.draw_command_bar()
+            self.dirty_rects.append(pygame.Rect(0, COMMAND_BAR_Y, W, COMMAND_BAR_H))
+
+        if self.find_query is not None:
+            find_state = (self.find_query, self.find_pos, len(self.find_hits))
+            if find_state != self.last_find_state:
+                self.last_find_state = find_state
+                self.draw_find_bar()
+
+    def draw_overlay(self):
+        """Instrumentation readout in the margin above the paper, refreshed a few times a second."""
+        now = self.ticks()
+        if now < self.overlay_due_ms:
+            return
+        self.overlay_due_ms = now + OVERLAY_REFRESH_MS
+        probe = self.probe
+        last = probe.frames[-1] if probe.frames else {}
+        anim = sum(probe.recent(k) for k in ('anim:view', 'anim:scroll', 'anim:timers'))
+        line1 = (f"fps {last.get('fps') or 0:.1f}   frame {probe.recent('total'):.2f} ms   "
+                 f"events {probe.recent('events'):.2f}   update {probe.recent('update'):.2f}   "
+                 f"draw {probe.recent('draw'):.2f}   flip {probe.recent('flip'):.2f}   "
+                 f"anim {anim:.2f}   sound {probe.recent('sound'):.2f}")
+
+        def pct(rate):
+            return "-" if rate is None else f"{rate * 100:.1f}%"
+
+        line2 = (f"visible glyphs {last.get('visible_glyphs', 0)}   atlas hits {pct(last.get('atlas_hit_rate'))}   "
+                 f"row strips {pct(last.get('row_hit_rate'))}   paper {pct(last.get('paper_hit_rate'))}   "
+                 f"[F3 hide, F4 dump]")
+        self.screen.fill(BG_COLOR, OVERLAY_RECT)
+        self.screen.blit(self.ui_font.render(line1, True, (150, 220, 150)), (8, 2))
+        self.screen.blit(self.ui_font.render(line2, True, (150, 220, 150)), (8, 20))
+        self.dirty_rects.append(OVERLAY_RECT)
+
+    def present(self):
+        """Draw the frame and push only the changed screen regions to the display."""
+        t0 = time.perf_counter()
+        self.draw()
+        t1 = time.perf_counter()
+        if self.show_overlay and self.find_query is None:
+            self.draw_overlay()
+        t2 = time.perf_counter()
+        if self.dirty_rects:
+            if not self.headless:
+                pygame.display.update(self.dirty_rects)
+            self.dirty_rects.clear()
+        if self.probe:
+            self.probe.add('draw', t1 - t0)
+            self.probe.add('overlay', t2 - t1)
+            self.probe.add('flip', time.perf_counter() - t2)
+
+    # ---------- overview ----------
+    def current_page_rows(self):
+        return max(self.cursor_row, self.doc.max_glyph_row) + 1
+
+    def toggle_overview(self):
+        self.show_overview = not self.show_overview
+        if self.show_overview:
+            self.overview.show(self.saved_pages, self.current_page_rows(), self.cursor_row)
+
+    def handle_overview_key(self, ev):
+        """Keys while the overview is shown; returns False for the ones handled as usual (F3, F4)."""
+        overview = self.overview
+        if ev.key in (pygame.K_F3, pygame.K_F4):
+            return False
+        if ev.key in (pygame.K_F2, pygame.K_ESCAPE):
+            self.toggle_overview()
+        elif ev.key in (pygame.K_UP, pygame.K_DOWN):
+            overview.scroll_by(OVERVIEW_GAP * 2 * (1 if ev.key == pygame.K_DOWN else -1))
+        elif ev.key in (pygame.K_PAGEUP, pygame.K_PAGEDOWN):
+            overview.scroll_by(PAPER_H * 3 // 4 * (1 if ev.key == pygame.K_PAGEDOWN else -1))
+        elif ev.key in (pygame.K_HOME, pygame.K_END):
+            overview.scroll_by(overview.content_h * (1 if ev.key == pygame.K_END else -1))
+        elif ev.unicode in ('+', '=') or ev.key == pygame.K_KP_PLUS:
+            overview.zoom(-1)
+        elif ev.unicode == '-' or ev.key == pygame.K_KP_MINUS:
+            overview.zoom(1)
+        # typing is paused while the overview is up
+        return True
+
+    def overview_click(self, x, y):
+        """A click on the current page jumps the paper there; on a saved page, zooms in to read it."""
+        hit = self.overview.hit(x, y)
+        if hit is None:
+            return
+        self.jump_to(*hit)
+
+    def jump_to(self, page, row):
+        """Bring a row into view: on the current page the paper scrolls to it (the carriage stays put);
+        a saved page is shown zoomed in in the overview."""
+        if page < len(self.saved_pages):
+            if not self.show_overview:
+                self.toggle_overview()
+            self.overview.zoom(-self.overview.level, (page, row))
+            return
+        if self.show_overview:
+            self.toggle_overview()
+        max_row = max(self.cursor_row, self.doc.max_glyph_row, 0)
+        target = max(0, min(max_row - visible_rows + 1, row - visible_rows // 2))
+        if target != self.paper_scroll:
+            self.animate_paper_scroll_to(target, duration_ms=180)
+
+    # ---------- find ----------
+    def open_find(self):
+        self.find_query = ""
+        self.find_hits = []
+        self.find_pos = -1
+
+    def close_find(self):
+        self.find_query = None
+        self.find_hits = []
+        self.find_pos = -1
+        self.last_find_state = None
+        self.overlay_due_ms = 0
+        self.screen.fill(BG_COLOR, OVERLAY_RECT)
+        self.dirty_rects.append(OVERLAY_RECT)
+
+    def find(self, query):
+        """Search every page for query (ignoring case) and show the first match; returns the matches."""
+        self.find_query = query
+        self.find_hits = self.find_index.find(query, self.saved_pages, self.doc, self.paper)
+        self.find_pos = -1
+        self.find_next()
+        return self.find_hits
+
+    def find_next(self, step=1):
+        if self.find_hits:
+            self.find_pos = (self.find_pos + step) % len(self.find_hits)
+            self.jump_to(*self.find_hits[self.find_pos][:2])
+
+    def find_mark(self):
+        """(page, row, col, length) of the match being shown, or None."""
+        if self.find_query is None or self.find_pos < 0:
+            return None
+        return self.find_hits[self.find_pos] + (len(self.find_query),)
+
+    def handle_find_key(self, ev):
+        """Keys while the find bar is open; returns False for the ones handled as usual (F2, F3, F4)."""
+        if ev.key in (pygame.K_F2, pygame.K_F3, pygame.K_F4):
+            return False
+        if ev.key == pygame.K_ESCAPE:
+            self.close_find()
+        elif ev.key in (pygame.K_RETURN, pygame.K_KP_ENTER):
+            self.find_next(-1 if ev.mod & pygame.KMOD_SHIFT else 1)
+        elif ev.key == pygame.K_BACKSPACE:
+            if self.find_query:
+                self.find(self.find_query[:-1])
+        elif ev.unicode and ev.unicode.isprintable() and not ev.mod & (pygame.KMOD_CTRL | pygame.KMOD_META):
+            self.find(self.find_query + ev.unicode)
+        return True
+
+    # ---------- undo ----------
+    def commit_history(self):
+        """Close the current undo step (see History.commit)."""
+        self.finalize_pending_glyph()
+        self.history.commit(self.doc, self.saved_pages, (self.cursor_row, self.cursor_col))
+        self._undo_ink = self.paper.ink_version
+
+    def _can_rewind(self):
+        if self.key_locked:
+            return False
+        if self.authentic_mode:
+            print("Undo, redo and restoring snapshots work in EDITOR mode (ink stays on the paper in AUTHENTIC mode)")
+            return False
+        return True
+
+    def undo(self):
+        if self._can_rewind():
+            self.commit_history()
+            version = self.history.undo()
+            if version is not None:
+                self._checkout(version)
+
+    def redo(self):
+        if self._can_rewind():
+            self.commit_history()
+            version = self.history.redo()
+            if version is not None:
+                self._checkout(version)
+
+    def take_snapshot(self, name=None):
+        """Remember the document as it is now under name (default: numbered with the time); returns the name."""
+        self.commit_history()
+        if name is None:
+            name = f"snapshot {len(self.history.snapshots) + 1} ({time.strftime('%H:%M:%S')})"
+        self.history.snapshots[name] = self.history.version
+        print("Took", name)
+        return name
+
+    def restore_snapshot(self, name=None):
+        """Go back to a snapshot (default: the latest); undo returns to where you were."""
+        snapshots = self.history.snapshots
+        if not snapshots or (name is not None and name not in snapshots) or not self._can_rewind():
+            return False
+        name = name if name is not None else next(reversed(snapshots))
+        self.commit_history()
+        self._checkout(self.history.jump(snapshots[name]))
+        print("Restored", name)
+        return True
+
+    def _checkout(self, target):
+        """Make the document match a version, rewriting only the rows that differ from the current one."""
+        current, doc = self.history.version, self.doc
+        if target.store is not self.saved_pages:
+            self._checkout_all(target)
+        else:
+            pages, rows = list(current.pages), current.rows
+            k = 0
+            while k < min(len(pages), len(target.pages)) and pages[k][0] is target.pages[k][0]:
+                k += 1
+            # pages saved since the target was current come back off the store, newest first
+            while len(pages) > k:
+                entry, page_rows = pages.pop()
+                unsave_page(doc, self.saved_pages)
+                rows = page_rows if page_rows is not None else table_row_map(self.saved_pages.load(entry))
+            # pages the target has saved go back on; the journal sees their ink being typed and saved
+            for entry, page_rows in target.pages[k:]:
+                if self.journal is not None:
+                    page_rows = page_rows if page_rows is not None else table_row_map(self.saved_pages.load(entry))
+                    self._rewrite_rows(rows, page_rows)
+                    self.journal.record((J_NEW_PAGE,))
+                self.saved_pages.push(entry)
+                doc.clear_glyphs()
+                rows = RowMap()
+            self._rewrite_rows(rows, target.rows)
+            for row in current.stamps.diff(target.stamps):
+                old, new = chunk_stamps(current.stamps.get(row)), chunk_stamps(target.stamps.get(row))
+                for col in old.keys() | new.keys():
+                    if old.get(col) != new.get(col):
+                        ch, strikes = new.get(col) or (old[col][0], 0)
+                        doc.set_stamp(ch, row, col, strikes)
+            if len(target.pages) != len(current.pages) or k < len(current.pages):
+                self._reset_paper()
+        doc.take_changes()  # the document is the target version now
+        self.history.version = target
+        self.dirty_rects.append(PAPER_BAND)
+        self.cursor_row, self.cursor_col = target.cursor
+        self.view_offset_px = self.view_offset_for_col(self.cursor_col)
+        if not self.paper_scroll <= self.cursor_row < self.paper_scroll + visible_rows:
+            self.paper_scroll = max(0, self.cursor_row - visible_rows // 2)
+            self.full_redraw = True
+
+    def _rewrite_rows(self, rows, target_rows):
+        for row in rows.diff(target_rows):
+            self.doc.set_row(row, chunk_glyphs(row, target_rows.get(row)))
+            self.paper.rebake_row(row)
+
+    def _checkout_all(self, target):
+        """Go back across OPEN: rebuild the document and saved pages of a version from scratch."""
+        doc = self.doc
+        journal, doc.journal = doc.journal, None
+        try:
+            self.saved_pages = target.store
+            with target.store.lock:
+                target.store.entries[:] = [entry for entry, _ in target.pages]
+            doc.clear_glyphs()
+            doc.clear_stamps()
+            for row, chunk in target.rows.items():
+                doc.set_row(row, chunk_glyphs(row, chunk))
+            for row, chunk in target.stamps.items():
+                for col, (ch, strikes) in chunk_stamps(chunk).items():
+                    doc.set_stamp(ch, row, col, strikes)
+        finally:
+            doc.journal = journal
+        self._reset_paper()
+        if journal is not None:
+            journal.record((J_BASE, self.document_image()))
+
+    # ---------- instrumentation ----------
+    def _cache_counters(self):
+        typecase, paper = self.typecase, self.paper
+        return (typecase.hits, typecase.misses, paper.row_hits, paper.row_misses,
+                paper.compose_hits, paper.compose_misses)
+
+    def enable_instrumentation(self):
+        """Start recording per-frame timings; returns the FrameProbe."""
+        if self.probe is None:
+            probe = self.probe = FrameProbe()
+            self.animator.probe = probe
+            for name in ('play_key', 'play_bell', 'play_thunk'):
+                setattr(self.sounds, name, probe.wrap('sound', getattr(self.sounds, name)))
+            self._probe_base = self._cache_counters()
+        return self.probe
+
+    def visible_glyph_count(self):
+        doc = self.doc
+        return sum(1 for row in range(self.paper_scroll, self.paper_scroll + visible_rows)
+                   for _ in doc.iter_row_glyphs(row))
+
+    def frame_gauges(self, clock=None):
+        """Gauges recorded with each frame; hit rates count lookups since instrumentation was enabled."""
+        c = [now - base for now, base in zip(self._cache_counters(), self._probe_base)]
+        return {
+            'fps': round(clock.get_fps(), 2) if clock else None,
+            'visible_glyphs': self.visible_glyph_count(),
+            'atlas_hit_rate': _hit_rate(c[0], c[1]),
+            'row_hit_rate': _hit_rate(c[2], c[3]),
+            'paper_hit_rate': _hit_rate(c[4], c[5]),
+        }
+
+    def toggle_overlay(self):
+        self.enable_instrumentation()
+        self.show_overlay = not self.show_overlay
+        self.overlay_due_ms = 0
+        if not self.show_overlay:
+            self.screen.fill(BG_COLOR, OVERLAY_RECT)
+            self.dirty_rects.append(OVERLAY_RECT)
+
+    def dump_profile(self, prefix=None):
+        """Write the recorded frames as JSON + CSV (default: typewriter-profile-<time> in the current directory)."""
+        if self.probe is None:
+            print("Instrumentation is off; press F3 (or run with --profile) to start recording.")
+            return None
+        prefix = prefix or os.path.join(os.getcwd(), time.strftime("typewriter-profile-%Y%m%d-%H%M%S"))
+        try:
+            paths = self.probe.dump(prefix)
+        except Exception as e:
+            print("Profile dump failed:", e)
+            return None
+        print("Profile written to", *paths)
+        return paths
+
+    # ---------- document/text helpers & actions ----------
+    def build_text_from_stamps(self):
+        """Build plain-text representation from the stamp model (see write_text_from_stamps)."""
+        buf = io.StringIO()
+        self.write_text_from_stamps(buf)
+        return buf.getvalue()
+
+    def write_text_from_stamps(self, f):
+        """Stream the plain-text representation of the stamps to a file object, one line at a time.
+           Rules:
+             - no stamps => space
+             - one stamp  => that char
+             - >1 stamps  => square char '□' (OVERSTRUCK)
+        """
+        max_row = max(self.doc.stamp_max_row, self.cursor_row, 0)
+        for r in range(max_row + 1):
+            if r:
+                f.write("\n")
+            f.write(self.doc.stamp_line(r))
+
+    def typeset(self, source):
+        """Strike text (a string or a text stream) at the carriage the way typing it would, in bulk.
+
+        Tabs go to tab stops, overstrikes darken, and the rest of a line past the right margin is
+        dropped. No sounds or animations; the carriage ends up after the last character.
+        """
+        self.finalize_pending_glyph()
+        np = _numpy()
+        if np is None:
+            self._typeset_glyphs(source)
+        else:
+            self._typeset_columns(np, source)
+        if self.cursor_row >= self.paper_scroll + visible_rows:
+            self.paper_scroll = self.cursor_row - visible_rows + 1
+        self.view_offset_px = self.view_offset_for_col(self.cursor_col)
+        self._reset_paper()
+        if self.journal is not None:
+            # rather than a record per glyph, the journal takes the whole new state as its base
+            self.journal.record((J_BASE, self.document_image()))
+
+    def _typeset_columns(self, np, source):
+        doc = self.doc
+        rng = np.random.default_rng(self.rng.getrandbits(64))
+        row, col = self.cursor_row, self.cursor_col
+        old = doc.page_table()
+        inked = np.unique(cell_keys(np, np.frombuffer(old.rows, np.int32), np.frombuffer(old.cols, np.uint16)),
+                          return_counts=True) if len(old) else None
+        chunks = []
+        for lines in iter_text_lines(source):
+            columns, end_col = typeset_lines(np, rng, lines, row, col, self.max_col, inked, self.face)
+            chunks.append(columns)
+            self.cursor_row, self.cursor_col = row + len(lines) - 1, end_col
+            row, col = row + len(lines), 0
+        new = {name: np.concatenate([c[name] for c in chunks]) for name, _ in GLYPH_TABLE_COLUMNS}
+        if not len(new['rows']):
+            return
+        self.bell_rung_rows.update(np.unique(new['rows'][new['cols'] >= self.cols_per_line - 2]).tolist())
+
+        if len(old):
+            merged = {name: np.concatenate([np.frombuffer(getattr(old, name), typecode), new[name]])
+                      for name, typecode in GLYPH_TABLE_COLUMNS}
+            if old.max_row >= new['rows'][0]:
+                order = np.argsort(merged['rows'], kind='stable')  # within a row, new strikes land on top
+                merged = {name: column[order] for name, column in merged.items()}
+        else:
+            merged = new
+        stamps = merge_stamps(np, doc.stamp_columns(), new['rows'], new['cols'], new['chars'])
+
+        journal, doc.journal = doc.journal, None  # typeset() journals the result as a whole
+        doc.clear_glyphs()
+        doc.journal = journal
+        doc.attach_table(GlyphTable.from_columns({name: array_column(merged[name], typecode)
+                                                  for name, typecode in GLYPH_TABLE_COLUMNS}),
+                         *numpy_row_index(np, merged['rows']))
+        doc.load_stamp_columns({name: array_column(stamps[name], typecode) for name, typecode in STAMP_COLUMNS},
+                               *numpy_row_index(np, stamps['rows']))
+
+    def _typeset_glyphs(self, source):
+        # without numpy: the same layout and ink, one Glyph at a time
+        doc, rng = self.doc, self.rng
+        journal, doc.journal = doc.journal, None
+        row, col = self.cursor_row, self.cursor_col
+        for lines in iter_text_lines(source):
+            for i, line in enumerate(lines):
+                start = col if i == 0 else 0
+                if '\t' in line:
+                    line = expand_tabs(line, start, self.max_col)
+                for c, ch in enumerate(_whitespace_to_space(line[:max(0, self.max_col + 1 - start)]), start):
+                    strikes = doc.count_strikes_at(row + i, c)
+                    if c == self.max_col:
+                        jitter_x = rng.randint(-2, 2) if strikes else rng.randint(-1, 1)
+                        jitter_y = rng.randint(-2, 2) if strikes else rng.randint(-1, 2)
+                    else:
+                        jitter_x, jitter_y = rng.uniform(-0.5, 0.5), rng.uniform(-0.5, 0.5)
+                    darkness = min(1.0, rng.uniform(0.6, 0.95) + 0.12 * strikes)
+                    doc.add_glyph(Glyph(ch, row + i, c, jitter_x, jitter_y, darkness, face=self.face))
+                    doc.record_stamp(ch, row + i, c)
+                    if c >= self.cols_per_line - 2:
+                        self.bell_rung_rows.add(row + i)
+                self.cursor_row, self.cursor_col = row + i, min(start + len(line), self.off_col)
+            row, col = row + len(lines), 0
+        doc.journal = journal
+
+    def load_text_into_glyphs(self, text):
+        """Replace the page (and its stamps) with text, a string or a text stream, typeset from the top."""
+        self.commit_history()
+        self.doc.clear_glyphs()
+        self.doc.clear_stamps()
+        self.bell_rung_rows = set()
+        self.cursor_row, self.cursor_col = 0, 0
+        self.paper_scroll = 0
+        self.typeset(text)
+        self.cursor_row = max(TOP_MARGIN_LINES, self.cursor_row)
+        self.cursor_col = min(self.cursor_col, self.max_col)
+        self.paper_scroll = max(0, self.cursor_row - visible_rows + 1)
+        self.view_offset_px = self.view_offset_for_col(self.cursor_col)
+        self.commit_history()
+
+    def paste_clipboard(self):
+        text = clipboard_text()
+        if text:
+            self.commit_history()
+            self.typeset(text)
+            self.commit_history()
+
+    def document_image(self):
+        """Every page with its full ink state, the stamps and the cursor (see write_native)."""
+        pages = self.saved_pages.view([self.doc.page_table()])
+        return DocumentImage(pages, self.doc.stamp_columns(), (self.cursor_row, self.cursor_col), self.cols_per_line)
+
+    def save_native(self, path):
+        write_native(path, self.document_image())
+
+    def load_native(self, path):
+        """Open a native document: memory-mapped, with the current page's rows decoded as they are drawn."""
+        image, _ = read_native(path)
+        self.commit_history()
+        self.doc.clear_glyphs()
+        self.doc.attach_table(image.pages[-1], *image.row_index[-1])
+        self.doc.load_stamp_columns(image.stamps, *image.stamp_index)
+        self.saved_pages = PageStore(image.pages[:-1])
+        self.cursor_row, self.cursor_col = image.cursor or (TOP_MARGIN_LINES, 0)
+        self.cursor_col = min(self.cursor_col, self.off_col)
+        self.paper_scroll = max(0, self.cursor_row - visible_rows + 1)
+        self.bell_rung_rows = set()
+        self.view_offset_px = self.view_offset_for_col(self.cursor_col)
+        self._reset_paper()
+        if self.journal is not None:
+            self.journal.record((J_BASE, image))
+        self.commit_history()
+
+    def _reset_paper(self):
+        self.animator.cancel('view')
+        self.animator.cancel('scroll')
+        self.paper_scroll_offset_px = 0.0
+        self.paper.reset()
+        self.full_redraw = True
+
+    def _start_fresh_page(self):
+        self.doc.clear_glyphs()
+        self.cursor_col = 0
+        self.cursor_row = TOP_MARGIN_LINES
+        self.paper_scroll = 0
+        self.bell_rung_rows.clear()
+        self.view_offset_px = self.view_offset_for_col(self.cursor_col)
+        self._reset_paper()
+
+    def render_visible_page(self):
+        """The visible paper area as rendered (jitter, darkness, stacked glyphs), for a quick PNG."""
+        surf = pygame.Surface((PAPER_W, PAPER_H))
+        surf.fill(PAPER_COLOR)
+        for i in range(visible_rows + 1):
+            y = i * LINE_HEIGHT + int(self.paper_scroll_offset_px)
+            pygame.draw.line(surf, (230, 230, 220), (10, y), (PAPER_W - 10, y), 1)
+        min_row = self.paper_scroll
+        max_row = self.paper_scroll + visible_rows - 1
+        base_x = LEFT_MARGIN + int(self.view_offset_px)
+        for g in (g for row in range(min_row, max_row + 1) for g in self.doc.iter_row_glyphs(row)):
+            x = base_x + (g.col * self.char_width) + g.offset_x
+            y = (g.row - self.paper_scroll) * LINE_HEIGHT + g.offset_y + int(self.paper_scroll_offset_px)
+            self.typecase.blit(surf, g.char, g.darkness, g.face, x, y)
+        return surf
+
+    def action_clear(self):
+        self.commit_history()
+        self._start_fresh_page()
+        self.commit_history()
+
+    def action_new_page(self):
+        self.commit_history()
+        if self.journal is not None:
+            self.journal.record((J_NEW_PAGE,))
+        self.saved_pages.append(self.doc.page_table())
+        self._start_fresh_page()
+        self.commit_history()
+
+    def action_save_as(self):
+        fname = ask_save_text_and_write(self)
+        if fname:
+            print("Saved to", fname)
+
+    def action_open(self):
+        fname = ask_open_file_and_load(self)
+        if fname:
+            print("Loaded", fname)
+
+    def export_document(self, path, dpi=EXPORT_DPI, include_saved_pages=EXPORT_SAVED_PAGES):
+        """Start exporting the current page (and the saved pages before it) on a worker thread: to PNG,
+        or to SVG or PDF when path ends in .svg / .pdf.
+
+        Returns the ExportJob, or None if an export is still running. The pages are snapshotted first,
+        so typing on while it runs does not affect the output.
+        """
+        if self.export_job is not None:
+            print("An export is already running")
+            return None
+        current = self.doc.page_table()
+        pages = self.saved_pages.view([current]) if include_saved_pages else [current]
+        self.export_job = ExportJob(pages, path, self.char_width, dpi)
+        self.export_job.start()
+        return self.export_job
+
+    def export_percent(self):
+        return None if self.export_job is None else int(self.export_job.progress * 100)
+
+    def action_export(self):
+        fname = ask_export_path(self.dialogs)
+        if fname:
+            self.export_document(fname)
+
+    def action_toggle_edit(self):
+        self.authentic_mode = not self.authentic_mode
+
+    def action_quit(self):
+        self.running = False
+
+    # ---------- helper that performs the action when a pending key is released ----------
+    def perform_key_action_from_event(self, pd):
+        k = pd.key
+        ch = pd.unicode
+
+        # LEFT key: move left
+        if k == pygame.K_LEFT:
+            if self.cursor_col > 0:
+                self.cursor_col -= 1
+                self.animate_view_to_col_blocky(self.cursor_col, steps=3, step_ms=10)
+            return
 
+        # RIGHT key: move right
+        if k == pygame.K_RIGHT:
+            if self.cursor_col < self.off_col:
+                self.cursor_col += 1
+                if self.cursor_col == self.off_col:
+                    self.animate_view_to_col_blocky(self.off_col, steps=4, step_ms=36, play_thunk_at_end=True, thunk_delay_ms=8)
+                else:
+                    self.animate_view_to_col_blocky(self.cursor_col, steps=3, step_ms=10)
+            return
 
-# ---------- helper that performs the action when a pending key is released ----------
-def perform_key_action_from_event(pd):
-    global cursor_col, cursor_row, paper_scroll, view_offset_px
+        # BACKSPACE
+        if k == pygame.K_BACKSPACE:
+            if self.cursor_col == self.off_col:
+                self.animate_view_to_col_blocky(self.max_col, steps=3, step_ms=10)
+                self.cursor_col = self.max_col
+            elif self.cursor_col > 0:
+                if self.authentic_mode:
+                    self.cursor_col -= 1
+                    self.animate_view_to_col_blocky(self.cursor_col, steps=3, step_ms=10)
+                else:
+                    remove_col = self.cursor_col - 1
+                    # remove ALL glyphs at this (row, col) to fully clear the cell
+                    removed = self.doc.remove_cell(self.cursor_row, remove_col)
+                    if removed:
+                        self.paper.rebake_row(self.cursor_row)
+                        self.mark_cell_dirty(self.cursor_row, remove_col)
+                    # move left (whether or not anything was removed)
+                    self.cursor_col = max(0, self.cursor_col - 1)
+                    self.animate_view_to_col_blocky(self.cursor_col, steps=3, step_ms=36)
+            return
 
-    k = pd.key
-    ch = pd.unicode
+        # RETURN / ENTER: snap vertically, then smooth horizontal slide
+        if k == pygame.K_RETURN:
+            # snap down to next line (immediate)
+            cursor_distance = self.cursor_col  # Used for calculating animation duration
+            self.cursor_row += 1
+            self.cursor_col = 0
 
-    # LEFT key: move left
-    if k == pygame.K_LEFT:
-        if cursor_col > 0:
-            cursor_col -= 1
-            animate_view_to_col_blocky(cursor_col, steps=3, step_ms=10)
-        return
+            # if we've moved past visible area, snap the paper_scroll immediately
+            if self.cursor_row >= self.paper_scroll + visible_rows:
+                self.animator.cancel('scroll')
+                self.paper_scroll = self.cursor_row - visible_rows + 1
+                self.paper_scroll_offset_px = 0.0
 
-    # RIGHT key: move right
-    if k == pygame.K_RIGHT:
-        if cursor_col < OFF_COL:
-            cursor_col += 1
-            if cursor_col == OFF_COL:
-                animate_view_to_col_blocky(OFF_COL, steps=4, step_ms=36, play_thunk_at_end=True, thunk_delay_ms=8)
-            else:
-                animate_view_to_col_blocky(cursor_col, steps=3, step_ms=10)
-        return
-
-    # BACKSPACE
-    if k == pygame.K_BACKSPACE:
-        if cursor_col == OFF_COL:
-            animate_view_to_col_blocky(MAX_COL, steps=3, step_ms=10)
-            cursor_col = MAX_COL
-        elif cursor_col > 0:
-            if authentic_mode:
-                cursor_col -= 1
-                animate_view_to_col_blocky(cursor_col, steps=3, step_ms=10)
-            else:
-                remove_col = cursor_col - 1
-                # remove ALL glyphs at this (row, col) to fully clear the cell
-                new_glyphs = [gg for gg in glyphs if not (gg['row'] == cursor_row and gg['col'] == remove_col)]
-                removed = len(new_glyphs) != len(glyphs)
-                glyphs[:] = new_glyphs  # update in-place
-                # move left (whether or not anything was removed)
-                cursor_col = max(0, cursor_col - 1)
-                animate_view_to_col_blocky(cursor_col, steps=3, step_ms=36)
-        return
-
-    # RETURN / ENTER: snap vertically, then smooth horizontal slide
-    if k == pygame.K_RETURN:
-        # snap down to next line (immediate)
-        cursor_distance = cursor_col  # Used for calculating animation duration
-        cursor_row += 1
-        cursor_col = 0
-
-        # if we've moved past visible area, snap the paper_scroll immediately
-        if cursor_row >= paper_scroll + visible_rows:
-            paper_scroll = cursor_row - visible_rows + 1
-            paper_scroll_offset_px = 0.0
-
-        # redraw once so the vertical snap is visible immediately
-        draw()
-        pygame.display.flip()
-
-        # then smoothly slide the page so column 0 lines up under the carriage
-        animate_view_to_col_smooth(0, duration_ms=cursor_distance * 25)
-
-        # if the new cursor_row is beyond visible area (already snapped), optionally animate vertical feed
-        # (we used snap behavior per your request; if you'd rather animate vertical feed, call animate_paper_scroll_to instead)
-        return
-
-    # Printable: for printable keys, the glyph was already appended on KEYDOWN with pending=True.
-    # Here we finalize that glyph (clear pending flag), then advance cursor_col and animate view.
-    if ch and len(ch) == 1 and k not in MODIFIER_KEYS:
-        # find the last pending glyph (should exist)
-        for i in range(len(glyphs) - 1, -1, -1):
-            g = glyphs[i]
-            if g.get('pending', False) and g['row'] == cursor_row:
-                # finalize it
-                g['pending'] = False
-                break
-        # Now advance cursor_col and animate (do not re-play strike here; it already played on KEYDOWN)
-        if cursor_col >= MAX_COL:
-            # move off-paper
-            cursor_col = OFF_COL
-            animate_view_to_col_blocky(OFF_COL, steps=4, step_ms=10, play_thunk_at_end=True, thunk_delay_ms=8)
-        else:
-            cursor_col += 1
-            animate_view_to_col_blocky(cursor_col, steps=3, step_ms=10)
-        return
+            # then smoothly slide the page so column 0 lines up under the carriage
+            self.animate_view_to_col_smooth(0, duration_ms=cursor_distance * 25)
 
+            # if the new cursor_row is beyond visible area (already snapped), optionally animate vertical feed
+            # (we used snap behavior per your request; if you'd rather animate vertical feed, call animate_paper_scroll_to instead)
+            return
 
-# ---------- main event loop ----------
-COMMAND_BAR_H = 96
-COMMAND_BAR_Y = H - COMMAND_BAR_H
+        # Printable: for printable keys, the glyph was already appended on KEYDOWN with pending=True.
+        # Here we finalize that glyph (clear pending flag), then advance cursor_col and animate view.
+        if ch and len(ch) == 1 and k not in MODIFIER_KEYS:
+            self.finalize_pending_glyph()
+            # Now advance cursor_col and animate (do not re-play strike here; it already played on KEYDOWN)
+            if self.cursor_col >= self.max_col:
+                # move off-paper
+                self.cursor_col = self.off_col
+                self.animate_view_to_col_blocky(self.off_col, steps=4, step_ms=10, play_thunk_at_end=True, thunk_delay_ms=8)
+            else:
+                self.cursor_col += 1
+                self.animate_view_to_col_blocky(self.cursor_col, steps=3, step_ms=10)
+            return
 
-running = True
-while running:
-    for ev in pygame.event.get():
+    # ---------- event handling ----------
+    def _lock(self, ev):
+        self.key_locked = True
+        self.locked_key = ev.key
+        self.pending_keydown = ev
+        if ev.unicode and len(ev.unicode) == 1 and ev.unicode.isprintable():
+            self.locked_char_display = ev.unicode
+        else:
+            self.locked_char_display = pygame.key.name(ev.key)
+
+    def _unlock(self):
+        self.key_locked = False
+        self.locked_key = None
+        self.locked_char_display = ""
+
+    def strike(self, raw_ch):
+        """Strike raw_ch at the carriage: play the strike, add the pending glyph and its stamp."""
+        rng = self.rng
+        doc = self.doc
+        row, col = self.cursor_row, self.cursor_col
+        # if it's a tab or other whitespace, turn it into a space character.
+        ch_to_draw = ' ' if raw_ch.isspace() else raw_ch
+
+        # compute strike properties at current column
+        if col >= self.max_col:
+            strikes = doc.count_strikes_at(row, self.max_col)
+            if row not in self.bell_rung_rows:
+                # ring bell on first contact
+                self.sounds.play_bell()
+                self.bell_rung_rows.add(row)
+        else:
+            strikes = doc.count_strikes_at(row, col)
+            if col >= self.cols_per_line - 2 and row not in self.bell_rung_rows:
+                self.sounds.play_bell()
+                self.bell_rung_rows.add(row)
+
+        # play strike now (on KEYDOWN)
+        self.sounds.play_key()
+
+        # append glyph with pending=True so KEYUP can finalize & advance
+        base_dark = rng.uniform(0.6, 0.95)
+        darkness = min(1.0, base_dark + 0.12 * strikes)
+        if col >= self.max_col:
+            jitter_x = rng.randint(-2, 2) if strikes > 0 else rng.randint(-1, 1)
+            jitter_y = rng.randint(-2, 2) if strikes > 0 else rng.randint(-1, 2)
+        else:
+            jitter_x = rng.uniform(-0.5, 0.5)
+            jitter_y = rng.uniform(-0.5, 0.5)
+
+        g = Glyph(ch_to_draw, row, col,
+                  offset_x=jitter_x, offset_y=jitter_y, darkness=darkness, pending=True, face=self.face)
+        # a glyph left pending by a key that never finalized it (e.g. Return) is done now
+        self.finalize_pending_glyph()
+        doc.add_glyph(g)
+        doc.pending_glyph = g
+        self.mark_cell_dirty(row, col)
+        # record a permanent stamp for saving (do not remove this when the user backspaces in editor mode)
+        doc.record_stamp(ch_to_draw, row, col)
+        return g
+
+    def strike_tab(self):
+        """Expand a tab to the next tab stop, striking each space as a normal (already final) glyph."""
+        rng = self.rng
+        doc = self.doc
+        # Compute spaces needed to next tab stop
+        spaces_needed = TAB_SIZE - (self.cursor_col % TAB_SIZE)
+        for _ in range(spaces_needed):
+            if self.cursor_col >= self.max_col:
+                break  # stop if we run out of room in line
+            strikes = doc.count_strikes_at(self.cursor_row, self.cursor_col)
+            base_darkness = rng.uniform(0.6, 0.95)
+            darkness = min(1.0, base_darkness + 0.12 * strikes)
+            jitter_x = rng.uniform(-0.5, 0.5)
+            jitter_y = rng.uniform(-0.5, 0.5)
+
+            # nothing waits on a tab's KEYUP, so the spaces are baked right away
+            g = Glyph(' ', self.cursor_row, self.cursor_col,
+                      offset_x=jitter_x, offset_y=jitter_y, darkness=darkness, face=self.face)
+            doc.add_glyph(g)
+            self.bake_glyph(g)
+            # record a permanent stamp for saving (do not remove this when the user backspaces in editor mode)
+            doc.record_stamp(' ', self.cursor_row, self.cursor_col)
+
+            self.cursor_col += 1
+
+    def handle_event(self, ev):
+        """Process one pygame event. Returns False once the typewriter should quit."""
         if ev.type == pygame.QUIT:
-            running = False
+            self.running = False
 
-        # animations buffer and repost events internally; ignore processing here while animating
-        if animating:
-            continue
+        if ev.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+            self.full_redraw = True
 
         # mouse -> command bar
         if ev.type == pygame.MOUSEBUTTONDOWN and ev.button == 1:
             mx, my = ev.pos
             if my >= COMMAND_BAR_Y:
-                for rect, bid in button_rects:
+                for rect, bid in self.button_rects:
                     if rect.collidepoint(mx, my):
-                        fn = action_map.get(bid)
+                        fn = self.action_map.get(bid)
                         if fn:
                             fn()
                         break
-                continue
+            elif self.show_overview and PAPER_BAND.collidepoint(mx, my):
+                self.overview_click(mx, my - PAPER_Y)
+            return self.running
+
+        if ev.type == pygame.MOUSEWHEEL and self.show_overview:
+            self.overview.scroll_by(-ev.y * OVERVIEW_GAP * 2)
+            return self.running
 
         # KEYDOWN: for printable keys, draw + strike now; for others, lock pending and wait for KEYUP to act
         if ev.type == pygame.KEYDOWN:
-            # Special-case: if the carriage is off-paper, allow movement/backspace/return immediately
-            if ev.key in (pygame.K_BACKSPACE, pygame.K_RETURN, pygame.K_LEFT, pygame.K_RIGHT) and cursor_col == OFF_COL:
-                # perform immediately (bypass pending lock) so user can come back from off-paper
-                # We call the same handler used on KEYUP to keep behavior consistent.
-                # Temporarily set a lock indicator for UX, perform action, then clear lock.
-                key_locked = True
-                locked_key = ev.key
-                locked_char_display = pygame.key.name(ev.key)
-                # call the same function that performs actions on KEYUP (use the event directly)
-                perform_key_action_from_event(ev)
-                # release lock (perform_key_action_from_event does animations)
-                key_locked = False
-                locked_key = None
-                locked_char_display = ""
-                continue
+            self.handle_keydown(ev)
+        # KEYUP: if it's the same locked key, perform its action now
+        elif ev.type == pygame.KEYUP:
+            self.handle_keyup(ev)
+        return self.running
 
-            # quit
-            if ev.key == pygame.K_ESCAPE:
-                running = False
-                continue
+    def handle_keydown(self, ev):
+        if self.find_query is not None and self.handle_find_key(ev):
+            return
+        # Ctrl+F (Cmd+F): find, also from the overview
+        if ev.key == pygame.K_f and ev.mod & (pygame.KMOD_CTRL | pygame.KMOD_META):
+            self.open_find()
+            return
+        if self.show_overview and self.handle_overview_key(ev):
+            return
 
-            # Up/Down: immediate view-only
-            if ev.key == pygame.K_UP:
-                target = max(0, paper_scroll - 1)
-                if target != paper_scroll:
-                    animate_paper_scroll_to(target, duration_ms=180)
-                continue
-            if ev.key == pygame.K_DOWN:
-                max_row = max(cursor_row, max([g['row'] for g in glyphs], default=0))
-                max_scroll = max(0, max_row - visible_rows + 1)
-                target = min(max_scroll, paper_scroll + 1)
-                if target != paper_scroll:
-                    animate_paper_scroll_to(target, duration_ms=180)
-                continue
+        # Special-case: if the carriage is off-paper, allow movement/backspace/return immediately
+        if ev.key in (pygame.K_BACKSPACE, pygame.K_RETURN, pygame.K_LEFT, pygame.K_RIGHT) and self.cursor_col == self.off_col:
+            # perform immediately (bypass pending lock) so user can come back from off-paper
+            # We call the same handler used on KEYUP to keep behavior consistent.
+            # Temporarily set a lock indicator for UX, perform action, then clear lock.
+            self.key_locked = True
+            self.locked_key = ev.key
+            self.locked_char_display = pygame.key.name(ev.key)
+            # call the same function that performs actions on KEYUP (use the event directly)
+            self.perform_key_action_from_event(ev)
+            # release lock (perform_key_action_from_event starts the animations)
+            self._unlock()
+            return
 
-            if ev.key in MODIFIER_KEYS:
-                continue
+        # quit
+        if ev.key == pygame.K_ESCAPE:
+            self.running = False
+            return
 
-            # If a key is already locked, ignore
-            if key_locked:
-                continue
+        # instrumentation overlay / dump
+        if ev.key == pygame.K_F3:
+            self.toggle_overlay()
+            return
+        if ev.key == pygame.K_F4:
+            self.dump_profile()
+            return
+        if ev.key == pygame.K_F2:
+            self.toggle_overview()
+            return
 
-            # Printable character: draw immediately and play strike, but do NOT advance cursor or move view until KEYUP.
-            if ev.unicode and len(ev.unicode) == 1 and ev.key not in MODIFIER_KEYS:
-                # if off-paper, ignore (no strike)
-                if cursor_col == OFF_COL:
-                    continue
+        # Ctrl+V (Cmd+V): typeset the clipboard at the carriage
+        if ev.key == pygame.K_v and ev.mod & (pygame.KMOD_CTRL | pygame.KMOD_META):
+            self.paste_clipboard()
+            return
 
-                # normalize whitespace characters so the font doesn't get a control char
-                raw_ch = ev.unicode
-
-                # Handle tabs
-                if raw_ch == '\t':
-                    # Compute spaces needed to next tab stop
-                    spaces_needed = TAB_SIZE - (cursor_col % TAB_SIZE)
-                    for _ in range(spaces_needed):
-                        if cursor_col >= MAX_COL:
-                            break  # stop if we run out of room in line
-                        strikes = count_strikes_at(cursor_row, cursor_col)
-                        base_darkness = random.uniform(0.6, 0.95)
-                        darkness = min(1.0, base_darkness + 0.12 * strikes)
-                        jitter_x = random.uniform(-0.5, 0.5)
-                        jitter_y = random.uniform(-0.5, 0.5)
-
-                        g = {
-                            'char': ' ',
-                            'row': cursor_row,
-                            'col': cursor_col,
-                            'offset_x': jitter_x,
-                            'offset_y': jitter_y,
-                            'darkness': darkness,
-                            'pending': True
-                        }
-                        glyphs.append(g)
-                        # record a permanent stamp for saving (do not remove this when the user backspaces in editor mode)
-                        stamp_history.append({'char': ' ', 'row': cursor_row, 'col': cursor_col})
-
-                        cursor_col += 1
-                    continue
+        # Ctrl+Z / Ctrl+Shift+Z or Ctrl+Y (Cmd on macOS): undo / redo; F5 / F6: take / restore a snapshot
+        if ev.key in (pygame.K_z, pygame.K_y) and ev.mod & (pygame.KMOD_CTRL | pygame.KMOD_META):
+            if ev.key == pygame.K_y or ev.mod & pygame.KMOD_SHIFT:
+                self.redo()
+            else:
+                self.undo()
+            return
+        if ev.key == pygame.K_F5:
+            self.take_snapshot()
+            return
+        if ev.key == pygame.K_F6:
+            self.restore_snapshot()
+            return
 
-                # if it's a tab or other whitespace, turn it into a space character.
-                if raw_ch.isspace():
-                    ch_to_draw = ' '
-                else:
-                    ch_to_draw = raw_ch
-
-                # Lock and store pending event
-                key_locked = True
-                locked_key = ev.key
-                pending_keydown = ev
-                if ev.unicode.isprintable():
-                    locked_char_display = ev.unicode
-                else:
-                    locked_char_display = pygame.key.name(ev.key)
-
-                # compute strike properties at current column
-                if cursor_col >= MAX_COL:
-                    strikes = count_strikes_at(cursor_row, MAX_COL)
-                    if cursor_row not in bell_rung_rows:
-                        # ring bell on first contact
-                        play_bell()
-                        bell_rung_rows.add(cursor_row)
-                else:
-                    strikes = count_strikes_at(cursor_row, cursor_col)
-                    if cursor_col >= cols_per_line - 2 and cursor_row not in bell_rung_rows:
-                        play_bell()
-                        bell_rung_rows.add(cursor_row)
-
-                # play strike now (on KEYDOWN)
-                play_key()
-
-                # append glyph with pending=True so KEYUP can finalize & advance
-                base_dark = random.uniform(0.6, 0.95)
-                darkness = min(1.0, base_dark + 0.12 * strikes)
-                if cursor_col >= MAX_COL:
-                    jitter_x = random.randint(-2, 2) if strikes > 0 else random.randint(-1, 1)
-                    jitter_y = random.randint(-2, 2) if strikes > 0 else random.randint(-1, 2)
-                    col_for_glyph = MAX_COL
-                else:
-                    jitter_x = random.uniform(-0.5, 0.5)
-                    jitter_y = random.uniform(-0.5, 0.5)
-                    col_for_glyph = cursor_col
-
-                g = {
-                    'char': ch_to_draw,
-                    'row': cursor_row,
-                    'col': cursor_col,
-                    'offset_x': jitter_x,
-                    'offset_y': jitter_y,
-                    'darkness': darkness,
-                    'pending': True
-                }
-                glyphs.append(g)
-                # record a permanent stamp for saving (do not remove this when the user backspaces in editor mode)
-                stamp_history.append({'char': ch_to_draw, 'row': cursor_row, 'col': cursor_col})
+        # F7 / F8: swap the typeball for the next typeface / size (Shift: the previous one)
+        if ev.key in (pygame.K_F7, pygame.K_F8):
+            self.cycle_typeball(ev.key, back=bool(ev.mod & pygame.KMOD_SHIFT))
+            return
 
-                # do NOT advance cursor_col or move view here
-                continue
+        # Up/Down: immediate view-only (a feed still in flight lands first so repeats accumulate)
+        if ev.key in (pygame.K_UP, pygame.K_DOWN):
+            self.animator.finish('scroll')
+        if ev.key == pygame.K_UP:
+            target = max(0, self.paper_scroll - 1)
+            if target != self.paper_scroll:
+                self.animate_paper_scroll_to(target, duration_ms=180)
+            return
+        if ev.key == pygame.K_DOWN:
+            max_row = max(self.cursor_row, self.doc.max_glyph_row, 0)
+            max_scroll = max(0, max_row - visible_rows + 1)
+            target = min(max_scroll, self.paper_scroll + 1)
+            if target != self.paper_scroll:
+                self.animate_paper_scroll_to(target, duration_ms=180)
+            return
+
+        if ev.key in MODIFIER_KEYS:
+            return
+
+        # If a key is already locked, ignore
+        if self.key_locked:
+            return
+
+        # Printable character: draw immediately and play strike, but do NOT advance cursor or move view until KEYUP.
+        if ev.unicode and len(ev.unicode) == 1 and ev.key not in MODIFIER_KEYS:
+            # if off-paper, ignore (no strike)
+            if self.cursor_col == self.off_col:
+                return
+
+            # Handle tabs
+            if ev.unicode == '\t':
+                self.strike_tab()
+                return
+
+            # Lock and store pending event, then strike (do NOT advance cursor_col or move view here)
+            self._lock(ev)
+            self.strike(ev.unicode)
+            return
+
+        # Non-printable keys: accept as pending (lock) and wait for KEYUP to act
+        # (Left/Right/Backspace/Return); don't perform the action yet
+        self._lock(ev)
 
-            # Non-printable keys: accept as pending (lock) and wait for KEYUP to act
-            # (Left/Right/Backspace/Return)
-            key_locked = True
-            locked_key = ev.key
-            pending_keydown = ev
-            if ev.unicode and len(ev.unicode) == 1 and ev.unicode.isprintable():
-                locked_char_display = ev.unicode
+    def handle_keyup(self, ev):
+        if ev.key in MODIFIER_KEYS:
+            return
+        if self.key_locked and ev.key == self.locked_key and self.pending_keydown is not None:
+            pd = self.pending_keydown
+            self.pending_keydown = None
+            # perform the action (this will start animations and play sounds for non-printables
+            # printable case will not replay the strike sound because we already did on KEYDOWN)
+            self.perform_key_action_from_event(pd)
+            # release lock after action finishes
+            self._unlock()
+        # otherwise ignore unmatched keyup
+
+    def type_text(self, text, settle=True):
+        """Drive the engine programmatically: press and release a key for every character of text.
+
+        '\\n' is Return, '\\t' Tab and '\\b' Backspace; with settle, animations land after each key.
+        """
+        for ch in text:
+            if ch == '\n':
+                key, uni = pygame.K_RETURN, '\r'
+            elif ch == '\t':
+                key, uni = pygame.K_TAB, '\t'
+            elif ch == '\b':
+                key, uni = pygame.K_BACKSPACE, '\x08'
             else:
-                locked_char_display = pygame.key.name(ev.key)
-            # don't perform the action yet
-            continue
+                key, uni = ord(ch), ch
+            self.handle_event(pygame.event.Event(pygame.KEYDOWN, key=key, unicode=uni, mod=0))
+            self.handle_event(pygame.event.Event(pygame.KEYUP, key=key, unicode=uni, mod=0))
+            if settle:
+                self.settle()
+
+
+# ---------- input traces ----------
+# --record FILE writes the input of a session to a trace: JSON lines, a header and then one line per
+# key or mouse event with its time in ms since recording started. typewriter_replay.py plays a trace
+# back into run() and measures how the typewriter kept up.
+TRACE_VERSION = 1
+TRACE_EVENTS = {
+    pygame.KEYDOWN: ('key', 'mod', 'unicode', 'scancode'),
+    pygame.KEYUP: ('key', 'mod', 'unicode', 'scancode'),
+    pygame.MOUSEBUTTONDOWN: ('pos', 'button'),
+    pygame.MOUSEBUTTONUP: ('pos', 'button'),
+    pygame.MOUSEWHEEL: ('x', 'y'),
+}
 
-        # KEYUP: if it's the same locked key, perform its action now
-        if ev.type == pygame.KEYUP:
-            if ev.key in MODIFIER_KEYS:
-                continue
-            if key_locked and ev.key == locked_key and pending_keydown is not None:
-                pd = pending_keydown
-                pending_keydown = None
-                # perform the action (this will do animations and play sounds for non-printables
-                # printable case will not replay the strike sound because we already did on KEYDOWN)
-                perform_key_action_from_event(pd)
-                # release lock after action finishes
-                key_locked = False
-                locked_key = None
-                locked_char_display = ""
-            # otherwise ignore unmatched keyup
-            continue
-
-    draw()
-    pygame.display.flip()
-    clock.tick(60)
-
-pygame.quit()
-sys.exit()
+
+def event_record(ev, t_ms):
+    """The trace line of an event, or None for the kinds of event that are not traced."""
+    fields = TRACE_EVENTS.get(ev.type)
+    if fields is None:
+        return None
+    rec = {'t': round(t_ms, 3), 'type': pygame.event.event_name(ev.type)}
+    for name in fields:
+        value = getattr(ev, name, None)
+        if value is not None:
+            rec[name] = list(value) if isinstance(value, tuple) else value
+    return rec
+
+
+def record_event(rec, **extra):
+    """The pygame event of a trace line; extra attributes (e.g. the time it is due) are attached to it."""
+    kind = getattr(pygame, rec['type'].upper())  # KeyDown -> pygame.KEYDOWN, ...
+    attrs = {k: (tuple(v) if isinstance(v, list) else v) for k, v in rec.items() if k not in ('t', 'type')}
+    return pygame.event.Event(kind, **attrs, **extra)
+
+
+class EventRecorder:
+    """An event source for run() that passes on the events of `source` and traces them to path."""
+
+    def __init__(self, path, source=None):
+        self.source = source or pygame.event.get
+        self.file = open(path, "w", encoding="utf-8")
+        self.file.write(json.dumps({'trace': TRACE_VERSION, 'size': [W, H], 'started': time.time()}) + "\n")
+        self.t0 = time.perf_counter()
+
+    def __call__(self):
+        events = self.source()
+        t_ms = (time.perf_counter() - self.t0) * 1000.0
+        for ev in events:
+            rec = event_record(ev, t_ms)
+            if rec is not None:
+                self.file.write(json.dumps(rec) + "\n")
+        return events
+
+    def close(self):
+        self.file.close()
+
+
+def read_trace(path):
+    """(header, records) of a trace file."""
+    with open(path, "r", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get('trace') != TRACE_VERSION:
+            raise ValueError(f"{path} is not a version {TRACE_VERSION} typewriter trace")
+        return header, [json.loads(line) for line in f if line.strip()]
+
+
+# ---------- main event loop ----------
+def run(engine, clock=None, events=None):
+    """The main loop; events is the () -> [event] source polled once per frame (pygame.event.get)."""
+    clock = clock or pygame.time.Clock()
+    events = events or pygame.event.get
+    while engine.running:
+        t0 = time.perf_counter()
+        for ev in events():
+            engine.handle_event(ev)
+        t1 = time.perf_counter()
+        engine.update()
+        if engine.probe:
+            engine.probe.add('events', t1 - t0)
+            engine.probe.add('update', time.perf_counter() - t1)
+        engine.present()
+        if engine.probe:
+            engine.probe.end_frame(engine.frame_gauges(clock))
+        # tick faster while the carriage moves so blocky steps of ~10 ms are not swallowed by the frame rate
+        clock.tick(120 if engine.animator.tweens else 60)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mechanical typewriter simulation.")
+    parser.add_argument("--profile", metavar="PREFIX",
+                        help="record frame timings from the start and write PREFIX.json / PREFIX.csv on exit")
+    parser.add_argument("--overlay", action="store_true", help="show the instrumentation overlay (also F3)")
+    parser.add_argument("--no-autosave", action="store_true",
+                        help=f"do not journal the session to {AUTOSAVE_DIR} (nor recover one from it)")
+    parser.add_argument("--record", metavar="FILE",
+                        help="trace every key and mouse event to FILE (replay it with typewriter_replay.py)")
+    parser.add_argument("--typeset", metavar="FILE",
+                        help="type FILE (- for stdin) onto the page at startup, in bulk")
+    parser.add_argument("--file-picker", choices=["auto", "tk", "pygame"], default=DIALOG_BACKEND,
+                        help="native (Tk) file dialogs, the in-window picker, or Tk when available (default)")
+    parser.add_argument("--no-asset-cache", action="store_true",
+                        help=f"rebuild sounds and ink stamps instead of reading them from {ASSET_CACHE_DIR}")
+    parser.add_argument("--serve", metavar="[HOST:]PORT", type=parse_address,
+                        help=f"stream the session to typewriter_viewer.py viewers (host {BROADCAST_HOST} unless "
+                             "given; 0.0.0.0 for the local network)")
+    args = parser.parse_args(argv)
+
+    pygame.init()
+    try:
+        pygame.mixer.init()
+    except Exception:
+        pass
+
+    pygame.key.set_repeat(0)
+
+    screen = pygame.display.set_mode((W, H))
+    pygame.display.set_caption("Typewriter — Draw on KeyDown, Move on KeyUp")
+    engine = TypewriterEngine(screen, journal_dir=None if args.no_autosave else AUTOSAVE_DIR,
+                              asset_cache=None if args.no_asset_cache else AssetCache(),
+                              dialog_backend=args.file_picker)
+    if args.typeset:
+        if args.typeset == "-":
+            engine.typeset(sys.stdin)
+        else:
+            with open(args.typeset, "r", encoding="utf-8") as f:
+                engine.typeset(f)
+    if args.serve:
+        try:
+            server = engine.start_broadcast(*args.serve)
+            print(f"Broadcasting on {server.host}:{server.port}")
+        except OSError as e:
+            print("Broadcast disabled:", e)
+    if args.profile:
+        engine.enable_instrumentation()
+    if args.overlay:
+        engine.toggle_overlay()
+    recorder = EventRecorder(args.record) if args.record else None
+    run(engine, events=recorder)
+    if recorder is not None:
+        recorder.close()
+    if engine.export_job is not None:
+        print("Finishing export...")
+        engine.export_job.join()
+        engine.update()
+    engine.close()
+    if args.profile:
+        engine.dump_profile(args.profile)
+
+    pygame.quit()
+    sys.exit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+# typewriter_replay.py
+# Plays a recorded input trace (python typewriter_mvp.py --record FILE) back into the real main loop
+# under the SDL dummy drivers and reports, per keystroke, how long it took from the moment the event
+# was due until its glyph was on screen and until the carriage settled, plus the keys the typewriter
+# dropped because another key was still locked.
+#
+#   python typewriter_replay.py session.trace                  # at the speed it was typed
+#   python typewriter_replay.py session.trace --speed 3        # three times faster
+#   python typewriter_replay.py session.trace --stress --out r.json   # back to back, unthrottled
+
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import json
+import sys
+import time
+
+import typewriter_mvp as tm
+import pygame
+from typewriter_bench import metadata, summarize
+
+SETTLE_TIMEOUT_MS = 3000  # how long to let the typewriter settle after the last event
+
+
+class NoDialogs:
+    """Dialog host for replays: every file dialog is cancelled instead of waiting for input."""
+
+    def ask_save(self, title, filetypes, default_ext):
+        return None
+
+    def ask_open(self, title, filetypes):
+        return None
+
+    def close(self):
+        pass
+
+
+class ReplayEngine(tm.TypewriterEngine):
+    """A TypewriterEngine that follows every key event it handles through to the screen."""
+
+    def __init__(self, screen, seed=None):
+        super().__init__(screen, audio=bool(pygame.mixer.get_init()), seed=seed)
+        self._dialogs = NoDialogs()
+        self.keys = []  # one record per KEYDOWN of a non-modifier key
+        self.frame_ms = []
+        self._struck = False
+        self._awaiting_glyph = []
+        self._awaiting_settle = []
+        self._down = None  # record of the KEYDOWN whose KEYUP acts
+        self._last_present = None
+
+    def strike(self, raw_ch):
+        self._struck = True
+        return super().strike(raw_ch)
+
+    def strike_tab(self):
+        self._struck = True
+        return super().strike_tab()
+
+    def _state(self):
+        return (self.cursor_row, self.cursor_col, self.paper_scroll, self.key_locked, self.locked_key,
+                self.running, self.show_overlay, self.authentic_mode, self.show_overview,
+                self.overview.level, self.overview.scroll_y, self.find_query, self.find_pos, self.face)
+
+    def handle_event(self, ev):
+        now = time.perf_counter()
+        due = getattr(ev, 'due', now)
+        if ev.type == pygame.KEYDOWN and ev.key not in tm.MODIFIER_KEYS:
+            was_locked, before = self.key_locked, self._state()
+            self._struck = False
+            running = super().handle_event(ev)
+            rec = {'key': pygame.key.name(ev.key), 'due': due, 'queue_ms': (now - due) * 1000.0}
+            if self._struck or self._state() != before:
+                rec['outcome'] = 'accepted'
+                if self._struck:
+                    self._awaiting_glyph.append(rec)
+                if self.key_locked and self.pending_keydown is ev:
+                    self._down = rec  # its KEYUP moves the carriage
+                else:
+                    rec['settle_from'] = due
+                    self._awaiting_settle.append(rec)
+            else:
+                rec['outcome'] = 'dropped_locked' if was_locked else 'ignored'
+            self.keys.append(rec)
+            return running
+        if ev.type == pygame.KEYUP and ev.key not in tm.MODIFIER_KEYS:
+            acts = self.key_locked and ev.key == self.locked_key and self.pending_keydown is not None
+            running = super().handle_event(ev)
+            if acts and self._down is not None:
+                self._down['settle_from'] = due
+                self._awaiting_settle.append(self._down)
+                self._down = None
+            return running
+        return super().handle_event(ev)
+
+    def present(self):
+        super().present()
+        now = time.perf_counter()
+        if self._last_present is not None:
+            self.frame_ms.append((now - self._last_present) * 1000.0)
+        self._last_present = now
+        for rec in self._awaiting_glyph:
+            rec['glyph_ms'] = (now - rec['due']) * 1000.0
+        self._awaiting_glyph.clear()
+        if not self.animator.tweens:
+            for rec in self._awaiting_settle:
+                rec['settled_ms'] = (now - rec['settle_from']) * 1000.0
+            self._awaiting_settle.clear()
+
+    @property
+    def idle(self):
+        return not (self.animator.tweens or self.animator.timers or self.key_locked)
+
+
+class TraceFeed:
+    """Event source for tm.run(): hands out the trace's events once they are due, tagged with that time.
+
+    speed scales the recorded gaps; with per_frame set, timestamps are ignored and that many events
+    are handed out every frame. After the last event it waits for the typewriter to go idle, then quits.
+    """
+
+    def __init__(self, engine, records, speed=1.0, per_frame=None):
+        self.engine = engine
+        self.records = records
+        self.speed = speed
+        self.per_frame = per_frame
+        self.next = 0
+        self.start = None
+        self.ended = None  # when the last event had been handed out
+
+    def __call__(self):
+        pygame.event.pump()
+        now = time.perf_counter()
+        if self.start is None:
+            self.start = now
+        events = []
+        if self.per_frame:
+            while self.next < len(self.records) and len(events) < self.per_frame:
+                events.append(tm.record_event(self.records[self.next], due=now))
+                self.next += 1
+        else:
+            while self.next < len(self.records):
+                due = self.start + self.records[self.next]['t'] / 1000.0 / self.speed
+                if due > now:
+                    break
+                events.append(tm.record_event(self.records[self.next], due=due))
+                self.next += 1
+        if self.next == len(self.records) and not events:
+            if self.ended is None:
+                self.ended = now
+            if self.engine.idle or (now - self.ended) * 1000.0 > SETTLE_TIMEOUT_MS:
+                events.append(pygame.event.Event(pygame.QUIT))
+        return events
+
+
+class UnthrottledClock:
+    """A stand-in for pygame.time.Clock whose tick() never waits."""
+
+    def __init__(self):
+        self.clock = pygame.time.Clock()
+
+    def tick(self, framerate=0):
+        return self.clock.tick()
+
+    def get_fps(self):
+        return self.clock.get_fps()
+
+
+def replay(path, speed=1.0, per_frame=None, seed=None):
+    header, records = tm.read_trace(path)
+    pygame.init()
+    try:
+        pygame.mixer.init()
+    except pygame.error:
+        pass
+    screen = pygame.display.set_mode(tuple(header.get('size', (tm.W, tm.H))))
+    engine = ReplayEngine(screen, seed=seed)
+    t0 = time.perf_counter()
+    tm.run(engine, UnthrottledClock() if per_frame else None, TraceFeed(engine, records, speed, per_frame))
+    wall_s = time.perf_counter() - t0
+    engine.close()
+    return report(path, records, engine, wall_s, speed, per_frame)
+
+
+def report(path, records, engine, wall_s, speed, per_frame):
+    keys = engine.keys
+    outcomes = {}
+    for rec in keys:
+        outcomes[rec['outcome']] = outcomes.get(rec['outcome'], 0) + 1
+
+    def stats(name):
+        samples = [rec[name] for rec in keys if name in rec]
+        return summarize(samples) if samples else None
+
+    return {
+        "meta": dict(metadata(), trace=os.path.abspath(path), events=len(records),
+                     recorded_s=round(records[-1]['t'] / 1000.0, 3) if records else 0.0,
+                     speed=None if per_frame else speed, per_frame=per_frame, wall_s=round(wall_s, 3)),
+        "keys": {"keydowns": len(keys), **outcomes, "unsettled": sum(1 for rec in keys if 'settle_from' in rec and 'settled_ms' not in rec)},
+        "latency": {
+            "queue": stats('queue_ms'),  # due -> handled by the main loop
+            "keydown_to_glyph": stats('glyph_ms'),  # due -> the frame showing the struck glyph
+            "key_to_settled": stats('settled_ms'),  # due (KEYUP, or KEYDOWN for immediate keys) -> carriage at rest
+        },
+        "frames": dict(summarize(engine.frame_ms), long=sum(1 for ms in engine.frame_ms if ms > 1000 / 30))
+        if engine.frame_ms else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a typewriter input trace and report keystroke latency.")
+    parser.add_argument("trace", help="trace file written by typewriter_mvp.py --record")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor (default 1 = as recorded)")
+    parser.add_argument("--stress", action="store_true",
+                        help="ignore the timestamps: hand out --per-frame events per frame, unthrottled")
+    parser.add_argument("--per-frame", type=int, default=1, help="events per frame with --stress (default 1)")
+    parser.add_argument("--seed", type=int, default=1, help="ink seed (default 1)")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+
+    result = replay(args.trace, args.speed, args.per_frame if args.stress else None, args.seed)
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    pygame.quit()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
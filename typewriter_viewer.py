@@ -0,0 +1,120 @@
+# typewriter_viewer.py
+# Watches a typewriter session served with `python typewriter_mvp.py --serve [HOST:]PORT`. The page,
+# carriage and paper feed are drawn by the typewriter's own engine from the glyphs the session streams;
+# the viewer is read-only, keys and buttons do nothing.
+#
+#   python typewriter_viewer.py                      # a session on this machine (port 8765)
+#   python typewriter_viewer.py 192.168.1.20:8765    # one served on the local network (--serve 0.0.0.0:8765)
+
+import argparse
+import socket
+import sys
+import threading
+from collections import deque
+
+import typewriter_mvp as tm
+import pygame
+
+
+class StreamReader(threading.Thread):
+    """Reads the broadcast on its own thread and queues its messages for the main loop."""
+
+    def __init__(self, sock):
+        super().__init__(name="broadcast-reader", daemon=True)
+        self.sock = sock
+        self.messages = deque()  # (kind, payload)
+        self.closed = False
+        self.error = None
+
+    def run(self):
+        try:
+            with self.sock.makefile("rb") as f:
+                if f.read(len(tm.BROADCAST_MAGIC)) != tm.BROADCAST_MAGIC:
+                    raise ValueError("not a typewriter broadcast")
+                while True:
+                    header = f.read(tm.MSG_HEADER.size)
+                    if len(header) < tm.MSG_HEADER.size:
+                        break
+                    kind, length = tm.MSG_HEADER.unpack(header)
+                    payload = f.read(length)
+                    if len(payload) < length:
+                        break
+                    self.messages.append((kind, payload))
+        except (OSError, ValueError) as e:
+            self.error = e
+        finally:
+            self.closed = True
+
+
+class ViewerEngine(tm.TypewriterEngine):
+    """A TypewriterEngine showing what a broadcast says: the stream is its only input."""
+
+    def __init__(self, screen, reader):
+        super().__init__(screen, audio=False)
+        self.reader = reader
+        self.state = tm.SessionState(self.cols_per_line, self.doc)
+        self.saved_pages = self.state.saved_pages  # the pages saved while watching
+        self.ended = False
+
+    def handle_event(self, ev):
+        if ev.type == pygame.QUIT:
+            self.running = False
+        return self.running
+
+    def update(self, now=None):
+        view = None
+        while self.reader.messages:
+            kind, payload = self.reader.messages.popleft()
+            if kind == tm.MSG_SNAPSHOT:
+                view, table = tm.decode_snapshot(payload)
+                self.doc.clear_glyphs()
+                self.doc.attach_table(table, *tm.row_index(table.rows))
+                self.state.face = 0
+            elif kind == tm.MSG_FRAME:
+                view = tm.VIEW_STATE.unpack_from(payload)
+                self.state.apply_records(memoryview(payload)[tm.VIEW_STATE.size:])
+        if view is not None:
+            # only the last position of the frames that arrived matters
+            self.cursor_row, self.cursor_col, self.paper_scroll, self.view_offset_px, self.paper_scroll_offset_px = view
+        rows, _ = self.doc.take_changes()
+        if rows is None:
+            self._reset_paper()
+        elif rows:
+            for row in rows:
+                self.paper.rebake_row(row)
+            self.dirty_rects.append(tm.PAPER_BAND)
+        if self.reader.closed and not self.reader.messages and not self.ended:
+            self.ended = True
+            print("Broadcast ended" + (f": {self.reader.error}" if self.reader.error else ""))
+            if not self.headless:
+                pygame.display.set_caption("Typewriter viewer — broadcast ended")
+        super().update(now)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Watch a typewriter session served with --serve.")
+    parser.add_argument("address", nargs="?", default=f"{tm.BROADCAST_HOST}:{tm.BROADCAST_PORT}",
+                        help=f"[HOST:]PORT of the session (default {tm.BROADCAST_HOST}:{tm.BROADCAST_PORT})")
+    args = parser.parse_args(argv)
+    host, port = tm.parse_address(args.address)
+    try:
+        sock = socket.create_connection((host, port))
+    except OSError as e:
+        print(f"Could not connect to {host}:{port}:", e)
+        return 1
+    reader = StreamReader(sock)
+    reader.start()
+
+    pygame.init()
+    screen = pygame.display.set_mode((tm.W, tm.H))
+    pygame.display.set_caption(f"Typewriter viewer — {host}:{port}")
+    engine = ViewerEngine(screen, reader)
+    tm.run(engine)
+    sock.close()
+    engine.close()
+    pygame.quit()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())